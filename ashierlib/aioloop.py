@@ -0,0 +1,168 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module implements the event loop interface of terminal.IOLoop on
+top of an asyncio event loop.  It requires the asyncio module (or its
+trollius backport).
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import select
+
+import terminal
+
+try:
+  import asyncio
+except ImportError:
+  try:
+    import trollius as asyncio
+  except ImportError:
+    asyncio = None
+
+
+class AsyncioLoop(terminal.IOLoop):
+  """Dispatch asynchronous I/O events through an asyncio event loop.
+
+  An AsyncioLoop object provides the same interface, write queues, and
+  back-pressure as a terminal.IOLoop object, but it monitors file
+  descriptors with add_reader and add_writer and schedules callbacks
+  with call_soon, so that Ashier sessions can share an event loop with
+  other asyncio code (including timers and tasks).  Since asyncio does
+  not report hangups separately, event handlers receive POLLIN for
+  them and detect the hangup when the read reaches the end of file.
+
+  On Python 2, the loop uses the trollius backport of asyncio.
+  """
+
+  def __init__(self, high_water=1 << 20, loop=None):
+    """Create an AsyncioLoop object.
+
+    Args:
+      high_water: number of queued bytes for an output file descriptor
+        above which the loop stops reading from its throttled inputs.
+      loop: the asyncio event loop to use, or None for the default.
+    """
+
+    terminal.IOLoop.__init__(self, high_water)
+    if loop is None:
+      loop = asyncio.get_event_loop()
+    self.loop = loop
+    self._polling = False
+
+  def CallSoon(self, callback):
+    """Run a function from the asyncio event loop.
+
+    Args:
+      callback: function to call (with no arguments).
+    """
+
+    self.loop.call_soon(self._Polled(callback))
+
+  def CallLater(self, delay, callback):
+    """Run a function from the asyncio event loop after a delay.
+
+    Args:
+      delay: the delay (in seconds).
+      callback: function to call (with no arguments).
+
+    Returns:
+      An object whose Cancel method cancels the call.
+    """
+
+    return _Handle(self.loop.call_later(delay, self._Polled(callback)))
+
+  def Run(self):
+    """Run the asyncio event loop until an event handler calls Stop."""
+
+    self.loop.run_forever()
+
+  def Stop(self):
+    """Make Run return after the current round of events."""
+
+    self.loop.stop()
+
+  def Poll(self, timeout=-1):
+    """Run the asyncio event loop until it dispatches one event.
+
+    Args:
+      timeout: maximum time to wait in seconds, or -1 to wait until
+        at least one event arrives.
+    """
+
+    # Every event handler and callback stops the asyncio event loop
+    # while Poll runs it, which makes run_forever return once the
+    # current round of events is done.
+    timer = None
+    if timeout >= 0:
+      timer = self.loop.call_later(timeout, self.loop.stop)
+    self._polling = True
+    try:
+      self.loop.run_forever()
+    finally:
+      self._polling = False
+      if timer is not None:
+        timer.cancel()
+
+  def _Polled(self, callback):
+    """Wrap a callback to end the current Poll call after it runs."""
+
+    def PolledCallback(*args):
+      try:
+        callback(*args)
+      finally:
+        if self._polling:
+          self.loop.stop()
+    return PolledCallback
+
+  def _Watch(self, fd, old_mask, mask):
+    """Change the asyncio registration of a file descriptor.
+
+    Args:
+      fd: file descriptor to monitor.
+      old_mask: the events currently monitored (0 for none).
+      mask: the events to monitor from now on (0 for none).
+    """
+
+    removed = old_mask & ~mask
+    added = mask & ~old_mask
+    if removed & select.POLLIN:
+      self.loop.remove_reader(fd)
+    if removed & select.POLLOUT:
+      self.loop.remove_writer(fd)
+    dispatch = self._Polled(self._Dispatch)
+    if added & select.POLLIN:
+      self.loop.add_reader(fd, dispatch, fd, select.POLLIN)
+    if added & select.POLLOUT:
+      self.loop.add_writer(fd, dispatch, fd, select.POLLOUT)
+
+
+class _Handle(object):
+  """Adapt an asyncio timer handle to the timers.Timer interface."""
+
+  def __init__(self, handle):
+    self._handle = handle
+
+  def Cancel(self):
+    self._handle.cancel()
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module implements a filter that removes terminal escape sequences.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import re
+
+# Parser states, after the state machine of DEC-compatible terminals.
+# The ground state covers ordinary text; the string state covers the
+# payload of OSC, DCS, SOS, PM, and APC sequences.
+_GROUND, _ESCAPE, _INTERMEDIATE, _CSI, _STRING = range(5)
+
+# Special transition that passes a C0 control character (e.g., CR or
+# LF) through without changing state, as terminals execute them even
+# in the middle of an escape sequence.
+_EXECUTE = -1
+
+
+def _Table(default, transitions):
+  """Build a transition table for a parser state.
+
+  Args:
+    default: the transition for bytes not listed in transitions.
+    transitions: a list of ((first, last), transition) pairs, which
+      specify transitions for inclusive ranges of byte values.  Later
+      pairs override earlier ones.
+
+  Returns:
+    A list that maps each byte value to a transition.
+  """
+
+  table = [default]*256
+  for (first, last), transition in transitions:
+    for byte in xrange(first, last+1):
+      table[byte] = transition
+  return table
+
+
+# Transitions shared by all escape sequence states: execute C0 control
+# characters, restart at ESC, abort at CAN and SUB, and end the
+# sequence at a non-ASCII byte so that a malformed sequence cannot
+# swallow text.
+_COMMON = [((0x00, 0x1f), _EXECUTE),
+           ((0x1b, 0x1b), _ESCAPE),
+           ((0x18, 0x18), _GROUND),
+           ((0x1a, 0x1a), _GROUND),
+           ((0x80, 0xff), _GROUND)]
+
+_TABLES = {
+    _ESCAPE: _Table(_GROUND, _COMMON+[
+        ((0x20, 0x2f), _INTERMEDIATE),
+        ((0x7f, 0x7f), _ESCAPE),
+        ((ord('['), ord('[')), _CSI),
+        ((ord(']'), ord(']')), _STRING),
+        ((ord('P'), ord('P')), _STRING),
+        ((ord('X'), ord('X')), _STRING),
+        ((ord('^'), ord('^')), _STRING),
+        ((ord('_'), ord('_')), _STRING)]),
+    _INTERMEDIATE: _Table(_GROUND, _COMMON+[
+        ((0x20, 0x2f), _INTERMEDIATE),
+        ((0x7f, 0x7f), _INTERMEDIATE)]),
+    _CSI: _Table(_GROUND, _COMMON+[
+        ((0x20, 0x3f), _CSI),
+        ((0x7f, 0x7f), _CSI)]),
+}
+
+# A string sequence ends at BEL or at ST (ESC \), and the ESCAPE state
+# takes care of ST because '\' is an escape sequence final byte.
+_STRING_END = re.compile('[\x07\x18\x1a\x1b]')
+
+# A complete CSI sequence, which the filter skips in one step instead
+# of running the transition table on every byte.  Colored output
+# consists mostly of these.
+_CSI_SEQUENCE = re.compile('\x1b\\[[\x20-\x3f]*[\x40-\x7e]')
+
+
+class EscapeFilter(object):
+  """Streaming filter that removes terminal escape sequences.
+
+  An EscapeFilter object removes CSI sequences (such as colors and
+  cursor movement), OSC sequences (such as window titles), other
+  string sequences, and two-character escape sequences from terminal
+  output.  It keeps its parser state between calls, so an escape
+  sequence may be split across any number of chunks of output.
+  """
+
+  def __init__(self):
+    self._state = _GROUND
+
+  def Filter(self, data):
+    """Remove escape sequences from the next chunk of output.
+
+    Args:
+      data: a string that contains the next chunk of terminal output.
+
+    Returns:
+      The output with all escape sequences (and partial sequences at
+      either end of the chunk) removed.
+    """
+
+    state = self._state
+    if state == _GROUND and '\x1b' not in data:
+      return data
+
+    output = []
+    position = 0
+    size = len(data)
+
+    # Remove complete CSI sequences up to the last ESC in one pass.
+    # Since CSI sequences do not contain ESC, the result is final if
+    # no other escape sequences remain, and the rest of the output
+    # goes through the state machine.
+    if state == _GROUND:
+      last = data.rfind('\x1b')
+      head = _CSI_SEQUENCE.sub('', data[:last])
+      if '\x1b' not in head:
+        output.append(head)
+        position = last
+
+    while position < size:
+      if state == _GROUND:
+        escape = data.find('\x1b', position)
+        if escape < 0:
+          output.append(data[position:])
+          break
+        output.append(data[position:escape])
+        sequence = _CSI_SEQUENCE.match(data, escape)
+        if sequence:
+          position = sequence.end()
+        else:
+          state = _ESCAPE
+          position = escape+1
+
+      elif state == _STRING:
+        end = _STRING_END.search(data, position)
+        if not end:
+          break
+        state = _ESCAPE if end.group() == '\x1b' else _GROUND
+        position = end.end()
+
+      else:
+        transition = _TABLES[state][ord(data[position])]
+        if transition == _EXECUTE:
+          output.append(data[position])
+        else:
+          state = transition
+        position += 1
+
+    self._state = state
+    return ''.join(output)
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module implements the on-disk cache of compiled configurations.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import cPickle
+import hashlib
+import os
+import tempfile
+
+import directive
+import matcher
+import reactive
+
+# Increment when the pickled representation of the configuration
+# objects changes incompatibly.
+_FORMAT = 3
+
+
+def DefaultDirectory():
+  """Return the default cache directory.
+
+  Returns:
+    The ashier subdirectory of $XDG_CACHE_HOME (or of ~/.cache if the
+    environment variable is not set).
+  """
+
+  base = os.environ.get('XDG_CACHE_HOME')
+  if not base:
+    base = os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(base, 'ashier')
+
+
+def ComputeKey(files):
+  """Compute the cache key for a list of configuration files.
+
+  The key covers the path, modification time, and content of every
+  file, as well as the code that defines the cached objects.
+
+  Args:
+    files: a list of configuration filenames.
+
+  Returns:
+    A hexadecimal string, or None if some file cannot be read.
+  """
+
+  digest = hashlib.sha1(str(_FORMAT))
+  for module in (directive, matcher, reactive):
+    source = os.path.splitext(module.__file__)[0]+'.py'
+    digest.update('%s\0%r\0' % (source, os.path.getmtime(source)))
+  try:
+    for filename in files:
+      with open(filename) as f:
+        content = f.read()
+      digest.update('%s\0%r\0%s\0' % (
+          os.path.abspath(filename), os.path.getmtime(filename),
+          hashlib.sha1(content).hexdigest()))
+  except (IOError, OSError):
+    return None
+  return digest.hexdigest()
+
+
+def Load(cache_dir, key):
+  """Load a cached object.
+
+  Args:
+    cache_dir: the cache directory.
+    key: the cache key from ComputeKey.
+
+  Returns:
+    The cached object, or None if there is no usable cache entry.
+  """
+
+  try:
+    with open(os.path.join(cache_dir, key), 'rb') as f:
+      return cPickle.load(f)
+  except Exception:
+    # Unpickling a damaged file can fail in many different ways, all
+    # of which mean that the entry is unusable.
+    return None
+
+
+def Store(cache_dir, key, obj):
+  """Store an object in the cache, ignoring failures.
+
+  Args:
+    cache_dir: the cache directory, which is created if needed.
+    key: the cache key from ComputeKey.
+    obj: the object to store.
+  """
+
+  try:
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir, 0700)
+    # Write to a temporary file and rename it so that concurrent
+    # launches never see a partially written entry.
+    fd, temp_name = tempfile.mkstemp(dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+      cPickle.dump(obj, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(temp_name, os.path.join(cache_dir, key))
+  except (IOError, OSError, cPickle.PicklingError):
+    pass
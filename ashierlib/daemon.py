@@ -0,0 +1,317 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module implements a daemon that starts sessions on request, and
+the client that requests them.  The daemon loads the configuration
+once and keeps a few worker processes forked in advance, each waiting
+for a client on a Unix domain socket.  A client passes its standard
+file descriptors to a worker along with the controller command, the
+working directory, and the environment, and the worker runs the
+session on them.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import atexit
+import errno
+import fcntl
+import gc
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import termios
+import traceback
+
+import _multiprocessing
+
+import terminal
+
+# Messages on the connection are JSON objects prefixed with their size.
+# After the request, the client sends a byte whenever the window size
+# of its terminal changes, and the worker replies with the exit status
+# when the session ends.
+_SIZE = struct.Struct('!I')
+
+
+def _Send(sock, message):
+  data = json.dumps(message)
+  sock.sendall(_SIZE.pack(len(data))+data)
+
+
+def _ReceiveExactly(sock, size):
+  chunks = []
+  while size:
+    try:
+      chunk = sock.recv(size)
+    except socket.error as err:
+      if err.errno == errno.EINTR:
+        continue
+      raise
+    if not chunk:
+      return None
+    chunks.append(chunk)
+    size -= len(chunk)
+  return ''.join(chunks)
+
+
+def _ToText(data):
+  """Turn a byte string into text that JSON preserves exactly."""
+
+  return data.decode('latin-1')
+
+
+def _FromText(text):
+  return text.encode('latin-1')
+
+
+def _Receive(sock):
+  """Receive a message, or return None at the end of file."""
+
+  header = _ReceiveExactly(sock, _SIZE.size)
+  if header is None:
+    return None
+  data = _ReceiveExactly(sock, _SIZE.unpack(header)[0])
+  if data is None:
+    return None
+  return json.loads(data)
+
+
+def Serve(path, run, spares=2):
+  """Serve session requests until SIGTERM or SIGINT.
+
+  Args:
+    path: the path of the Unix domain socket to listen on, which is
+      replaced if it exists.
+    run: function that runs a session in a worker process and returns
+      its exit status.  It takes the controller command (a list of
+      arguments) and the file descriptor of the client connection.
+      Standard input, output, and error, the working directory, and
+      the environment of the worker are those of the client by then.
+    spares: the number of idle workers to keep.
+  """
+
+  # Signals also write a byte to the wake pipe, so that a signal that
+  # arrives just before the loop blocks still wakes it up.
+  wake_read, wake_write = os.pipe()
+  for fd in (wake_read, wake_write):
+    fcntl.fcntl(fd, fcntl.F_SETFL,
+                fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+  stopping = []
+  daemon_pid = os.getpid()
+  def OnStop(unused_signum, unused_frame):
+    # A worker that gets the signal before it resets its handlers must
+    # not ignore it, or it would wait for a client forever.
+    if os.getpid() != daemon_pid:
+      os._exit(1)
+    stopping.append(True)
+  # Install the handlers before the socket appears, so that stopping
+  # the daemon as soon as it is reachable still removes the socket.
+  signal.signal(signal.SIGTERM, OnStop)
+  signal.signal(signal.SIGINT, OnStop)
+  # The handler makes SIGCHLD wake up the loop as well.
+  signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+  signal.set_wakeup_fd(wake_write)
+
+  if os.path.exists(path):
+    os.unlink(path)
+  listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  # Workers run any command that a client asks for, so only the user
+  # who runs the daemon may connect to the socket.
+  umask = os.umask(0177)
+  try:
+    listener.bind(path)
+  finally:
+    os.umask(umask)
+  listener.listen(16)
+  notify_read, notify_write = os.pipe()
+
+  # Collect garbage once so that workers do not each copy the pages
+  # that the collector would touch.  Python 3.7 and later can also
+  # exclude the surviving objects from later collections.
+  gc.collect()
+  if hasattr(gc, 'freeze'):
+    gc.freeze()
+
+  idle = set()
+  try:
+    while not stopping:
+      while len(idle) < spares:
+        pid = os.fork()
+        if pid == 0:
+          signal.set_wakeup_fd(-1)
+          for fd in (notify_read, wake_read, wake_write):
+            os.close(fd)
+          _Worker(listener, notify_write, run)
+        idle.add(pid)
+
+      try:
+        ready, unused_write, unused_error = select.select(
+            [notify_read, wake_read], [], [])
+      except select.error as err:
+        if err.args[0] != errno.EINTR:
+          raise
+        ready = []
+      if wake_read in ready:
+        _Drain(wake_read)
+      data = ''
+      if notify_read in ready:
+        data = os.read(notify_read, 4*_SIZE.size)
+      for offset in xrange(0, len(data), _SIZE.size):
+        idle.discard(_SIZE.unpack(data[offset:offset+_SIZE.size])[0])
+
+      while True:
+        try:
+          pid, unused_status = os.waitpid(-1, os.WNOHANG)
+        except OSError:
+          break
+        if not pid:
+          break
+        idle.discard(pid)
+  finally:
+    signal.set_wakeup_fd(-1)
+    for fd in (notify_read, notify_write, wake_read, wake_write):
+      os.close(fd)
+    # Idle workers have nothing to clean up.  SIGTERM would not do,
+    # because a worker that gets it before it resets its handlers may
+    # lose it (signal.signal discards a signal that is pending).
+    for pid in idle:
+      try:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+      except OSError:
+        pass
+    listener.close()
+    os.unlink(path)
+
+
+def _Drain(fd):
+  """Read and discard everything in a non-blocking pipe."""
+
+  while True:
+    try:
+      if not os.read(fd, 512):
+        return
+    except OSError as err:
+      if err.errno == errno.EAGAIN:
+        return
+      if err.errno != errno.EINTR:
+        raise
+
+
+def _Worker(listener, notify_fd, run):
+  """Wait for a client, run its session, and exit."""
+
+  for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+    signal.signal(signum, signal.SIG_DFL)
+  status = 1
+  try:
+    conn, unused_address = listener.accept()
+    os.write(notify_fd, _SIZE.pack(os.getpid()))
+    os.close(notify_fd)
+    listener.close()
+
+    fds = [_multiprocessing.recvfd(conn.fileno()) for _ in xrange(3)]
+    request = _Receive(conn)
+    for target, fd in enumerate(fds):
+      os.dup2(fd, target)
+      os.close(fd)
+    os.chdir(_FromText(request['cwd']))
+    os.environ.clear()
+    for name, value in request['env'].iteritems():
+      os.environ[_FromText(name)] = _FromText(value)
+
+    try:
+      status = run(map(_FromText, request['args']), conn.fileno())
+    except SystemExit as err:
+      status = err.code
+      if status is None:
+        status = 0
+      elif not isinstance(status, int):
+        # Standard error may still be in non-blocking mode.
+        terminal.WriteAll(2, '%s\n' % status)
+        status = 1
+    finally:
+      # The worker exits with os._exit, so run the exit handlers (which
+      # restore the mode of the client terminal) before the client
+      # takes over again.
+      atexit._run_exitfuncs()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    _Send(conn, {'status': status})
+  except Exception:
+    traceback.print_exc()
+  finally:
+    os._exit(status)
+
+
+def Connect(path, args):
+  """Run a session in a daemon.
+
+  Args:
+    path: the path of the Unix domain socket that the daemon listens on.
+    args: the controller command (a list of arguments).
+
+  Returns:
+    The exit status of the session.
+
+  Raises:
+    socket.error: the daemon is not reachable.
+  """
+
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  sock.connect(path)
+  for fd in (0, 1, 2):
+    _multiprocessing.sendfd(sock.fileno(), fd)
+  # Arguments, file names, and the environment are byte strings that
+  # need not be valid UTF-8 (or any other encoding).
+  env = dict((_ToText(name), _ToText(value))
+             for name, value in os.environ.iteritems())
+  _Send(sock, {'args': map(_ToText, args), 'cwd': _ToText(os.getcwd()),
+               'env': env})
+
+  # The worker sets the terminal to raw mode and the standard file
+  # descriptors to non-blocking mode, but it cannot restore them if it
+  # fails, so the client does that.
+  attributes = None
+  if os.isatty(0):
+    attributes = termios.tcgetattr(0)
+    signal.signal(signal.SIGWINCH, lambda signum, frame: sock.send('w'))
+  flags = [fcntl.fcntl(fd, fcntl.F_GETFL) for fd in (0, 1, 2)]
+  try:
+    reply = _Receive(sock)
+  finally:
+    if attributes is not None:
+      termios.tcsetattr(0, termios.TCSAFLUSH, attributes)
+    for fd, fd_flags in enumerate(flags):
+      fcntl.fcntl(fd, fcntl.F_SETFL, fd_flags)
+  if reply is None:
+    sys.stderr.write('ashier: the daemon closed the connection\n')
+    return 1
+  return reply['status']
@@ -27,19 +27,22 @@ This module defines configuration directives.
 
 __author__ = 'cklin@google.com (Chuan-kai Lin)'
 
-import os
+import json
 import re
 import utils
 
+# Names of the settings that a configuration file can enable.
+SETTINGS = ('strip-ansi',)
+
 
 def CreateLines(filename):
-  """Create Line objects from a text file.
+  """Create Line objects from a UTF-8 text file.
 
   Args:
     filename: name of the file to read from.
 
   Returns:
-    A list of Line objects read from the file.
+    A list of Line objects (with unicode content) read from the file.
   """
 
   lineno = 1
@@ -47,7 +50,14 @@ def CreateLines(filename):
   try:
     with open(filename) as f:
       for line in f:
-        lines.append(Line(filename, lineno, line))
+        # Decode the configuration so that templates and terminal
+        # output (which Session decodes) are both unicode strings, and
+        # markers line up with characters instead of bytes.
+        lines.append(Line(filename, lineno, line.decode('utf-8', 'replace')))
+        try:
+          line.decode('utf-8')
+        except UnicodeDecodeError:
+          lines[-1].ReportError('invalid UTF-8 text')
         lineno += 1
     return lines
   except IOError as err:
@@ -59,15 +69,22 @@ class Line(object):
   """Line in an Ashier configuration file.
 
   Attributes:
+    filename: name of the configuration file.
     lineno: line number in the configuration file.
     content: the content of the line as a string.
   """
 
   def __init__(self, filename, lineno, content):
+    self.filename = filename
     self.lineno = lineno
     self.content = content
     self._header = '%s:%d  ' % (filename, lineno)
 
+  def Location(self):
+    """Return the file:line identifier of the line."""
+
+    return '%s:%d' % (self.filename, self.lineno)
+
   def GetIndent(self):
     """Compute the indentation level of the line.
 
@@ -121,8 +138,8 @@ def ParseDirective(line):
     line: a Line object to be parsed.
 
   Returns:
-    A directive object (Template, Marker, or Send), or None if the
-    line is blank, a comment, or malformed.
+    A directive object (Template, Marker, Send, Timer, or Setting), or
+    None if the line is blank, a comment, or malformed.
   """
 
   source = line.StrippedContent()
@@ -163,6 +180,23 @@ def ParseDirective(line):
       else:
         line.ReportError('malformed action directive')
 
+  elif source.startswith('@'):
+    syntax = re.compile(r' *(idle|deadline) +(\d+) *$')
+    matches = syntax.match(source[1:])
+    if matches:
+      kind = matches.group(1)
+      delay = int(matches.group(2))/1000.0
+      return Timer(line, kind, delay)
+    else:
+      line.ReportError('malformed timer directive')
+
+  elif source.startswith('%'):
+    name = source[1:].strip()
+    if name in SETTINGS:
+      return Setting(line, name)
+    else:
+      line.ReportError('unknown setting: %s' % name)
+
   else:
     line.ReportError('unrecognized directive syntax')
 
@@ -184,7 +218,15 @@ class Template(object):
   def __init__(self, line, sample):
     self.line = line
     self.sample = sample
-    self.ReportError = line.ReportError
+
+  def ReportError(self, mesg):
+    """Report an error that stems from this directive.
+
+    Args:
+      mesg: the error message to report.
+    """
+
+    self.line.ReportError(mesg)
 
   def InferSkip(self, start, finish):
     """Compute a regex that skips a fixed string.
@@ -247,7 +289,15 @@ class Marker(object):
     self.finish = finish
     self.name = name
     self._regex = utils.RemoveRegexBindingGroups(regex)
-    self.ReportError = line.ReportError
+
+  def ReportError(self, mesg):
+    """Report an error that stems from this directive.
+
+    Args:
+      mesg: the error message to report.
+    """
+
+    self.line.ReportError(mesg)
 
   def InferRegex(self, template):
     """Infer a regular expression for a marker substring.
@@ -291,8 +341,9 @@ class Marker(object):
           # whitespace matching (especially since there is no
           # distinction betwen tabs and spaces in the template sample
           # due to tab expansion in the ParseDirective procedure).
+          # Only ASCII whitespace counts, as in InferSkip.
           self._regex = '[^%s]+' % (
-              r'\s' if delimiter.isspace() else delimiter,)
+              r'\s' if re.match(r'\s', delimiter) else delimiter,)
         else:
           self.ReportError('delimiter appears in the marker')
 
@@ -330,11 +381,24 @@ class Send(object):
     self.line = line
     self._channel = channel
     self._message = message
-    self.ReportError = line.ReportError
+
+    # Split the message once so that sending it only has to fill in
+    # the variables: even-indexed parts are literal text, odd-indexed
+    # parts are variable names (without the leading '$').
+    self._parts = re.split(r'\$(\w+)', message)
 
     if channel not in ('controller', 'terminal'):
       self.ReportError('invalid channel name: %s' % (channel,))
 
+  def ReportError(self, mesg):
+    """Report an error that stems from this directive.
+
+    Args:
+      mesg: the error message to report.
+    """
+
+    self.line.ReportError(mesg)
+
   def References(self):
     """List variable references in the message.
 
@@ -343,12 +407,7 @@ class Send(object):
       referenced in the message to be sent.
     """
 
-    names = set()
-    parts = re.split(r'(\$\w+)', self._message)
-    for segment in parts:
-      if segment.startswith('$'):
-        names.add(segment[1:])
-    return names
+    return set(self._parts[1::2])
 
   def ExpandVariables(self, bindings):
     """Expand variables in the message.
@@ -361,25 +420,104 @@ class Send(object):
       by the strings they map to in the dictionary argument.
     """
 
-    parts = re.split(r'(\$\w+)', self._message)
-    for i in range(len(parts)):
-      if parts[i].startswith('$'):
-        name = parts[i][1:]
-        parts[i] = bindings[name]
+    if len(self._parts) == 1:
+      return self._message
+    parts = list(self._parts)
+    for i in xrange(1, len(parts), 2):
+      parts[i] = bindings[parts[i]]
     return ''.join(parts)
 
-  def Send(self, channels, bindings):
+  def Send(self, channels, bindings, reaction=None):
     """Send message as specified by Action directive.
 
     Args:
-      channels: dictionary of channels to file descriptors.
+      channels: dictionary that maps channel names to functions that
+        write a string to the channel (or to Frames objects).
       bindings: dictionary of bound names to strings.
+      reaction: the file:line identifier of the configuration group
+        that sends the message, for Frames channels.
     """
 
+    write = channels[self._channel]
     try:
-      os.write(channels[self._channel],
-               self.ExpandVariables(bindings)+'\n')
+      if isinstance(write, Frames):
+        write.write(json.dumps({'reaction': reaction,
+                                'message': self.ExpandVariables(bindings),
+                                'bindings': bindings},
+                               sort_keys=True)+'\n')
+      else:
+        write(self.ExpandVariables(bindings)+'\n')
     except OSError:
       # Silence all exceptions, which are most likely due to a
       # controller process that decides to exit early.
       pass
+
+
+class Frames(object):
+  """A channel that takes messages as JSON-lines frames.
+
+  Send writes a message to a Frames channel as a JSON object on a line
+  of its own, with the identifier of the configuration group that sends
+  the message ("reaction"), the message without a trailing line feed
+  ("message"), and all variable bindings ("bindings").  Unlike plain
+  text, frames keep messages apart even if the bound strings contain
+  line feeds.
+
+  Attributes:
+    write: function that writes a string to the channel.
+  """
+
+  def __init__(self, write):
+    self.write = write
+
+
+class Timer(object):
+  """The Timer directive.
+
+  The Timer class represents timer directives in Ashier configuration
+  files.  A timer directive takes the place of the templates in a
+  group, and the actions of the group run when the timer fires
+  instead of when terminal output matches.  While the group is active
+  (see Reactive.IsActive), an "idle" timer fires once the terminal has
+  produced no output for the specified number of milliseconds (and
+  then not again until more output arrives), and a "deadline" timer
+  fires once no reaction has matched for the specified number of
+  milliseconds.
+
+  Attributes:
+    line: the Line object for the timer directive
+    kind: "idle" or "deadline"
+    delay: the timer delay in seconds
+  """
+
+  def __init__(self, line, kind, delay):
+    self.line = line
+    self.kind = kind
+    self.delay = delay
+
+  def ReportError(self, mesg):
+    """Report an error that stems from this directive.
+
+    Args:
+      mesg: the error message to report.
+    """
+
+    self.line.ReportError(mesg)
+
+
+class Setting(object):
+  """The setting directive.
+
+  The Setting class represents setting directives in Ashier
+  configuration files.  Each setting directive enables an optional
+  feature (e.g., "strip-ansi") for the entire configuration.  Setting
+  directives do not belong to any group.
+
+  Attributes:
+    line: the Line object for the setting directive
+    name: the name of the setting
+  """
+
+  def __init__(self, line, name):
+    self.line = line
+    self.name = name
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module implements latency histograms.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+class Histogram(object):
+  """Histogram of non-negative integers with bounded relative error.
+
+  A Histogram object counts values in log-linear buckets (after the
+  HdrHistogram design): values below 2**bits have buckets of their
+  own, and each power-of-two range above that is divided into
+  2**(bits-1) equal buckets.  Recording a value takes constant time,
+  the histogram needs only a few thousand buckets to cover any
+  realistic range, and the percentiles it reports are within a
+  relative error of 2**(1-bits) of the recorded values.
+
+  Attributes:
+    count: number of recorded values.
+    maximum: the largest recorded value (0 if there is none).
+  """
+
+  def __init__(self, bits=7):
+    self._bits = bits
+    self._size = 1 << bits
+    self._half = self._size >> 1
+    self._counts = []
+    self.count = 0
+    self.maximum = 0
+
+  def _Index(self, value):
+    if value < self._size:
+      return value
+    shift = value.bit_length()-self._bits
+    return self._size+(shift-1)*self._half+(value >> shift)-self._half
+
+  def _HighestEquivalent(self, index):
+    """Return the largest value that falls into a bucket."""
+
+    if index < self._size:
+      return index
+    shift, offset = divmod(index-self._size, self._half)
+    return ((offset+self._half+1) << (shift+1))-1
+
+  def Record(self, value):
+    """Count a value.
+
+    Args:
+      value: an integer, which counts as 0 if it is negative (as a
+        latency measured across a backward step of the wall clock
+        would be).
+    """
+
+    if value < 0:
+      value = 0
+    index = self._Index(value)
+    if index >= len(self._counts):
+      self._counts.extend([0]*(index+1-len(self._counts)))
+    self._counts[index] += 1
+    self.count += 1
+    if value > self.maximum:
+      self.maximum = value
+
+  def Percentile(self, percent):
+    """Estimate a percentile of the recorded values.
+
+    Args:
+      percent: the percentile to estimate, between 0 and 100.
+
+    Returns:
+      The largest value in the bucket that holds the percentile (but
+      no larger than the maximum), or 0 if there are no values.
+    """
+
+    # The rank of the percentile is ceil(count*percent/100), computed
+    # without rounding errors for the usual integer percentiles.
+    rank = max(1, -(-self.count*percent//100))
+    seen = 0
+    for index, count in enumerate(self._counts):
+      seen += count
+      if seen >= rank:
+        return min(self._HighestEquivalent(index), self.maximum)
+    return 0
@@ -31,25 +31,64 @@ __author__ = 'cklin@google.com (Chuan-kai Lin)'
 class Buffer(object):
   """A FIFO buffer that holds lines of text.
 
+  The buffer stores lines in a Python list with an integer offset to
+  the earliest buffered line, so that raising the baseline takes
+  constant amortized time instead of shifting every retained line.
+
+  A buffer may also limit the number of completed lines and the total
+  size of completed lines it retains.  When new data exceeds either
+  limit, the buffer evicts its earliest lines by raising its baseline,
+  exactly as if UpdateBaseline had been called.  The partial line is
+  never evicted, but a partial line that grows longer than the size
+  limit (e.g., a progress bar that redraws itself with '\r') keeps
+  only its last characters up to the limit.
+
   Attributes:
     baseline: the index of the earliest buffered line.
+    partial_memo: a dictionary in which pattern matchers can memoize
+      results about the partial line.  It is reset whenever the
+      partial line becomes a completed line.
+    evicted: the number of lines evicted to enforce retention limits.
   """
 
   # Invariants:
-  #   len(self._lines) > 0
+  #   len(self._lines) > self._head
   #   self.baseline is the index of the earliest buffered line
   #   self.GetBound() is the index of the latest buffered line +1
   #   self.GetBound() >= self.baseline
-  #   self._lines[:-1] stores completed lines
+  #   self._lines[self._head+1:-1] stores completed lines
   #   self._lines[-1] stores the (latest) partial line
-  #   self._lines[index+1] is the line numbered (self.baseline+index)
-  #   self._lines[0] is inaccessible
+  #   self._lines[self._head+index+1] is the line numbered
+  #     (self.baseline+index)
+  #   self._lines[:self._head+1] is inaccessible
   #   self.GetLine(lineno) requires self.baseline <= lineno
   #   self.GetLine(lineno) requires self.GetBound() > lineno
+  #   self._size is the total length of accessible completed lines
+
+  # Inaccessible lines are dropped from the front of self._lines only
+  # when there are at least this many of them and they make up at
+  # least half of the list, which bounds the amortized cost of
+  # dropping a line to a constant.
+  _COMPACT_THRESHOLD = 1024
+
+  def __init__(self, max_lines=None, max_bytes=None):
+    """Create an empty buffer.
+
+    Args:
+      max_lines: maximum number of completed lines to retain, or None
+        for no limit.
+      max_bytes: maximum total length of completed lines to retain,
+        or None for no limit.
+    """
 
-  def __init__(self):
     self.baseline = 1
+    self.partial_memo = {}
+    self.evicted = 0
     self._lines = ['']*2
+    self._head = 0
+    self._size = 0
+    self._max_lines = max_lines
+    self._max_bytes = max_bytes
 
   def GetBound(self):
     """Get the non-inclusive line number upper bound.
@@ -59,28 +98,95 @@ class Buffer(object):
       stored in the buffer.
     """
 
-    return self.baseline+len(self._lines)-1
+    return self.baseline+len(self._lines)-self._head-1
 
   def AppendRawData(self, content):
     """Add raw (not-yet-split) text data to the buffer.
 
-    Break raw strings (as captured from PTY device) into lines and add
-    them into the buffer.
+    Break raw strings (as captured from PTY device and decoded) into
+    lines and add them into the buffer.
 
     Args:
-      content: raw text data from PTY device.
+      content: raw text data from PTY device, which may be a str or
+        (as Session provides it) a unicode string.
     """
 
+    # Most PTY reads do not complete a line, and those only need to
+    # extend the partial line.
+    if '\n' not in content:
+      self._lines[-1] += content
+      if (self._max_bytes is not None and
+          len(self._lines[-1]) > self._max_bytes):
+        self._TruncatePartial()
+      return
+
     # Break incoming raw PTY output into lines with '\n' and then
     # strip all occurrences of \r from the end of each line.  Since
     # the last line in self._lines always stores a partial line, the
     # first line of the incoming PTY output should be added to the end
     # of self._lines[-1].
-
-    lines = (self._lines[-1]+content).split('\n')
+    lines = content.split('\n')
+    lines[0] = self._lines[-1]+lines[0]
     for index in range(len(lines)-1):
       lines[index] = lines[index].rstrip('\r')
+
+    # The previous partial line (now completed) counts towards the
+    # retained size only if it was accessible.
+    completed = lines[:-1]
+    if self.GetBound()-1 < self.baseline:
+      completed = completed[1:]
+    self._size += sum(map(len, completed))
+
     self._lines[-1:] = lines
+    self.partial_memo = {}
+    if self._max_lines is not None or self._max_bytes is not None:
+      self._Evict()
+      if (self._max_bytes is not None and
+          len(self._lines[-1]) > self._max_bytes):
+        self._TruncatePartial()
+
+  def _TruncatePartial(self):
+    """Drop the front of the partial line to enforce the size limit."""
+
+    self._lines[-1] = self._lines[-1][-self._max_bytes:]
+    # The partial line no longer extends the one that the matchers saw.
+    self.partial_memo = {}
+
+  def _Evict(self):
+    """Evict the earliest lines to enforce retention limits."""
+
+    last = self.GetBound()-1
+    new_baseline = self.baseline
+    if self._max_lines is not None:
+      new_baseline = max(new_baseline, last-self._max_lines)
+    if self._max_bytes is not None:
+      size = self._size-self._Measure(self.baseline, new_baseline)
+      while size > self._max_bytes and new_baseline < last:
+        size -= len(self.GetLine(new_baseline))
+        new_baseline += 1
+
+    if new_baseline > self.baseline:
+      self.evicted += new_baseline-self.baseline
+      self.UpdateBaseline(new_baseline)
+
+  def _Measure(self, start, finish):
+    """Compute the total length of completed lines in a range."""
+
+    finish = min(finish, self.GetBound()-1)
+    if start >= finish:
+      return 0
+    offset = self._head+1-self.baseline
+    return sum(map(len, self._lines[start+offset:finish+offset]))
+
+  def RetainedSize(self):
+    """Get the total length of accessible completed lines.
+
+    Returns:
+      The number of characters in the completed lines that can still
+      be retrieved with GetLine.
+    """
+
+    return self._size
 
   def UpdateBaseline(self, new_baseline):
     """Update the low-end of the buffer range.
@@ -99,8 +205,25 @@ class Buffer(object):
     assert new_baseline <= self.GetBound(), (
         'new_baseline > self.GetBound()')
 
-    del self._lines[:new_baseline-self.baseline]
+    count = new_baseline-self.baseline
+    if not count:
+      return
+
+    # Dropping a single completed line is by far the most common case.
+    # The partial line does not count towards the retained size.
+    first = self._head+1
+    finish = min(first+count, len(self._lines)-1)
+    if finish == first+1:
+      self._size -= len(self._lines[first])
+    elif finish > first:
+      self._size -= sum(map(len, self._lines[first:finish]))
+
+    self._head += count
     self.baseline = new_baseline
+    if (self._head >= self._COMPACT_THRESHOLD and
+        2*self._head >= len(self._lines)):
+      del self._lines[:self._head]
+      self._head = 0
 
   def GetLine(self, lineno):
     """Get a line of text from the buffer.
@@ -118,4 +241,4 @@ class Buffer(object):
     assert lineno >= self.baseline, 'lineno < self.baseline'
     assert lineno < self.GetBound(), 'lineno >= self.GetBound()'
 
-    return self._lines[lineno-self.baseline+1]
+    return self._lines[lineno-self.baseline+self._head+1]
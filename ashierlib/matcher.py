@@ -0,0 +1,314 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module defines the combined matcher for sets of reactive objects.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import re
+
+
+def _AlternationRegex(keys):
+  """Build a regex that finds any of a set of strings.
+
+  The regex factors out common prefixes (e.g., 'ab(?:c|d)' instead of
+  'abc|abd'), so that the regex engine does not try every string at
+  every position.  The regex only indicates whether some string
+  occurs: once a string ends, longer strings that extend it are
+  omitted.
+  """
+
+  trie = {}
+  for key in keys:
+    node = trie
+    for ch in key:
+      node = node.setdefault(ch, {})
+    node[None] = {}
+
+  def Build(node):
+    if None in node:
+      return ''
+    alternatives = [re.escape(ch)+Build(node[ch]) for ch in sorted(node)]
+    if len(alternatives) == 1:
+      return alternatives[0]
+    return '(?:%s)' % '|'.join(alternatives)
+
+  return Build(trie)
+
+
+class Matcher(object):
+  """Combined matcher for a set of Reactive objects.
+
+  A Matcher indexes the literal prefixes of the last-line patterns of
+  all its Reactive objects in a prefix trie.  A single walk down the
+  trie identifies the Reactive objects whose last-line pattern may
+  match a given line, so that the regular expressions of all other
+  Reactive objects need not run at all.  Reactive objects without a
+  literal prefix are indexed by the longest literal that their
+  last-line pattern requires instead, and a single regex search for
+  all such literals rules most lines out for all of them at once.
+
+  A Matcher also maps each nesting state to the Reactive objects that
+  are active in that state, so that inactive Reactive objects are
+  never visited at all.  Reactive objects with a timer take no part in
+  matching, and the Timers method lists the active ones instead.
+
+  Attributes:
+    settings: a frozenset of the names of the settings (e.g.,
+      "strip-ansi") that the configuration enables.
+  """
+
+  # Each trie node is a dictionary that maps characters to child
+  # nodes.  The special key None maps to the list of indices (into
+  # self._reacts) of the Reactive objects whose prefix ends at the
+  # node.
+
+  def __init__(self, reacts, settings=()):
+    self.settings = frozenset(settings)
+    self._timers = [r for r in reacts if r.Timer() is not None]
+    self._active_timers = {}
+    reacts = [r for r in reacts if r.Timer() is None]
+
+    # Longer patterns take priority over shorter ones.  The sort is
+    # stable, so patterns of the same size keep their configuration
+    # file order.
+    self._reacts = sorted(
+        reacts, key=lambda r: r.PatternSize(), reverse=True)
+    self._trie = {}
+    keyed = {}
+    for index, react in enumerate(self._reacts):
+      literals = react.Literals()
+      if not react.Prefix() and literals:
+        key = max(literals, key=len)
+        keyed.setdefault(key, []).append(index)
+        continue
+      node = self._trie
+      for ch in react.Prefix():
+        node = node.setdefault(ch, {})
+      node.setdefault(None, []).append(index)
+
+    self._keyed = keyed.items()
+    self._key_regex = None
+    if keyed:
+      self._key_regex = re.compile(_AlternationRegex(keyed))
+
+    # The nesting state is always empty or a copy of the nesting
+    # entries of the last matched Reactive object, so there are only
+    # as many states as Reactive objects (plus one).  Compute the
+    # active Reactive objects for all of them up front.
+    self._children = {}
+    for index, react in enumerate(self._reacts):
+      self._children.setdefault(react.Nesting()[:-1], []).append(index)
+    self._filtered = {}
+    self._active = {}
+    self.Active(())
+    for react in self._reacts+self._timers:
+      self.Active(react.Nesting())
+
+  def Reactives(self):
+    """Return the Reactive objects in matching priority order."""
+
+    return list(self._reacts)
+
+  def IsFlat(self):
+    """Check whether the nesting state never affects matching.
+
+    Returns:
+      True if the same Reactive objects are active in every nesting
+      state, which is the case for configurations without nested
+      reactions.
+    """
+
+    active = self.Active(())[1]
+    return all(self.Active(r.Nesting())[1] == active for r in self._reacts)
+
+  def EnableStats(self):
+    """Start counting match statistics for all Reactive objects."""
+
+    for react in self._reacts:
+      react.EnableStats()
+
+  def Timers(self, nesting):
+    """Find the Reactive objects with a timer that are active.
+
+    Args:
+      nesting: the nesting state (a list or tuple of nesting entries).
+
+    Returns:
+      A list of Reactive objects.  Callers must not modify the list.
+    """
+
+    if not self._timers:
+      return self._timers
+    state = tuple(nesting)
+    active = self._active_timers.get(state)
+    if active is None:
+      active = self._active_timers[state] = [
+          r for r in self._timers if r.IsActive(list(state))]
+    return active
+
+  def Active(self, nesting):
+    """Find the Reactive objects that are active in a nesting state.
+
+    Args:
+      nesting: the nesting state (a list or tuple of nesting entries).
+
+    Returns:
+      A pair of a list of indices of the active Reactive objects (in
+      priority order) and a frozenset of the same indices.  Callers
+      must not modify the list.
+    """
+
+    state = tuple(nesting)
+    active = self._active.get(state)
+    if active is None:
+      active = self._active[state] = self._ComputeActive(state)
+    return active
+
+  def _ComputeActive(self, state):
+    # A Reactive object is active if the entries of the nesting state
+    # with lower indentation are exactly its enclosing entries.  Since
+    # indentation strictly increases along the nesting state, those
+    # entries form a prefix state[:k], and the next entry (if any)
+    # must not have lower indentation than the Reactive object.
+    parts = []
+    for k in xrange(len(state)+1):
+      ceiling = state[k][0] if k < len(state) else None
+      part = self._Filtered(state[:k], ceiling)
+      if part[0]:
+        parts.append(part)
+    if not parts:
+      return [], frozenset()
+    if len(parts) == 1:
+      return parts[0]
+    indices = sorted(i for part in parts for i in part[0])
+    return indices, frozenset(indices)
+
+  def _Filtered(self, parent, ceiling):
+    """Find the children of parent with indentation up to ceiling."""
+
+    key = (parent, ceiling)
+    part = self._filtered.get(key)
+    if part is None:
+      children = self._children.get(parent, [])
+      if ceiling is not None:
+        children = [i for i in children
+                    if self._reacts[i].Indentation() <= ceiling]
+      part = self._filtered[key] = (children, frozenset(children))
+    return part
+
+  def Candidates(self, line):
+    """Find the Reactive objects that may match a line.
+
+    Args:
+      line: the line to match to the last-line patterns.
+
+    Returns:
+      A list of indices of the Reactive objects whose last-line
+      pattern prefix is a prefix of the line, or whose last-line
+      pattern has no prefix but requires a literal the line contains.
+    """
+
+    node = self._trie
+    candidates = node.get(None, [])
+    for ch in line:
+      node = node.get(ch)
+      if node is None:
+        break
+      if None in node:
+        candidates = candidates+node[None]
+
+    if self._key_regex is not None and self._key_regex.search(line):
+      for key, indices in self._keyed:
+        if key in line:
+          candidates = candidates+indices
+    return candidates
+
+  def React(self, nesting, buf, bound, channels, matched=None):
+    """React to the first Reactive object that matches the buffer.
+
+    Try the Reactive objects in priority order with the line numbered
+    bound-1 as the last line to match.  Reactive objects that are not
+    candidates for the last line do not run their patterns at all.
+
+    Args:
+      nesting: persistent state to support nested matching.
+        Initialize with a fresh empty mutable list and reuse the same
+        list for subsequent calls.
+      buf: a Buffer object that contains the terminal output to match.
+      bound: integer index matching upper limit (non-inclusive).
+      channels: dictionary that maps channel names (which are strings)
+        to functions that write a string to the channel.
+      matched: optional list to append the matching Reactive object to.
+
+    Returns:
+      An integer with the same meaning as the return value of
+      Reactive.React.  If negative, it comes from the first Reactive
+      object with a positive match.  If non-negative, it is the lowest
+      value that any Reactive object returned.
+    """
+
+    # Inactive Reactive objects place no restrictions on how much the
+    # buffer baseline can be raised, so only active ones take part.
+    # If the last line is no longer in the buffer, no pattern can
+    # match, and active Reactive objects request that the baseline
+    # stay where it is.
+    limit = buf.GetBound()
+    active, active_set = self.Active(nesting)
+    if bound <= buf.baseline:
+      return buf.baseline if active else limit
+
+    candidates = [index for index in self.Candidates(buf.GetLine(bound-1))
+                  if index in active_set]
+    if len(candidates) > 1:
+      candidates.sort()
+
+    next_baseline = limit
+    for index in candidates:
+      waterline = self._reacts[index].ReactActive(
+          nesting, buf, bound, channels)
+      if waterline < 0:
+        if matched is not None:
+          matched.append(self._reacts[index])
+        return waterline
+      next_baseline = min(waterline, next_baseline)
+
+    # Since non-candidates never match, they only contribute their
+    # waterlines.  When the last line is completed, an active
+    # non-candidate returns start+1 (or the baseline if start is below
+    # it), so the one with the longest pattern (i.e., the first one in
+    # priority order) returns the lowest waterline of them all.
+    if bound < limit:
+      for index in active:
+        if index not in candidates:
+          start = bound-self._reacts[index].PatternSize()
+          return min(max(start+1, buf.baseline), next_baseline)
+      return next_baseline
+
+    for index in active:
+      if index not in candidates:
+        next_baseline = min(
+            self._reacts[index].Reject(nesting, buf, bound), next_baseline)
+    return next_baseline
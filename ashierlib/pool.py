@@ -0,0 +1,245 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module implements a pool of controller processes that sessions
+take turns to use.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import collections
+import json
+import os
+import signal
+import time
+
+import terminal
+
+
+# A controller that exits within this many seconds of its start without
+# serving a session most likely cannot start at all (e.g., because the
+# command does not exist), so the pool waits before it replaces it, and
+# doubles the wait for each such exit in a row up to the maximum.
+_QUICK_EXIT = 1.0
+_RESPAWN_DELAY = 0.1
+_MAX_RESPAWN_DELAY = 5.0
+
+# Seconds that Close gives controllers to exit after SIGTERM before it
+# kills them.
+_GRACE_PERIOD = 1.0
+
+
+class Controller(object):
+  """A controller process in a pool.
+
+  Attributes:
+    pid: process ID of the controller.
+    fd: file descriptor of the socket of the controller.
+    session_number: the number of the session that the controller
+      serves, or None if the controller is idle.
+    started: the time.time() at which the controller started.
+    served: whether the controller has served a session.
+  """
+
+  def __init__(self, pid, fd):
+    self.pid = pid
+    self.fd = fd
+    self.session_number = None
+    self.started = time.time()
+    self.served = False
+
+
+class ControllerPool(object):
+  """A pool of long-lived controller processes that sessions share.
+
+  A ControllerPool object starts a fixed number of controllers on
+  sockets (see terminal.SpawnSocket) and hands each one to a session
+  at a time, so that sessions do not pay for starting a controller.
+  The pool tells a controller where sessions start and end with
+  JSON-lines frames, which fit in with the frames of messages from
+  the session (see directive.Frames):
+
+    {"event": "start", "session": N}
+    {"event": "end", "session": N}
+
+  Controllers should keep serving sessions until the pool terminates
+  them.  The pool discards what a controller writes while it has no
+  session, and it replaces controllers that exit (with increasing
+  delays while they keep exiting right after they start), but a
+  session whose controller exits goes on without one (as it would
+  without a pool).
+  """
+
+  def __init__(self, loop, argv, size):
+    """Create a ControllerPool object and start the controllers.
+
+    Args:
+      loop: the event loop that the sessions run in.
+      argv: arguments (including executable name) of the controller.
+      size: the number of controllers.
+    """
+
+    self._loop = loop
+    self._argv = argv
+    self._controllers = set()
+    self._idle = collections.deque()
+    self._waiting = collections.deque()
+    self._exited = set()
+    self._quick_exits = 0
+    self._respawns = {}
+    for unused_index in xrange(size):
+      self._Spawn()
+
+  def Acquire(self, session_number, callback):
+    """Hand a controller to a session as soon as one is idle.
+
+    Args:
+      session_number: the number of the session.
+      callback: function to call with the Controller object.
+    """
+
+    self._waiting.append((session_number, callback))
+    self._Dispatch()
+
+  def Release(self, controller, reusable):
+    """Return a controller to the pool when a session ends.
+
+    Args:
+      controller: the Controller object from Acquire.
+      reusable: whether the controller can serve another session
+        (which is not the case once it closes its socket).
+    """
+
+    if not reusable:
+      self._Remove(controller)
+      self._Spawn()
+    else:
+      self._Send(controller, 'end')
+      controller.session_number = None
+      self._Watch(controller)
+      self._idle.append(controller)
+    self._Dispatch()
+
+  def Close(self):
+    """Terminate all controllers and wait for them to exit."""
+
+    for handle in self._respawns.values():
+      handle.Cancel()
+    self._respawns.clear()
+    for controller in list(self._controllers):
+      self._Remove(controller)
+    deadline = time.time()+_GRACE_PERIOD
+    while self._exited and time.time() < deadline:
+      time.sleep(0.01)
+      self._Reap()
+    for pid in self._exited:
+      try:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+      except OSError:
+        pass
+    self._exited.clear()
+
+  def _Spawn(self):
+    self._Reap()
+    pid, fd = terminal.SpawnSocket(self._argv)
+    controller = Controller(pid, fd)
+    self._loop.AddWriter(fd)
+    self._controllers.add(controller)
+    self._Watch(controller)
+    self._idle.append(controller)
+
+  def _Watch(self, controller):
+    """Discard idle controller output and detect controller exits."""
+
+    def IdleReady(unused_event):
+      try:
+        data = os.read(controller.fd, 65536)
+      except OSError:
+        data = ''
+      # Once the controller serves a session, the session is in charge
+      # of detecting that it exits.
+      if not data and controller.session_number is None:
+        self._idle.remove(controller)
+        self._Remove(controller)
+        if (controller.served or
+            time.time()-controller.started >= _QUICK_EXIT):
+          self._quick_exits = 0
+          self._Respawn()
+        else:
+          self._quick_exits += 1
+          delay = min(_RESPAWN_DELAY*2**(self._quick_exits-1),
+                      _MAX_RESPAWN_DELAY)
+          key = object()
+          def Later():
+            del self._respawns[key]
+            self._Respawn()
+          self._respawns[key] = self._loop.CallLater(delay, Later)
+
+    self._loop.AddReader(controller.fd, IdleReady)
+
+  def _Respawn(self):
+    self._Spawn()
+    self._Dispatch()
+
+  def _Dispatch(self):
+    while self._idle and self._waiting:
+      controller = self._idle.popleft()
+      controller.session_number, callback = self._waiting.popleft()
+      controller.served = True
+      self._Send(controller, 'start')
+      callback(controller)
+
+  def _Send(self, controller, event):
+    frame = json.dumps({'event': event,
+                        'session': controller.session_number},
+                       sort_keys=True)
+    try:
+      self._loop.Write(controller.fd, frame+'\n')
+    except OSError:
+      pass
+
+  def _Remove(self, controller):
+    self._controllers.discard(controller)
+    self._loop.Remove(controller.fd)
+    os.close(controller.fd)
+    try:
+      os.kill(controller.pid, signal.SIGTERM)
+    except OSError:
+      pass
+    # The controller is unlikely to have exited yet, so later calls to
+    # _Reap (and Close) collect its exit status.
+    self._exited.add(controller.pid)
+
+  def _Reap(self):
+    """Collect the exit status of removed controllers that exited."""
+
+    for pid in list(self._exited):
+      try:
+        reaped, unused_status = os.waitpid(pid, os.WNOHANG)
+      except OSError:
+        reaped = pid
+      if reaped:
+        self._exited.remove(pid)
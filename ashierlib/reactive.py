@@ -29,8 +29,26 @@ __author__ = 'cklin@google.com (Chuan-kai Lin)'
 
 import itertools
 import re
+import time
 
 import directive
+import stats
+
+# Operations of the scanner that matches patterns without the regex
+# engine (see Pattern._Scan): a literal string, a \s+ whitespace run,
+# a [^x]+ group, a [^\s]+ group, a .+ group, and the end of the line.
+_LITERAL, _SPACE, _UNTIL, _WORD, _REST, _EOL = range(6)
+
+# The characters that \s matches in a regex compiled without the
+# re.UNICODE flag, which is how Pattern compiles its regex.
+_WHITESPACE = ' \t\n\r\f\v'
+
+# The number of times that a pattern runs the scanner before it
+# compiles its regex.  The scanner takes a few microseconds per line
+# (several times as long as a compiled regex), and compiling a regex
+# takes about a hundred microseconds, so this is roughly where
+# compiling pays off.
+_SCAN_LIMIT = 32
 
 
 class Pattern(object):
@@ -44,12 +62,17 @@ class Pattern(object):
   Attributes:
     pattern: string representation of the pattern regex.
     bound_names: a list of marker names for the pattern.
+    prefix: literal string that every matching line must start with.
+    literals: literal strings that every matching line must contain
+      in order (including the prefix, if it is not empty).
   """
 
   def __init__(self, template, markers):
     regex = ''
     index = 0
     bound_names = []
+    literals = []
+    ops = []
 
     # Build a regular expression that matches the template string and
     # extracts the substrings indicated by the markers by traversing
@@ -71,13 +94,17 @@ class Pattern(object):
       # section (index == m.start).
       if index < m.start:
         regex += template.InferSkip(index, m.start)
+        literals.extend(re.findall(r'\S+', template.sample[index:m.start]))
+        ops.extend(_SkipOps(template.sample[index:m.start]))
         index = m.start
 
       # Current position matches the beginning of the next marker.  In
       # this case, infer a regular expression for the marker.
       if index == m.start:
-        regex += '(' + m.InferRegex(template) + ')'
+        marker_regex = m.InferRegex(template)
+        regex += '(' + marker_regex + ')'
         bound_names.append(m.name)
+        ops.append(_GroupOp(marker_regex))
         index = m.finish
 
       # Current position is beyond the beginning of the next marker.
@@ -91,18 +118,66 @@ class Pattern(object):
     # text that follows the last marker.
     if index < len(template.sample):
       regex += template.InferSkip(index, len(template.sample))
+      literals.extend(re.findall(r'\S+', template.sample[index:]))
+      ops.extend(_SkipOps(template.sample[index:]))
 
     self.pattern = regex
     self.bound_names = bound_names
-    self._regex = re.compile(self.pattern)
+    self.literals = literals
+    self._regex = None
+    self._location = template.line.Location()
+    self._stats = None
+    self._ops = ops if _Scannable(ops) else None
+    self._scans = 0
+
+    # Every string that matches the pattern must contain the literal
+    # (non-whitespace) runs of the unmarked template text.  Whitespace
+    # is ASCII only, as in InferSkip and the prefix below, because the
+    # regex does not match other Unicode spaces with \s+.  The last
+    # one is the best indicator that a growing partial line may have
+    # become matchable.
+    self._tail = literals[-1] if literals else ''
+
+    # The literal prefix is the template text before the first marker,
+    # cut short at the first whitespace character because InferSkip
+    # turns whitespace into the variable-length \s+ regex.
+    literal = template.sample
+    if markers:
+      literal = literal[:min(m.start for m in markers)]
+    self.prefix = re.split(r'\s', literal, 1)[0]
+
+    # A non-empty prefix is the same string as the first literal, and
+    # Match checks it separately because it is anchored at the start.
+    self._literals = literals[1:] if self.prefix else literals
 
   def AttachEOLMarker(self):
     """Attach an EOL marker '$' to the pattern."""
 
     self.pattern += '$'
-    self._regex = re.compile(self.pattern)
+    self._regex = None
+    if self._ops is not None:
+      self._ops.append((_EOL, None))
+
+  def __getstate__(self):
+    # Compiled regular expressions are recompiled from scratch when
+    # unpickled, so leave them out and compile on first use instead.
+    state = self.__dict__.copy()
+    state['_regex'] = None
+    state['_scans'] = 0
+    return state
+
+  def EnableStats(self):
+    """Start counting match statistics."""
+
+    if self._stats is None:
+      self._stats = stats.Counters(self._location)
+
+  def Stats(self):
+    """Return the stats.Counters object, or None if not counting."""
 
-  def Match(self, text, bindings):
+    return self._stats
+
+  def Match(self, text, bindings, memo=None):
     """Match a string to a pattern.
 
     Check if the string argument matches the pattern and, if so,
@@ -111,11 +186,61 @@ class Pattern(object):
     Args:
       text: the string to match.
       bindings: dictionary to store extracted substrings.
+      memo: optional dictionary for incremental matching.  Pass the
+        same dictionary when matching successive extensions of the
+        same string (e.g., a growing partial line), and a fresh one
+        when the string changes in any other way.
 
     Returns:
       A Boolean value that indicates match success.
     """
 
+    if self._stats is not None:
+      return self._CountedMatch(text, bindings, memo)
+
+    # The memo maps this pattern to a length L such that text[:L] is
+    # known not to contain the tail literal.  If the newly appended
+    # text (plus enough overlap to catch a tail literal that straddles
+    # the old end) does not contain the tail literal either, the regex
+    # cannot match, and there is no need to run it.
+    if memo is not None and self._tail:
+      scanned = memo.get(self, 0)
+      overlap = max(0, scanned-len(self._tail)+1)
+      if text.find(self._tail, overlap) < 0:
+        memo[self] = len(text)
+        return False
+
+    # Every match starts with the prefix and contains the literals in
+    # order.  Checking that with plain string searches rejects most
+    # lines without entering the regex engine.
+    if not text.startswith(self.prefix):
+      return False
+    position = len(self.prefix)
+    for literal in self._literals:
+      position = text.find(literal, position)
+      if position < 0:
+        return False
+      position += len(literal)
+
+    # Every process compiles the regex again (including the daemon
+    # workers, one for each session), so patterns that match only a few
+    # times use the scanner instead.  The scanner agrees with the regex
+    # on text without newlines (which "." and "$" treat specially).
+    if (self._ops is not None and self._scans < _SCAN_LIMIT and
+        '\n' not in text):
+      self._scans += 1
+      groups = self._Scan(text)
+      if groups is None:
+        return False
+      for name, value in itertools.izip(self.bound_names, groups):
+        if name:
+          bindings[name] = value
+      return True
+
+    # Compile the regular expression on first use, so that patterns
+    # that never get past the prefilters cost nothing to load.
+    if self._regex is None:
+      self._regex = re.compile(self.pattern)
     matches = self._regex.match(text)
     if matches:
       for index, name in enumerate(self.bound_names):
@@ -124,6 +249,149 @@ class Pattern(object):
       return True
     return False
 
+  def _Scan(self, text):
+    """Match a string to the pattern without the regex engine.
+
+    Each operation of the scanner makes the choice that the regex
+    engine would end up with: the groups are greedy, and since every
+    [^x]+ group is followed by a literal that starts with x and every
+    [^\s]+ group by whitespace, backtracking into a group never helps.
+    The one exception is a group that follows whitespace and would be
+    empty, in which case the regex engine gives the group the last
+    whitespace character.
+
+    Args:
+      text: the string to match, which must not contain newlines.
+
+    Returns:
+      A list of the substrings that the groups match, or None if the
+      string does not match.
+    """
+
+    size = len(text)
+    position = 0
+    run = 0
+    groups = []
+    for op, arg in self._ops:
+      if op == _LITERAL:
+        if not text.startswith(arg, position):
+          return None
+        position += len(arg)
+        run = 0
+      elif op == _SPACE:
+        start = position
+        while position < size and text[position] in _WHITESPACE:
+          position += 1
+        run = position-start
+        if not run:
+          return None
+      elif op == _UNTIL:
+        finish = text.find(arg, position)
+        if finish < 0:
+          finish = size
+        if finish == position and run > 1:
+          position -= 1
+        if finish == position:
+          return None
+        groups.append(text[position:finish])
+        position = finish
+        run = 0
+      elif op == _WORD:
+        finish = position
+        while finish < size and text[finish] not in _WHITESPACE:
+          finish += 1
+        if finish == position:
+          return None
+        groups.append(text[position:finish])
+        position = finish
+        run = 0
+      elif op == _REST:
+        if position == size and run > 1:
+          position -= 1
+        if position == size:
+          return None
+        groups.append(text[position:])
+        position = size
+        run = 0
+      elif position != size:
+        return None
+    return groups
+
+  def _CountedMatch(self, text, bindings, memo):
+    # Detach the counters while running Match, so that the uncounted
+    # code path does not pay for an extra function call.
+    counters, self._stats = self._stats, None
+    start_time = time.time()
+    try:
+      matched = self.Match(text, bindings, memo)
+    finally:
+      self._stats = counters
+    counters.seconds += time.time()-start_time
+    counters.attempts += 1
+    if matched:
+      counters.hits += 1
+    elif memo is not None:
+      counters.retries += 1
+    else:
+      counters.mismatches += 1
+    return matched
+
+
+def _SkipOps(text):
+  """Compute the scanner operations that match InferSkip(text)."""
+
+  ops = []
+  for index, part in enumerate(re.split(r'(\s+)', text)):
+    if index % 2:
+      ops.append((_SPACE, None))
+    elif part:
+      ops.append((_LITERAL, part))
+  return ops
+
+
+def _GroupOp(regex):
+  """Compute the scanner operation for the regex of a marker.
+
+  Args:
+    regex: the regex of the marker (inferred or specified by the user).
+
+  Returns:
+    A scanner operation, or None if the regex is not one that the
+    scanner supports.
+  """
+
+  if regex == '.+':
+    return (_REST, None)
+  if regex == r'[^\s]+':
+    return (_WORD, None)
+  if (len(regex) == 5 and regex.startswith('[^') and regex.endswith(']+')
+      and regex[2] != '\\' and not re.match(r'\s', regex[2])):
+    return (_UNTIL, regex[2])
+  return None
+
+
+def _Scannable(ops):
+  """Check if the scanner operations make the same choices as the regex.
+
+  The scanner does not backtrack, so it supports a group only if what
+  follows the group cannot match a part of the text that the group
+  could also match.
+  """
+
+  for index, op in enumerate(ops):
+    if op is None:
+      return False
+    following = ops[index+1] if index+1 < len(ops) else None
+    if op[0] == _UNTIL and not (
+        following and following[0] == _LITERAL and
+        following[1].startswith(op[1])):
+      return False
+    if op[0] == _WORD and following and following[0] != _SPACE:
+      return False
+    if op[0] == _REST and following:
+      return False
+  return True
+
 
 class Reactive(object):
   """Action cued by string pattern matching.
@@ -131,7 +399,9 @@ class Reactive(object):
   A Reactive object is the combination of a series of Patterns
   followed by zero or more Sends.  It is a self-contained unit that
   describes a (possibly multi-line) pattern to match and the actions
-  to take once a match is found.
+  to take once a match is found.  A Reactive object may also have a
+  Timer instead of Patterns, in which case the actions run when the
+  timer fires (see Fire).
   """
 
   def __init__(self, nesting, spec):
@@ -143,6 +413,9 @@ class Reactive(object):
         elem.ReportError('indentation change in a group')
         break
 
+    self._location = spec[0].line.Location()
+    self._stats = None
+
     # Compute self._nesting, which should be the longest group
     # subsequence that has strictly increasing indentation and ends at
     # the current group.  Invariant: the nesting argument holds a
@@ -163,9 +436,15 @@ class Reactive(object):
       return isinstance(obj, directive.Send)
 
     self._patterns = []
+    self._timer = None
     index = 0
 
-    while index < len(spec) and IsTemplate(spec[index]):
+    if isinstance(spec[0], directive.Timer):
+      self._timer = spec[0]
+      index = 1
+
+    while (not self._timer and index < len(spec) and
+           IsTemplate(spec[index])):
       markers = list(itertools.takewhile(IsMarker, spec[index+1:]))
       self._patterns.append(Pattern(spec[index], markers))
       index += len(markers)+1
@@ -178,12 +457,17 @@ class Reactive(object):
     for pattern in self._patterns[:-1]:
       pattern.AttachEOLMarker()
 
-    if not self._patterns:
+    if not self._patterns and not self._timer:
       spec[0].ReportError('group has no templates')
 
     if index+len(self._actions) < len(spec):
       non_action = spec[index+len(self._actions)]
-      non_action.ReportError('template/marker after action')
+      if isinstance(non_action, directive.Timer):
+        non_action.ReportError('timer not at the start of a group')
+      elif self._timer:
+        non_action.ReportError('template/marker in a timer group')
+      else:
+        non_action.ReportError('template/marker after action')
 
     bound_names = set()
     for pat in self._patterns:
@@ -198,6 +482,143 @@ class Reactive(object):
 
     return len(self._patterns)
 
+  def Prefix(self):
+    """Return the literal prefix of the last-line pattern."""
+
+    if not self._patterns:
+      return ''
+    return self._patterns[-1].prefix
+
+  def Literals(self):
+    """Return the literals that the last line must contain in order."""
+
+    if not self._patterns:
+      return []
+    return self._patterns[-1].literals
+
+  def Indentation(self):
+    """Return the indentation level of the configuration group."""
+
+    return self._nesting[-1][0]
+
+  def Nesting(self):
+    """Return the nesting state that a match of this object sets.
+
+    Returns:
+      A tuple of the nesting entries of the enclosing Reactive objects
+      followed by the nesting entry of this object.
+    """
+
+    return tuple(self._nesting)
+
+  def Timer(self):
+    """Return the directive.Timer object, or None for a pattern."""
+
+    return self._timer
+
+  def Fire(self, nesting, channels):
+    """Run the actions of a timer.
+
+    Run the actions as for a positive match and update the nesting
+    state accordingly.
+
+    Args:
+      nesting: persistent state to support nested matching.
+      channels: dictionary that maps channel names (which are strings)
+        to functions that write a string to the channel (or to
+        directive.Frames objects).
+    """
+
+    for send in self._actions:
+      send.Send(channels, {}, self._location)
+    nesting[:] = self._nesting
+
+  def Location(self):
+    """Return the file:line identifier of the configuration group."""
+
+    return self._location
+
+  def EnableStats(self):
+    """Start counting match statistics for this object and its patterns."""
+
+    if self._stats is None:
+      self._stats = stats.Counters(self._location)
+    for pattern in self._patterns:
+      pattern.EnableStats()
+
+  def Stats(self):
+    """Return the stats.Counters object, or None if not counting."""
+
+    return self._stats
+
+  def PatternStats(self):
+    """Return the stats.Counters objects of the patterns."""
+
+    return [pattern.Stats() for pattern in self._patterns]
+
+  def IsActive(self, nesting):
+    """Check if the nesting state allows this object to match.
+
+    A Reactive object is inactive if one of its enclosing objects had
+    not been matched, or if a non-enclosing object with lower
+    indentation had been matched.
+
+    Args:
+      nesting: persistent state to support nested matching.
+
+    Returns:
+      A Boolean value that indicates whether the object is active.
+    """
+
+    # For the Reactive object to be active, the only nesting entries
+    # in the current matching context (nesting) with lower indentation
+    # should be exactly the nesting entries of the enclosing Reactive
+    # objects (self._nesting[:-1]).
+    self_indentation = self._nesting[-1][0]
+    if not self_indentation:
+      return True
+    def LowerIndentation(nest):
+      return nest[0] < self_indentation
+    return filter(LowerIndentation, nesting) == self._nesting[:-1]
+
+  def Reject(self, nesting, buf, bound):
+    """Compute the React return value for a known last-line mismatch.
+
+    The caller must have established that this object is active and
+    that the last pattern cannot match the line numbered bound-1 in its
+    current state (e.g., the line does not start with the literal
+    prefix of the pattern).  This method then returns the same value
+    as React would, but without running the last-line regular
+    expression.
+
+    Args:
+      nesting: persistent state to support nested matching.
+      buf: a Buffer object that contains the terminal output to match.
+      bound: integer index matching upper limit (non-inclusive).
+
+    Returns:
+      A non-negative integer with the same meaning as the return
+      value of React.
+    """
+
+    if self._stats is not None:
+      return self._Counted(self.Reject, buf, bound, nesting, buf, bound)
+
+    limit = buf.GetBound()
+    start = bound-len(self._patterns)
+    if start < buf.baseline:
+      return buf.baseline
+
+    # A mismatch in a completed line is definite.  A mismatch in the
+    # partial line is definite only if an earlier line also fails to
+    # match, which is what React would discover first.
+    if bound < limit:
+      return start+1
+    for index in xrange(start, bound-1):
+      if not self._patterns[index-start].Match(buf.GetLine(index), {}):
+        return start+1
+    return start
+
   def React(self, nesting, buf, bound, channels):
     """React if there is a match from line buffer.
 
@@ -208,7 +629,7 @@ class Reactive(object):
       buf: a Buffer object that contains the terminal output to match.
       bound: integer index matching upper limit (non-inclusive).
       channels: dictionary that maps channel names (which are strings)
-        to the corresponding writable file descriptors.
+        to functions that write a string to the channel.
 
     Returns:
       An integer indicating the how the matching baseline should be
@@ -217,36 +638,46 @@ class Reactive(object):
       indicates what the baseline *must* be raised to.
     """
 
-    # If this Reactive object is inactive because one of its enclosing
-    # objects had not been matched, or that a non-enclosing object with
-    # lower indentation had been matched, do not continue with matching.
-    # Return buf.GetBound() to indicate that this particular Reactive
-    # object places no restrictions on how much the buffer baseline
-    # can be raised.
-
-    # For the Reactive object to be active, the only nesting entries
-    # in the current matching context (nesting) with lower indentation
-    # should be exactly the nesting entries of the enclosing Reactive
-    # objects (self._nesting[:-1]).
-    self_indentation = self._nesting[-1][0]
-    def LowerIndentation(nest):
-      return nest[0] < self_indentation
-    if filter(LowerIndentation, nesting) != self._nesting[:-1]:
+    # If this Reactive object is inactive, do not continue with
+    # matching.  Return buf.GetBound() to indicate that this
+    # particular Reactive object places no restrictions on how much
+    # the buffer baseline can be raised.
+    if not self.IsActive(nesting):
       return buf.GetBound()
+    return self.ReactActive(nesting, buf, bound, channels)
+
+  def ReactActive(self, nesting, buf, bound, channels):
+    """React if there is a match, without checking the nesting state.
+
+    The caller must have established that this object is active.  The
+    arguments and the return value are the same as those of React.
+    """
+
+    if self._stats is not None:
+      return self._Counted(
+          self.ReactActive, buf, bound, nesting, buf, bound, channels)
 
     # If some of the lines needed for the current match no longer
     # exist in the buffer, do not continue with matching.  Instead,
     # request that the buffer baseline stay where it is (because there
     # is no evidence to exclude any line in the buffer from
-    # contributing to a future match).
+    # contributing to a future match).  This is also how patterns
+    # whose start line the buffer evicted (to enforce its retention
+    # limits) are treated: they never match, so a multi-line pattern
+    # cannot match across more lines than the buffer retains.
     start = bound-len(self._patterns)
     if start < buf.baseline:
       return buf.baseline
 
+    # The partial line grows as more data arrives, so its matching
+    # results are memoized in the buffer to avoid rescanning the
+    # entire line every time.
+    partial = buf.GetBound()-1
     bindings = dict()
     for index in xrange(start, bound):
       pattern = self._patterns[index-start]
-      if not pattern.Match(buf.GetLine(index), bindings):
+      memo = buf.partial_memo if index == partial else None
+      if not pattern.Match(buf.GetLine(index), bindings, memo):
 
         # A negative match that occurred before the last buffered
         # (partial) line is definite because no new data can fix the
@@ -260,7 +691,7 @@ class Reactive(object):
     # Positive match for all patterns: execute all actions and update
     # the current match nesting state.
     for send in self._actions:
-      send.Send(channels, bindings)
+      send.Send(channels, bindings, self._location)
     nesting[:] = self._nesting
 
     # If the last pattern is empty, retain the corresponding input
@@ -269,3 +700,29 @@ class Reactive(object):
     if not self._patterns[-1].pattern:
       return 1-bound
     return -bound
+
+  def _Counted(self, method, buf, bound, *args):
+    """Run ReactActive or Reject and update the statistics."""
+
+    # Detach the counters while running the method, so that the
+    # uncounted code path does not pay for an extra function call.
+    counters, self._stats = self._stats, None
+    start_time = time.time()
+    try:
+      waterline = method(*args)
+    finally:
+      self._stats = counters
+    counters.seconds += time.time()-start_time
+    counters.attempts += 1
+
+    # Both methods return start+1 for a definite mismatch and start
+    # for a mismatch that more output may fix (see ReactActive).
+    start = bound-len(self._patterns)
+    if waterline < 0:
+      counters.hits += 1
+    elif start >= buf.baseline:
+      if waterline > start:
+        counters.mismatches += 1
+      else:
+        counters.retries += 1
+    return waterline
@@ -0,0 +1,217 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module records the input of sessions and replays recorded child
+output through the matcher.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import os
+import struct
+import time
+
+import linebuf
+import session
+
+# A recording starts with this line, which is followed by records that
+# consist of a header (the time.time() at which the data was read, the
+# source, the session number, and the data size) and the data.
+_MAGIC = 'ashier-recording 2\n'
+_HEADER = struct.Struct('!dBII')
+
+_SOURCES = ('child', 'controller', 'stdin')
+_CODES = dict((name, code) for code, name in enumerate(_SOURCES))
+
+
+class Recorder(object):
+  """Append the input of sessions to a recording file.
+
+  A Recorder object writes each record with a single write call to a
+  file opened in append mode, so that a recording is complete up to
+  the last chunk of input even if Ashier is killed, and several
+  recorders may append to the same file.
+  """
+
+  def __init__(self, filename):
+    """Open a recording file, creating it if it does not exist.
+
+    Raises:
+      OSError: the file cannot be opened.
+      ValueError: the file exists but is not a recording (or is one in
+        an older format).
+    """
+
+    self._fd = os.open(filename, os.O_RDWR|os.O_APPEND|os.O_CREAT, 0666)
+    if os.fstat(self._fd).st_size == 0:
+      os.write(self._fd, _MAGIC)
+    elif os.read(self._fd, len(_MAGIC)) != _MAGIC:
+      # Writes still go to the end of the file in append mode.
+      os.close(self._fd)
+      raise ValueError('%s is not an Ashier recording' % filename)
+
+  def Record(self, source, data, session_number=0):
+    """Append a chunk of input to the recording.
+
+    Args:
+      source: where the data came from: 'child', 'controller', or
+        'stdin'.
+      data: the string that the session read.
+      session_number: the session that read the data.
+    """
+
+    header = _HEADER.pack(time.time(), _CODES[source], session_number,
+                          len(data))
+    os.write(self._fd, header+data)
+
+  def Close(self):
+    os.close(self._fd)
+
+
+def Read(filename):
+  """Read the records in a recording file.
+
+  A truncated record at the end of the file (e.g., from a recording
+  that is still in progress) is ignored.
+
+  Args:
+    filename: name of the recording file.
+
+  Yields:
+    A (timestamp, source, session_number, data) tuple for each record.
+
+  Raises:
+    IOError: the file cannot be read.
+    ValueError: the file is not a recording.
+  """
+
+  with open(filename, 'rb') as f:
+    if f.read(len(_MAGIC)) != _MAGIC:
+      raise ValueError('%s is not an Ashier recording' % filename)
+    while True:
+      header = f.read(_HEADER.size)
+      if len(header) < _HEADER.size:
+        break
+      timestamp, code, number, size = _HEADER.unpack(header)
+      data = f.read(size)
+      if len(data) < size:
+        break
+      yield timestamp, _SOURCES[code], number, data
+
+
+class Action(object):
+  """A message that a reaction sent during a replay.
+
+  Attributes:
+    offset: recording time of the output that triggered the reaction,
+      in seconds from the start of the recording.
+    session_number: the session that the output came from.
+    channel: the channel that the reaction sent the message to.
+    message: the message (a unicode string).
+  """
+
+  def __init__(self, offset, session_number, channel, message):
+    self.offset = offset
+    self.session_number = session_number
+    self.channel = channel
+    self.message = message
+
+
+def Replay(records, reacts, strip_ansi=False, realtime=False,
+           latency=None, max_lines=None, max_bytes=None):
+  """Run the reactions on recorded child output.
+
+  Replay the child output of each recorded session through its own
+  line buffer and nesting state, in the same way that a Session object
+  processes output that it reads.  Recorded controller and user input
+  does not affect matching.  Replay does not run timers.  The output
+  of every session ends with the last record of the recording.
+
+  Args:
+    records: an iterable of records from Read.
+    reacts: a Matcher object that holds the reactions to run through.
+    strip_ansi: whether to remove terminal escape sequences from the
+      output before matching (also enabled by the strip-ansi setting).
+    realtime: whether to replay the output with the recorded timing
+      instead of as fast as possible.
+    latency: optional stats.Latency object to record the response
+      latency of each channel and each matching reaction in.
+    max_lines: maximum number of completed lines that the buffer of
+      each session retains (see linebuf.Buffer), or None.
+    max_bytes: maximum total length of completed lines that the
+      buffer of each session retains, or None.
+
+  Returns:
+    A (actions, chunks, size, seconds) tuple, where actions is a list
+    of Action objects, chunks and size are the number of chunks and
+    bytes of child output, and seconds is the time spent processing
+    the output (excluding the delays of a real-time replay).
+  """
+
+  strip_ansi = strip_ansi or 'strip-ansi' in reacts.settings
+  states = {}
+  actions = []
+  chunks = size = 0
+  seconds = 0.0
+  first = None
+  replay_start = time.time()
+
+  def Process(number, offset, data, final=False):
+    if number not in states:
+      states[number] = (linebuf.Buffer(max_lines, max_bytes), [],
+                        session.OutputDecoder(strip_ansi))
+    buf, nesting, decoder = states[number]
+    channels = dict(
+        (channel, lambda message, channel=channel: actions.append(
+            Action(offset, number, channel, message)))
+        for channel in ('controller', 'terminal'))
+
+    start = time.time()
+    buf.AppendRawData(decoder.Decode(data, final))
+    session.React(nesting, buf, reacts, channels, latency, start)
+    return time.time()-start
+
+  offset = 0.0
+  for timestamp, source, number, data in records:
+    if first is None:
+      first = timestamp
+    offset = timestamp-first
+    if source != 'child':
+      continue
+    if realtime:
+      delay = offset-(time.time()-replay_start)
+      if delay > 0:
+        time.sleep(delay)
+
+    seconds += Process(number, offset, data)
+    chunks += 1
+    size += len(data)
+
+  # Flush what the decoders hold back, such as an incomplete UTF-8
+  # sequence at the end of the output.
+  for number in sorted(states):
+    seconds += Process(number, offset, '', True)
+
+  return actions, chunks, size, seconds
@@ -0,0 +1,352 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module runs the reactions on the lines of a file without a shell.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import itertools
+import mmap
+import multiprocessing
+import os
+
+import linebuf
+import session
+
+# Bytes of input that go into the line buffer at a time.
+_BLOCK_SIZE = 1 << 20
+
+# Bytes of input below which a file is not worth splitting across
+# processes.
+_MIN_SLICE_SIZE = 4 << 20
+
+# A match is a (line, exclusion, sends) tuple, where line is the
+# number of the last matched line, exclusion is the number of the
+# first line that later matches may use, and sends is a list of
+# (channel, message) pairs.  Line numbers start at 1.
+
+
+class _Run(object):
+  """Run the reactions on complete lines in the order they arrive.
+
+  Unlike session.React, a _Run object never matches the partial line
+  at the end of the buffer, so that the results do not depend on how
+  the input is split into blocks.
+  """
+
+  def __init__(self, reacts, bound=1, offset=0):
+    """Create a _Run object.
+
+    Args:
+      reacts: a Matcher object that holds the reactions to run through.
+      bound: the number of the first line to match as the last line of
+        a pattern (e.g., to skip lines that only provide context).
+      offset: the number to add to line numbers in the matches.
+    """
+
+    self.matches = []
+    self._reacts = reacts
+    self._buf = linebuf.Buffer()
+    self._nesting = []
+    self._bound = bound
+    self._offset = offset
+    self._sends = []
+    self._channels = dict(
+        (name, lambda message, name=name: self._sends.append(
+            (name, message)))
+        for name in ('controller', 'terminal'))
+
+  def Feed(self, text, stop=None):
+    """Append complete lines and run the reactions on them.
+
+    Args:
+      text: a unicode string of complete lines (ending with '\\n').
+      stop: optional function that takes the (offset) number of the
+        next line to match and returns whether to stop matching.  It
+        is called every time matching moves on to a later line.
+
+    Returns:
+      Whether stop returned True.
+    """
+
+    buf = self._buf
+    buf.AppendRawData(text)
+    limit = buf.GetBound()-1
+    bound = max(self._bound, buf.baseline)
+    while bound < limit:
+      previous = bound
+      waterline = self._reacts.React(
+          self._nesting, buf, bound+1, self._channels)
+      if waterline < 0:
+        buf.UpdateBaseline(-waterline)
+        self.matches.append((bound+self._offset, self._offset-waterline,
+                             self._sends))
+        self._sends = []
+        bound = buf.baseline
+      else:
+        buf.UpdateBaseline(waterline)
+        bound += 1
+      if stop is not None and bound > previous and stop(bound+self._offset):
+        self._bound = bound
+        return True
+    self._bound = bound
+    return False
+
+  def LineCount(self):
+    return self._buf.GetBound()-2
+
+
+def _Blocks(data, start, end, decoder, size=_BLOCK_SIZE, grow=False):
+  """Decode a range of a file in blocks of complete lines.
+
+  Args:
+    data: the file contents (e.g., an mmap object).
+    start: offset of the start of the range, which must be the start
+      of a line.
+    end: offset of the end of the range, which must be the end of a
+      line or the end of the file.
+    decoder: a session.OutputDecoder object.
+    size: the approximate number of bytes in a block.
+    grow: whether to double the size after each block.
+
+  Yields:
+    Unicode strings that end with '\\n'.  A missing line feed at the
+    end of the file is added.
+  """
+
+  position = start
+  while position < end:
+    finish = min(position+size, end)
+    if finish < end:
+      finish = data.rfind('\n', position, finish)+1
+      if not finish:
+        finish = data.find('\n', position+size, end)+1 or end
+    text = decoder.Decode(data[position:finish], finish == end)
+    if finish == len(data) and data[finish-1] != '\n':
+      text += '\n'
+    yield text
+    position = finish
+    if grow:
+      size *= 2
+
+
+def _Slices(data, count):
+  """Split a file into at most count ranges at line boundaries."""
+
+  size = len(data)
+  cuts = [0]
+  for index in xrange(1, count):
+    newline = data.find('\n', max(size*index//count, cuts[-1]))
+    if newline < 0 or newline+1 >= size:
+      break
+    if newline+1 > cuts[-1]:
+      cuts.append(newline+1)
+  return zip(cuts, cuts[1:]+[size])
+
+
+def _ScanRange(data, start, end, reacts, strip_ansi):
+  """Scan a range of a file as if it were a file of its own.
+
+  Returns:
+    A pair of the list of matches and the number of lines.
+  """
+
+  run = _Run(reacts)
+  for text in _Blocks(data, start, end, session.OutputDecoder(strip_ansi)):
+    run.Feed(text)
+  return run.matches, run.LineCount()
+
+
+def _Stitch(data, start, end, first, exclusion, guess, reacts, strip_ansi):
+  """Correct the matches of a range for matches that cross into it.
+
+  The matches of a range that was scanned on its own (guess) assume
+  that the first line of the range is the first line that matches may
+  use.  Since the configuration is flat, the only state that carries
+  over from the lines before the range is the first line that matches
+  may use (exclusion), which only makes a difference to patterns that
+  end in the first few lines of the range.  This function rescans the
+  range from the earliest line that such patterns may use until its
+  state agrees with the guess, and then takes the rest of the guess.
+
+  Args:
+    data: the file contents.
+    start: offset of the start of the range.
+    end: offset of the end of the range.
+    first: number of the first line of the range.
+    exclusion: the number of the first line that matches may use after
+      all matches before the range.
+    guess: the matches of the range, with line numbers that start at
+      first.
+    reacts: a Matcher object with a flat configuration.
+    strip_ansi: whether to remove terminal escape sequences.
+
+  Returns:
+    The list of matches that end in the range.
+  """
+
+  size = max(r.PatternSize() for r in reacts.Reactives())
+
+  def InSync(bound, rescan_exclusion, guess_exclusion):
+    # Patterns that end at or after bound start at or after floor.
+    floor = bound-size+1
+    return max(rescan_exclusion, floor) == max(guess_exclusion, floor)
+
+  if InSync(first, exclusion, first):
+    return guess
+
+  context = max(exclusion, first-size+1)
+  for unused_line in xrange(first-context):
+    start = data.rfind('\n', 0, start-1)+1
+  run = _Run(reacts, first-context+1, context-1)
+  state = {'index': 0, 'exclusion': first}
+
+  def Stop(bound):
+    index = state['index']
+    while index < len(guess) and guess[index][0] < bound:
+      state['exclusion'] = guess[index][1]
+      index += 1
+    state['index'] = index
+    if run.matches:
+      return InSync(bound, run.matches[-1][1], state['exclusion'])
+    return InSync(bound, exclusion, state['exclusion'])
+
+  for text in _Blocks(data, start, end, session.OutputDecoder(strip_ansi),
+                      4096, True):
+    if run.Feed(text, Stop):
+      return run.matches+guess[state['index']:]
+  return run.matches
+
+
+# The configuration for pool workers, which they inherit on fork.
+_worker_reacts = None
+_worker_strip_ansi = False
+
+
+def _ScanWorker(args):
+  filename, start, end = args
+  with open(filename, 'rb') as f:
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    return _ScanRange(data, start, end, _worker_reacts, _worker_strip_ansi)
+  finally:
+    data.close()
+
+
+def Scan(filename, reacts, strip_ansi=False, jobs=1, slices=None):
+  """Run the reactions on the lines of a file.
+
+  The file is memory-mapped and goes through the reactions one line at
+  a time, in the same way as output from the shell does, except that
+  timers never fire and a missing line feed at the end of the file is
+  added.  If the configuration is flat (see Matcher.IsFlat), the file
+  may be split into slices at line boundaries, which a pool of
+  processes scans in parallel.  Matches that cross slice boundaries
+  are then corrected, so the results are the same as those of a
+  serial scan.  Configurations with nested reactions are always
+  scanned serially, since the nesting state at the start of a slice
+  depends on all earlier lines.
+
+  The matches are produced as the scan goes: those of a serial scan
+  after each block of input, and those of a parallel scan after each
+  slice is corrected, so that callers need not hold all of them.
+
+  Args:
+    filename: name of the file to scan.
+    reacts: a Matcher object that holds the reactions to run through.
+    strip_ansi: whether to remove terminal escape sequences before
+      matching (also enabled by the strip-ansi setting).
+    jobs: the number of processes to scan with.
+    slices: the number of slices to split the file into, or None to
+      split it into one slice per process if it is large enough.
+
+  Returns:
+    An iterator over (line, sends) pairs for the matches in order,
+    where line is the number of the last matched line, and sends is a
+    list of (channel, message) pairs for the messages that the
+    reaction sent.
+
+  Raises:
+    IOError: the file cannot be read.
+  """
+
+  strip_ansi = strip_ansi or 'strip-ansi' in reacts.settings
+  with open(filename, 'rb') as f:
+    if not os.fstat(f.fileno()).st_size:
+      return iter([])
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  return _Matches(filename, data, reacts, strip_ansi, jobs, slices)
+
+
+def _Matches(filename, data, reacts, strip_ansi, jobs, slices):
+  """Generate the matches for Scan and close data when done."""
+
+  global _worker_reacts, _worker_strip_ansi
+
+  pool = None
+  try:
+    if slices is None:
+      slices = max(1, min(jobs, len(data)//_MIN_SLICE_SIZE))
+    if not reacts.IsFlat():
+      slices = 1
+    ranges = _Slices(data, slices)
+
+    if len(ranges) == 1:
+      run = _Run(reacts)
+      for text in _Blocks(data, 0, len(data),
+                          session.OutputDecoder(strip_ansi)):
+        run.Feed(text)
+        for line, unused_exclusion, sends in run.matches:
+          yield line, sends
+        del run.matches[:]
+      return
+
+    if jobs > 1:
+      _worker_reacts, _worker_strip_ansi = reacts, strip_ansi
+      pool = multiprocessing.Pool(min(jobs, len(ranges)))
+      results = pool.imap(_ScanWorker, [(filename, start, end)
+                                        for start, end in ranges], 1)
+    else:
+      results = (_ScanRange(data, start, end, reacts, strip_ansi)
+                 for start, end in ranges)
+
+    exclusion = first = 1
+    for (start, end), (guess, count) in itertools.izip(ranges, results):
+      guess = [(line+first-1, line_exclusion+first-1, sends)
+               for line, line_exclusion, sends in guess]
+      if first > 1:
+        guess = _Stitch(data, start, end, first, exclusion, guess,
+                        reacts, strip_ansi)
+      for line, unused_exclusion, sends in guess:
+        yield line, sends
+      if guess:
+        exclusion = guess[-1][1]
+      first += count
+  finally:
+    if pool is not None:
+      pool.terminate()
+    _worker_reacts = None
+    data.close()
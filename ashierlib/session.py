@@ -0,0 +1,516 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module defines scripted terminal sessions.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import codecs
+import os
+import select
+import signal
+import time
+
+import ansi
+import directive
+import terminal
+
+
+# Seconds that Session.Close gives the controller to exit after SIGTERM
+# before it kills the controller.
+_GRACE_PERIOD = 1.0
+
+
+def React(nesting, buf, reacts, channels, latency=None, arrival=None):
+  """Run through pattern-triggered actions.
+
+  Run through all reactions in last-line-to-match incremental order
+  and update line buffer baseline when buffered lnies are no longer
+  needed.  Messages sent during the run are collected and written to
+  each channel at once (in order) when the run is complete.
+
+  Args:
+    nesting: persistent state to support nested matching.
+      Initialize with a fresh empty mutable list and reuse the same
+      list for subsequent calls.
+    buf: a Buffer object that contains the terminal output to match.
+    reacts: a Matcher object that holds the reactions to run through.
+    channels: dictionary that maps channel names (which are strings)
+      to functions that write a string to the channel (or to
+      directive.Frames objects).
+    latency: optional stats.Latency object to record the response
+      latency of each channel and each matching reaction in.
+    arrival: the time.time() at which the output arrived (required
+      with latency).
+
+  Returns:
+    The number of positive matches.
+  """
+
+  # Send.Send writes to the channels through these functions, which
+  # collect the messages instead of writing each one separately.
+  pending = dict((name, []) for name in channels)
+  collectors = {}
+  for name, write in channels.iteritems():
+    collectors[name] = pending[name].append
+    if isinstance(write, directive.Frames):
+      collectors[name] = directive.Frames(collectors[name])
+  matched = [] if latency is not None else None
+  matches = 0
+
+  # bound points to the line in the buffer that should be matched to
+  # the last line of a pattern.  For example, if bound=335 in a loop
+  # iteration, and the pattern in the Reactive object r has three
+  # lines, then the loop body will try to match the pattern to lines
+  # 333, 334, and 335.  We start with the lowest meaningful bound
+  # value (bound=buf.baseline) and increment it in the outer loop.
+  bound = buf.baseline
+  while bound < buf.GetBound():
+
+    # The matcher tries all reactions in priority order and returns
+    # either the result of the first positive match or the lowest
+    # waterline that any reaction returned.
+    waterline = reacts.React(nesting, buf, bound+1, collectors, matched)
+
+    # A negative waterline means that there was a positive match
+    # that ends at line number -(waterline-1).  In this case we
+    # discard the matched lines by lifting the buffer baseline to
+    # -waterline and update bound accordingly.
+    if waterline < 0:
+      buf.UpdateBaseline(-waterline)
+      bound = buf.baseline
+      matches += 1
+
+    # A positive waterline means that there was no positive match in
+    # the entire outer loop iteration.  It indicates which lines in
+    # the buffer need to be retained because they may contribute to
+    # future matches: waterline=334 means that lines 1-333 can be
+    # dropped because they will never contribute to a positive match.
+    # In this case we drop unneeded lines from the buffer and
+    # increment the bound variable.
+    else:
+      buf.UpdateBaseline(waterline)
+      bound += 1
+
+  for name, messages in pending.iteritems():
+    if messages:
+      start = time.time()
+      write = channels[name]
+      if isinstance(write, directive.Frames):
+        write = write.write
+      try:
+        write(''.join(messages))
+      except OSError:
+        # Silence all exceptions, which are most likely due to a
+        # controller process that decides to exit early.
+        pass
+      if latency is not None:
+        finish = time.time()
+        latency.Record('write '+name, finish-start)
+        latency.Record('response '+name, finish-arrival)
+
+  if matched:
+    finish = time.time()
+    for react in matched:
+      latency.Record('reaction '+react.Location(), finish-arrival)
+  return matches
+
+
+class OutputDecoder(object):
+  """Turn raw child output into the text that the reactions match.
+
+  An OutputDecoder object optionally removes terminal escape sequences
+  and then decodes the output from UTF-8 incrementally, so that an
+  escape sequence or a character may be split across chunks, and
+  invalid bytes become U+FFFD.
+  """
+
+  def __init__(self, strip_ansi):
+    self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    self._filter = None
+    if strip_ansi:
+      self._filter = ansi.EscapeFilter()
+
+  def Decode(self, data, final=False):
+    """Decode the next chunk of output.
+
+    Args:
+      data: a string that contains the next chunk of output.
+      final: whether this is the last chunk of output.
+
+    Returns:
+      A unicode string to append to the line buffer.
+    """
+
+    if self._filter is not None:
+      data = self._filter.Filter(data)
+    return self._decoder.decode(data, final)
+
+
+class Session(object):
+  """A scripted interaction with a child process.
+
+  A Session object connects a child process (which runs in a PTY) with
+  the user terminal and (optionally) with a controller process.  It
+  copies user input and controller output to the child, copies child
+  output to the user, and runs the reactions on the child output.  The
+  reactions see the child output as unicode text (see OutputDecoder),
+  while the copy to the user is unchanged.  Messages to the controller
+  and to the child are encoded in UTF-8.  All I/O goes through an
+  event loop object (e.g., a terminal.IOLoop), which the Session
+  object registers its file descriptors with.  Any number of Session
+  objects can share an event loop and a Matcher object.
+
+  Attributes:
+    cpu_time: processor time (in seconds) spent in the event handlers
+      of the session.
+    peak_buffer: the largest number of bytes retained in the buffer.
+    peak_queued: the largest number of bytes waiting to be written to
+      the child process and to the controller.
+  """
+
+  def __init__(self, loop, reacts, buf, child_fd, control_pid, control_fd,
+               stdin_fd, stdout_fd, on_exit, strip_ansi=False,
+               latency=None, record=None, framed=False, release=None):
+    """Create a Session object and register it with an event loop.
+
+    Args:
+      loop: the event loop to register with.
+      reacts: a Matcher object that holds the reactions to run through.
+      buf: a Buffer object to hold the child output.
+      child_fd: file descriptor of the child PTY.
+      control_pid: process ID of the controller, or None for a session
+        without a controller.
+      control_fd: file descriptor of the controller PTY, or None for a
+        session without a controller.
+      stdin_fd: file descriptor of user input, or None for a session
+        without user input.
+      stdout_fd: file descriptor to copy child output to, or None to
+        discard child output.
+      on_exit: function to call (with no arguments) when the child
+        process exits.
+      strip_ansi: whether to remove terminal escape sequences from
+        the child output before matching (which the configuration can
+        also request with the strip-ansi setting).
+      latency: optional stats.Latency object to record the latency of
+        reading, buffering, and reacting to child output in.
+      record: optional function to call with the source ('child',
+        'controller', or 'stdin') and the data of every chunk of input
+        that the session reads (e.g., recording.Recorder.Record).
+      framed: whether to send messages to the controller as JSON-lines
+        frames (see directive.Frames) instead of as text.
+      release: optional function to call when the session is done with
+        the controller, instead of terminating the controller and
+        closing control_fd (e.g., to return the controller to a
+        pool.ControllerPool).  It takes whether the controller can
+        serve another session.
+    """
+
+    self._loop = loop
+    self._reacts = reacts
+    self._buf = buf
+    self._nesting = []
+    self._child_fd = child_fd
+    self._control_pid = control_pid
+    self._control_fd = control_fd
+    self._stdin_fd = stdin_fd
+    self._stdout_fd = stdout_fd
+    self._on_exit = on_exit
+    self._react_pending = False
+    self._closed = False
+    self._latency = latency
+    self._arrival = None
+    self._last_output = time.time()
+    self._idle_output = None
+    self._idle_waiting = []
+    self._timer_generation = 0
+    self._timer_handles = {}
+    self._decoder = OutputDecoder(
+        strip_ansi or 'strip-ansi' in reacts.settings)
+    self._record = record
+    self._release = release
+    self.cpu_time = 0.0
+    self.peak_buffer = 0
+    self.peak_queued = 0
+
+    for fd in (stdout_fd, child_fd, control_fd):
+      if fd is not None:
+        loop.AddWriter(fd)
+
+    # Stop reading from a process while the process that consumes its
+    # output is not keeping up.  Terminal output that triggers a send
+    # to the controller is throttled by the controller as well.
+    if control_fd is not None:
+      loop.Throttle(control_fd, child_fd)
+      loop.Throttle(child_fd, control_fd)
+    if stdin_fd is not None:
+      loop.Throttle(stdin_fd, child_fd)
+    if stdout_fd is not None:
+      loop.Throttle(child_fd, stdout_fd)
+
+    def Writer(fd):
+      if fd is None:
+        return lambda data: None
+      return lambda data: loop.Write(fd, data)
+
+    def Encoder(fd):
+      if fd is None:
+        return lambda data: None
+      return lambda data: loop.Write(fd, data.encode('utf-8'))
+
+    self._channels = {'controller': Encoder(control_fd),
+                      'terminal': Encoder(child_fd)}
+    if framed:
+      self._channels['controller'] = directive.Frames(
+          self._channels['controller'])
+    self._child_pump = terminal.DataPump(child_fd, Writer(stdout_fd))
+    self._react = self._Timed(self._React)
+
+    if stdin_fd is not None:
+      self._stdin_pump = terminal.DataPump(stdin_fd, Writer(child_fd))
+      loop.AddReader(stdin_fd, self._Timed(self.StdinReady))
+    loop.AddReader(child_fd, self._Timed(self.ChildReady))
+    if control_fd is not None:
+      self._control_pump = terminal.DataPump(control_fd, Writer(child_fd))
+      loop.AddReader(control_fd, self._Timed(self.ControlReady))
+    self._ArmTimers()
+
+  def StdinReady(self, unused_event):
+    """Copy user input to the child process."""
+
+    data = self._stdin_pump.Copy()
+    if data and self._record is not None:
+      self._record('stdin', data)
+    if self._stdin_pump.eof:
+      self._loop.Remove(self._stdin_fd)
+
+  def ChildReady(self, event):
+    """Copy child output to the user and schedule matching."""
+
+    # Event loops that do not report hangups separately signal them
+    # as readable file descriptors that reach the end of file.
+    if event & select.POLLIN:
+      start = time.time()
+      data = self._child_pump.Copy()
+      read = time.time()
+      if data:
+        self._OutputArrived(start)
+        if self._record is not None:
+          self._record('child', data)
+      self._buf.AppendRawData(
+          self._decoder.Decode(data, self._child_pump.eof))
+
+      # Response latency counts from the first read of the output
+      # that the next round of matching processes.
+      if self._arrival is None:
+        self._arrival = start
+      if self._latency is not None:
+        self._latency.Record('read', read-start)
+        self._latency.Record('append', time.time()-read)
+      if not self._react_pending:
+        self._react_pending = True
+        self._loop.CallSoon(self._react)
+    if self._child_pump.eof or not event & select.POLLIN:
+      self.Close()
+
+  def ControlReady(self, event):
+    """Copy controller output to the child process."""
+
+    # On hangup, this is one last attempt to drain controller output
+    data = self._control_pump.Copy()
+    if data and self._record is not None:
+      self._record('controller', data)
+    if self._control_pump.eof or not event & select.POLLIN:
+      self._CloseController()
+
+  def Close(self):
+    """Terminate the controller and release the session resources."""
+
+    if self._closed:
+      return
+    self._closed = True
+    self._CancelTimers()
+    if self._release is None and self._control_pid is not None:
+      try:
+        os.kill(self._control_pid, signal.SIGTERM)
+      except OSError:
+        pass
+    if self._stdout_fd is not None:
+      self._loop.Flush(self._stdout_fd)
+    if self._stdin_fd is not None:
+      self._loop.Remove(self._stdin_fd)
+    self._loop.Remove(self._child_fd)
+    self._CloseController(True)
+    os.close(self._child_fd)
+    if self._release is None and self._control_pid is not None:
+      self._ReapController()
+    self._on_exit()
+
+  def _ReapController(self):
+    """Wait for the terminated controller to exit, killing it if needed."""
+
+    deadline = time.time()+_GRACE_PERIOD
+    while True:
+      try:
+        reaped, unused_status = os.waitpid(self._control_pid, os.WNOHANG)
+      except OSError:
+        return
+      if reaped:
+        return
+      if time.time() >= deadline:
+        break
+      time.sleep(0.01)
+    try:
+      os.kill(self._control_pid, signal.SIGKILL)
+      os.waitpid(self._control_pid, 0)
+    except OSError:
+      pass
+
+  def _CloseController(self, reusable=False):
+    if self._control_fd is not None:
+      # The file descriptor number may be reused once it is closed, so
+      # later sends to the controller must not write to it.
+      self._channels['controller'] = lambda data: None
+      if self._release is not None:
+        self._release(reusable)
+      else:
+        self._loop.Remove(self._control_fd)
+        os.close(self._control_fd)
+      self._control_fd = None
+
+  def _React(self):
+    self._react_pending = False
+    arrival, self._arrival = self._arrival, None
+    if not self._closed:
+      start = time.time()
+      matches = React(self._nesting, self._buf, self._reacts,
+                      self._channels, self._latency, arrival)
+      if matches:
+        self._ArmTimers()
+      if self._latency is not None:
+        self._latency.Record('react', time.time()-start)
+      self.peak_buffer = max(self._buf.RetainedSize(), self.peak_buffer)
+      queued = self._loop.QueuedSize(self._child_fd)
+      if self._control_fd is not None:
+        queued += self._loop.QueuedSize(self._control_fd)
+      self.peak_queued = max(queued, self.peak_queued)
+
+  def _ArmTimers(self, fired=None):
+    """Start the timers that are active in the current nesting state.
+
+    Args:
+      fired: the Reactive object whose timer just fired, if any.
+    """
+
+    # Every match (or timer firing) cancels the pending timers and
+    # starts a new generation, and any timer of an earlier generation
+    # that still expires has no effect.
+    self._CancelTimers()
+    self._timer_generation += 1
+    generation = self._timer_generation
+    self._idle_waiting = []
+    quiet = time.time()-self._last_output
+    for react in self._reacts.Timers(self._nesting):
+      timer = react.Timer()
+      if timer.kind == 'idle':
+        # A fired idle timer waits for the next quiet period.
+        if react is fired:
+          self._idle_waiting.append((react, generation))
+          continue
+        delay = max(0, timer.delay-quiet)
+      else:
+        # A deadline timer fires only once until the next match.
+        if react is fired:
+          continue
+        delay = timer.delay
+      self._CallLater(react, generation, delay)
+
+  def _CallLater(self, react, generation, delay):
+    """Start the timer of a reaction, replacing any pending one."""
+
+    handle = self._timer_handles.get(react)
+    if handle is not None:
+      handle.Cancel()
+    self._timer_handles[react] = self._loop.CallLater(
+        delay, lambda: self._TimerExpired(react, generation))
+
+  def _CancelTimers(self):
+    for handle in self._timer_handles.itervalues():
+      handle.Cancel()
+    self._timer_handles.clear()
+
+  def _OutputArrived(self, now):
+    """Restart the idle timers that wait for the next quiet period."""
+
+    self._last_output = now
+    waiting, self._idle_waiting = self._idle_waiting, []
+    for react, generation in waiting:
+      self._CallLater(react, generation, react.Timer().delay)
+
+  def _TimerExpired(self, react, generation):
+    """Fire a timer unless it is stale or has been postponed.
+
+    Args:
+      react: the Reactive object with the timer.
+      generation: the timer generation the timer was started in.
+    """
+
+    if self._closed or generation != self._timer_generation:
+      return
+    self._timer_handles.pop(react, None)
+    timer = react.Timer()
+    if timer.kind == 'idle':
+      # An idle timer fires only after the output has been quiet for
+      # the entire delay, and only once per quiet period.
+      quiet = time.time()-self._last_output
+      if quiet < timer.delay:
+        self._CallLater(react, generation, timer.delay-quiet)
+        return
+      if self._idle_output == self._last_output:
+        self._idle_waiting.append((react, generation))
+        return
+      self._idle_output = self._last_output
+
+    react.Fire(self._nesting, self._channels)
+    self._ArmTimers(react)
+    # The new nesting state may activate reactions that match output
+    # already in the buffer, and their response latency counts from
+    # the firing of the timer.
+    if self._arrival is None:
+      self._arrival = time.time()
+    if not self._react_pending:
+      self._react_pending = True
+      self._loop.CallSoon(self._react)
+
+  def _Timed(self, handler):
+    """Wrap an event handler to account for its processor time."""
+
+    def TimedHandler(*args):
+      start = time.clock()
+      try:
+        handler(*args)
+      finally:
+        self.cpu_time += time.clock()-start
+    return TimedHandler
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module implements the matching statistics counters and latency
+histograms.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import histogram
+
+
+class Counters(object):
+  """Matching statistics of a Reactive or Pattern object.
+
+  Attributes:
+    location: the file:line identifier of the configuration directive.
+    attempts: number of times the object tried to match.
+    mismatches: number of definite mismatches, which no future output
+      can turn into a match.
+    retries: number of mismatches in the partial line, which the
+      object tries again when more output arrives.
+    hits: number of successful matches.
+    seconds: cumulative time spent matching.
+  """
+
+  def __init__(self, location):
+    self.location = location
+    self.attempts = 0
+    self.mismatches = 0
+    self.retries = 0
+    self.hits = 0
+    self.seconds = 0.0
+
+  def Format(self, indent=''):
+    """Format the counters as a report line."""
+
+    return '%-32s %10d %10d %10d %10d %10.2f' % (
+        indent+self.location, self.attempts, self.mismatches,
+        self.retries, self.hits, self.seconds*1000)
+
+
+class Latency(object):
+  """Latency histograms of named processing stages.
+
+  Stage names identify what the latency measures, e.g., "read" for
+  reading child output, "response controller" for the time from
+  reading child output to writing the resulting messages to the
+  controller, and "reaction FILE:LINE" for the same time for the
+  messages of one reaction.
+  """
+
+  def __init__(self):
+    self._histograms = {}
+
+  def Record(self, name, seconds):
+    """Record the latency of a stage.
+
+    Args:
+      name: the stage name.
+      seconds: the latency (in seconds).
+    """
+
+    hist = self._histograms.get(name)
+    if hist is None:
+      hist = self._histograms[name] = histogram.Histogram()
+    hist.Record(int(seconds*1e6))
+
+  def Format(self):
+    """Format the latency percentiles as report lines."""
+
+    lines = ['%-32s %10s %10s %10s %10s' % (
+        'latency (us)', 'count', 'p50', 'p99', 'max')]
+    for name, hist in sorted(self._histograms.iteritems()):
+      lines.append('%-32s %10d %10d %10d %10d' % (
+          name, hist.count, hist.Percentile(50), hist.Percentile(99),
+          hist.maximum))
+    return lines
+
+
+def Report(reacts, latency=None):
+  """Format the statistics of all reactions.
+
+  The report lists the Reactive objects in descending order of
+  cumulative matching time, each followed by its Pattern objects.
+  Reactive objects that the matcher never tried (e.g., because no line
+  started with their prefix) are left out.  The latency percentiles
+  follow, if there are any.
+
+  Args:
+    reacts: a Matcher object with statistics enabled.
+    latency: a Latency object, or None.
+
+  Returns:
+    The report as a string.
+  """
+
+  lines = ['%-32s %10s %10s %10s %10s %10s' % (
+      'location', 'attempts', 'mismatches', 'retries', 'hits', 'ms')]
+  reactives = [r for r in reacts.Reactives() if r.Stats() is not None]
+  reactives.sort(key=lambda r: r.Stats().seconds, reverse=True)
+  for react in reactives:
+    if react.Stats().attempts:
+      lines.append(react.Stats().Format())
+      for counters in react.PatternStats():
+        lines.append(counters.Format('  '))
+  if latency is not None:
+    lines.append('')
+    lines.extend(latency.Format())
+  return '\n'.join(lines)+'\n'
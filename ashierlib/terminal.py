@@ -28,16 +28,22 @@ This module defines procedures for terminal interaction.
 __author__ = 'cklin@google.com (Chuan-kai Lin)'
 
 import atexit
+import collections
 import errno
 import fcntl
+import io
 import os
 import pty
 import select
 import signal
+import socket
 import sys
 import termios
+import time
 import tty
 
+import timers
+
 
 def SetTerminalRaw(fd, restore=False):
   """Set controlling terminal to raw mode.
@@ -60,6 +66,18 @@ def SetTerminalRaw(fd, restore=False):
   tty.setraw(fd)
 
 
+def CopyWindowSize(master, slave):
+  """Copy window size information from one terminal to another.
+
+  Args:
+    master: file descriptor of the terminal to copy from.
+    slave: file descriptor of the terminal to update.
+  """
+
+  window_size = fcntl.ioctl(master, termios.TIOCGWINSZ, '00000000')
+  fcntl.ioctl(slave, termios.TIOCSWINSZ, window_size)
+
+
 def MatchWindowSize(master, slave):
   """Keep window sizes of two terminals in sync.
 
@@ -76,14 +94,13 @@ def MatchWindowSize(master, slave):
   """
 
   def _CopyWindowSize():
-    window_size = fcntl.ioctl(master, termios.TIOCGWINSZ, '00000000')
-    fcntl.ioctl(slave, termios.TIOCSWINSZ, window_size)
+    CopyWindowSize(master, slave)
     signal.signal(signal.SIGWINCH, lambda s, f: _CopyWindowSize())
 
   _CopyWindowSize()
 
 
-def SpawnPTY(argv):
+def SpawnPTY(argv, env=None):
   """Spawn a process and connect its controlling terminal to a PTY.
 
   Create a new PTY device and spawn a process with the controlling
@@ -91,6 +108,8 @@ def SpawnPTY(argv):
 
   Args:
     argv: arguments (including executable name) for the child process.
+    env: environment for the child process, or None to inherit the
+      environment of the current process.
 
   Returns:
     A pair containing the PID of the child process and the file
@@ -102,7 +121,10 @@ def SpawnPTY(argv):
   (pid, fd) = pty.fork()
   if pid == 0:
     try:
-      os.execvp(argv[0], argv)
+      if env is None:
+        os.execvp(argv[0], argv)
+      else:
+        os.execvpe(argv[0], argv, env)
     except OSError as err:
       print "# Error: cannot execute program '%s'" % argv[0]
       print '# %s\n%s' % (str(err), chr(4))
@@ -110,6 +132,76 @@ def SpawnPTY(argv):
   return (pid, fd)
 
 
+def SpawnSocket(argv, env=None):
+  """Spawn a process with its standard input and output on a socket.
+
+  Create a connected pair of Unix domain sockets and spawn a process
+  with its standard input and output connected to one of them.
+  Unlike a PTY, the socket does not go through a terminal line
+  discipline, so it neither limits the size of lines nor buffers
+  output until the end of a line.
+
+  Args:
+    argv: arguments (including executable name) for the child process.
+    env: environment for the child process, or None to inherit the
+      environment of the current process.
+
+  Returns:
+    A pair containing the PID of the child process and the file
+    descriptor for the other socket.
+  """
+
+  assert argv, 'SpawnSocket: argv is an empty list'
+
+  parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+  pid = os.fork()
+  if pid == 0:
+    try:
+      parent.close()
+      os.dup2(child.fileno(), 0)
+      os.dup2(child.fileno(), 1)
+      child.close()
+      if env is None:
+        os.execvp(argv[0], argv)
+      else:
+        os.execvpe(argv[0], argv, env)
+    except OSError as err:
+      sys.stderr.write("# Error: cannot execute program '%s'\n# %s\n" %
+                       (argv[0], str(err)))
+    finally:
+      os._exit(1)
+  fd = os.dup(parent.fileno())
+  parent.close()
+  child.close()
+  return (pid, fd)
+
+
+def WriteAll(fd, data):
+  """Write all data to a file descriptor.
+
+  Unlike os.write, which may write only part of the data (e.g., when
+  interrupted by a signal or when a non-blocking pipe is full), this
+  function keeps writing until all data has been written.
+
+  Args:
+    fd: file descriptor to write the data to.
+    data: a string or a buffer object (such as a memoryview).
+
+  Raises:
+    OSError: if the write fails.
+  """
+
+  view = memoryview(data)
+  while view:
+    try:
+      view = view[os.write(fd, view):]
+    except OSError as err:
+      if err.errno == errno.EAGAIN:
+        select.select([], [fd], [])
+      elif err.errno != errno.EINTR:
+        raise
+
+
 def CopyData(from_fd, to_fd, size=1024):
   """Copy data from one file descriptor to another.
 
@@ -128,12 +220,405 @@ def CopyData(from_fd, to_fd, size=1024):
   data = ''
   try:
     data = os.read(from_fd, size)
-    os.write(to_fd, data)
+    WriteAll(to_fd, data)
   except OSError:
     pass
   return data
 
 
+class DataPump(object):
+  """Copy data from one file descriptor to another.
+
+  A DataPump object reads data into a single preallocated buffer
+  instead of allocating a new string for every read, and it writes
+  the data out directly from that buffer.  The size of each read
+  adapts to the rate at which data arrives: it doubles (up to a
+  maximum) whenever a read fills the buffer, and it halves (down to a
+  minimum) whenever a read uses less than a quarter of it.
+
+  Attributes:
+    eof: whether a read has reached the end of file.  For the master
+      side of a PTY, this means that the child process has exited.
+  """
+
+  def __init__(self, from_fd, write, min_size=1024, max_size=65536):
+    """Create a DataPump object.
+
+    Args:
+      from_fd: file descriptor to read the data from.
+      write: function that writes a buffer object to the destination
+        (e.g., IOLoop.Write bound to the destination file descriptor).
+      min_size: the minimum number of bytes to read at a time.
+      max_size: the maximum number of bytes to read at a time.
+    """
+
+    self._reader = io.FileIO(from_fd, 'r', closefd=False)
+    self._write = write
+    self._view = memoryview(bytearray(max_size))
+    self._min_size = min_size
+    self._max_size = max_size
+    self._size = min_size
+    self.eof = False
+
+  def Copy(self):
+    """Copy available data.
+
+    Returns:
+      A string that contains the bytes read and copied, which is
+      empty if the read fails or reaches the end of file.
+    """
+
+    try:
+      count = self._reader.readinto(self._view[:self._size])
+    except (IOError, OSError) as err:
+      # Reading from a PTY master whose slave side has been closed
+      # fails with EIO instead of returning an empty string.
+      if err.errno == errno.EIO:
+        self.eof = True
+      return ''
+    if count is None:
+      return ''
+    if not count:
+      self.eof = True
+      return ''
+
+    data = self._view[:count]
+    try:
+      self._write(data)
+    except OSError:
+      pass
+
+    if count == self._size:
+      self._size = min(self._size*2, self._max_size)
+    elif count < self._size/4:
+      self._size = max(self._size/2, self._min_size)
+    return data.tobytes()
+
+
+class IOLoop(object):
+  """Dispatch asynchronous I/O events and buffer outgoing data.
+
+  An IOLoop object waits for data to become available for reading in
+  file descriptors and then invokes the corresponding event handlers.
+  It never blocks in a write: data that a file descriptor cannot
+  accept right away waits in an outbound queue that drains as the file
+  descriptor becomes writable.  To keep the queues bounded, the loop
+  stops reading from a throttled input file descriptor while the
+  queue of the corresponding output file descriptor is above a
+  high-water mark, and resumes once the queue drains to half of it.
+  The loop also runs timers, which it keeps in a timers.TimerWheel.
+  """
+
+  def __init__(self, high_water=1 << 20):
+    """Create an IOLoop object.
+
+    Args:
+      high_water: number of queued bytes for an output file descriptor
+        above which the loop stops reading from its throttled inputs.
+    """
+
+    self._poll = None
+    self._running = False
+    self._pending = []
+    self._timers = timers.TimerWheel(time.time())
+    self._high_water = high_water
+    self._readers = {}
+    self._queues = {}
+    self._queued = {}
+    self._masks = {}
+    self._sources = collections.defaultdict(set)
+    self._paused = collections.defaultdict(set)
+    self._blocking = set()
+
+  def AddReader(self, fd, handler):
+    """Register an event handler for a readable file descriptor.
+
+    Args:
+      fd: file descriptor to monitor.
+      handler: event handler function (which takes event mask as the
+        only argument).
+    """
+
+    self._readers[fd] = handler
+    self._Update(fd)
+
+  def AddWriter(self, fd):
+    """Prepare a file descriptor for buffered writes.
+
+    Switch the file descriptor to non-blocking mode (which is restored
+    on exit) so that writes return as soon as the file descriptor
+    cannot accept more data.  File descriptors that epoll does not
+    support (e.g., regular files) are written synchronously instead.
+    Preparing a file descriptor again keeps its queue.
+
+    Args:
+      fd: file descriptor to write to.
+    """
+
+    if fd in self._queues or fd in self._blocking:
+      return
+    try:
+      probe = select.epoll()
+      probe.register(fd, select.POLLOUT)
+      probe.close()
+    except IOError:
+      self._blocking.add(fd)
+      return
+
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    if not flags & os.O_NONBLOCK:
+      fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+      def Restore():
+        try:
+          fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+        except IOError:
+          pass
+      atexit.register(Restore)
+    self._queues[fd] = collections.deque()
+    self._queued[fd] = 0
+
+  def Throttle(self, source, sink):
+    """Apply back-pressure from an output to an input.
+
+    Args:
+      source: input file descriptor to stop reading from.
+      sink: output file descriptor whose queue controls the input.
+    """
+
+    self._sources[sink].add(source)
+
+  def Remove(self, fd):
+    """Stop monitoring a file descriptor and discard its queue.
+
+    Args:
+      fd: file descriptor to remove.
+    """
+
+    self._readers.pop(fd, None)
+    if fd in self._queues:
+      del self._queues[fd]
+      self._queued[fd] = 0
+      self._Release(fd)
+      del self._queued[fd]
+    # The file descriptor number may be reused once it is closed, so
+    # forget the back-pressure links as well.
+    self._sources.pop(fd, None)
+    self._paused.pop(fd, None)
+    self._blocking.discard(fd)
+    for sources in self._sources.itervalues():
+      sources.discard(fd)
+    for source, sinks in self._paused.items():
+      if fd in sinks:
+        sinks.discard(fd)
+        self._Update(source)
+    old_mask = self._masks.pop(fd, 0)
+    if old_mask:
+      self._Watch(fd, old_mask, 0)
+
+  def Write(self, fd, data):
+    """Write data to a file descriptor without blocking.
+
+    Args:
+      fd: file descriptor to write to, which should have been
+        registered with AddWriter.
+      data: a string or a buffer object (such as a memoryview).
+
+    Raises:
+      OSError: if the write fails for reasons other than the file
+        descriptor being temporarily unable to accept data.
+    """
+
+    if fd not in self._queues:
+      WriteAll(fd, data)
+      return
+
+    queue = self._queues[fd]
+    if not queue:
+      try:
+        count = os.write(fd, data)
+      except OSError as err:
+        if err.errno not in (errno.EAGAIN, errno.EINTR):
+          raise
+        count = 0
+      if count == len(data):
+        return
+      data = memoryview(data)[count:]
+
+    data = memoryview(data).tobytes()
+    queue.append(data)
+    self._queued[fd] += len(data)
+    if self._queued[fd] > self._high_water:
+      for source in self._sources[fd]:
+        self._paused[source].add(fd)
+        self._Update(source)
+    self._Update(fd)
+
+  def QueuedSize(self, fd):
+    """Return the number of bytes waiting to be written to fd."""
+
+    return self._queued.get(fd, 0)
+
+  def Flush(self, fd):
+    """Write all queued data to a file descriptor, blocking if needed.
+
+    Args:
+      fd: file descriptor to flush.
+    """
+
+    queue = self._queues.get(fd)
+    try:
+      while queue:
+        WriteAll(fd, queue.popleft())
+    except OSError:
+      queue.clear()
+    if queue is not None:
+      self._queued[fd] = 0
+      self._Release(fd)
+      self._Update(fd)
+
+  def CallSoon(self, callback):
+    """Run a function once the current round of events is dispatched.
+
+    Args:
+      callback: function to call (with no arguments).
+    """
+
+    self._pending.append(callback)
+
+  def CallLater(self, delay, callback):
+    """Run a function after a delay.
+
+    Args:
+      delay: the delay (in seconds).
+      callback: function to call (with no arguments).
+
+    Returns:
+      An object whose Cancel method cancels the call.
+    """
+
+    return self._timers.Add(time.time()+delay, callback)
+
+  def Run(self):
+    """Dispatch events until an event handler calls Stop."""
+
+    self._running = True
+    while self._running:
+      self.Poll()
+
+  def Stop(self):
+    """Make Run return after the current round of events."""
+
+    self._running = False
+
+  def Poll(self, timeout=-1):
+    """Wait for and dispatch one round of events.
+
+    Args:
+      timeout: maximum time to wait in seconds, or -1 to wait until
+        at least one event arrives.
+    """
+
+    if self._poll is None:
+      self._poll = select.epoll()
+    if self._pending:
+      timeout = 0
+    elif self._timers:
+      wait = self._timers.NextTimeout(time.time())
+      if timeout < 0 or wait < timeout:
+        timeout = wait
+    try:
+      for ready_fd, event in self._poll.poll(timeout):
+        self._Dispatch(ready_fd, event)
+    except (IOError, select.error) as (err, _):
+      if err != errno.EINTR:
+        raise
+
+    if self._timers:
+      for timer in self._timers.Advance(time.time()):
+        timer.callback()
+    pending, self._pending = self._pending, []
+    for callback in pending:
+      callback()
+
+  def _Dispatch(self, fd, event):
+    """Handle an event on a file descriptor."""
+
+    if event & select.POLLOUT and fd in self._queues:
+      self._Drain(fd)
+    if (event & ~select.POLLOUT and fd in self._readers and
+        not self._paused[fd]):
+      self._readers[fd](event)
+
+  def _Drain(self, fd):
+    """Write as much queued data as a file descriptor accepts."""
+
+    queue = self._queues[fd]
+    while queue:
+      try:
+        count = os.write(fd, queue[0])
+      except OSError as err:
+        if err.errno in (errno.EAGAIN, errno.EINTR):
+          break
+        # The reader went away (e.g., the controller process exited),
+        # so the queued data can never be delivered.
+        queue.clear()
+        self._queued[fd] = 0
+        break
+      self._queued[fd] -= count
+      if count < len(queue[0]):
+        queue[0] = queue[0][count:]
+      else:
+        queue.popleft()
+    self._Release(fd)
+    self._Update(fd)
+
+  def _Release(self, fd):
+    """Resume throttled inputs once the queue of fd has drained."""
+
+    if self._queued[fd] <= self._high_water/2:
+      for source in self._sources[fd]:
+        if fd in self._paused[source]:
+          self._paused[source].discard(fd)
+          self._Update(source)
+
+  def _Update(self, fd):
+    """Update the events to monitor for a file descriptor."""
+
+    mask = 0
+    if fd in self._readers and not self._paused[fd]:
+      mask |= select.POLLIN
+    if self._queues.get(fd):
+      mask |= select.POLLOUT
+
+    old_mask = self._masks.get(fd, 0)
+    if mask == old_mask:
+      return
+    self._Watch(fd, old_mask, mask)
+    if mask:
+      self._masks[fd] = mask
+    else:
+      del self._masks[fd]
+
+  def _Watch(self, fd, old_mask, mask):
+    """Change the epoll registration of a file descriptor.
+
+    Args:
+      fd: file descriptor to monitor.
+      old_mask: the events currently monitored (0 for none).
+      mask: the events to monitor from now on (0 for none).
+    """
+
+    # Unlike poll, epoll handles closed file descriptors gracefully.
+    if self._poll is None:
+      self._poll = select.epoll()
+    if not mask:
+      self._poll.unregister(fd)
+    elif not old_mask:
+      self._poll.register(fd, mask)
+    else:
+      self._poll.modify(fd, mask)
+
+
 def AsyncIOLoop(dispatch_dict):
   """Dispatch asynchronous I/O events.
 
@@ -148,16 +633,7 @@ def AsyncIOLoop(dispatch_dict):
     None.
   """
 
-  # Unlike poll, epoll handles closed file descriptors gracefully.
-  po = select.epoll()
-  for fd in dispatch_dict:
-    po.register(fd, select.POLLIN)
-
-  while True:
-    try:
-      for ready_fd, event in po.poll():
-        dispatch_dict[ready_fd](event)
-    except (IOError, select.error) as (err, _):
-      if err != errno.EINTR:
-        raise
-
+  loop = IOLoop()
+  for fd, handler in dispatch_dict.iteritems():
+    loop.AddReader(fd, handler)
+  loop.Run()
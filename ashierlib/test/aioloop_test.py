@@ -0,0 +1,143 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the aioloop module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import os
+import socket
+import threading
+import time
+import unittest
+
+from .. import aioloop
+from .. import linebuf
+from .. import session
+from .. import terminal
+from .matcher_test import CreateMatcher
+from .terminal_test import ReadAll
+
+
+@unittest.skipIf(aioloop.asyncio is None, 'asyncio is not available')
+class TestAsyncioLoop(unittest.TestCase):
+  """Unit tests for aioloop.AsyncioLoop."""
+
+  def testCopy(self):
+    """Test copying data through a write queue until end of file."""
+
+    source_read, source_write = os.pipe()
+    sink_read, sink_write = os.pipe()
+    loop = aioloop.AsyncioLoop(
+        high_water=100000, loop=aioloop.asyncio.new_event_loop())
+    loop.AddWriter(sink_write)
+    loop.Throttle(source_read, sink_write)
+    pump = terminal.DataPump(
+        source_read, lambda data: loop.Write(sink_write, data))
+    def SourceReady(unused_event):
+      pump.Copy()
+      if pump.eof:
+        loop.Remove(source_read)
+        loop.CallSoon(loop.Stop)
+    loop.AddReader(source_read, SourceReady)
+
+    writer = threading.Thread(
+        target=terminal.WriteAll, args=(source_write, 'x'*1000000))
+    output = []
+    reader = threading.Thread(target=ReadAll, args=(sink_read, output))
+    writer.start()
+    reader.start()
+    def CloseSource():
+      writer.join()
+      os.close(source_write)
+    closer = threading.Thread(target=CloseSource)
+    closer.start()
+
+    loop.Run()
+    loop.Flush(sink_write)
+    os.close(sink_write)
+    reader.join()
+    closer.join()
+    loop.loop.close()
+    self.assertEqual(len(''.join(output)), 1000000)
+    os.close(source_read)
+    os.close(sink_read)
+
+  def testPoll(self):
+    """Test dispatching one round of events at a time."""
+
+    read_fd, write_fd = os.pipe()
+    loop = aioloop.AsyncioLoop(loop=aioloop.asyncio.new_event_loop())
+    calls = []
+    loop.AddReader(read_fd, lambda event: calls.append(os.read(read_fd, 4)))
+    start = time.time()
+    loop.Poll(0.05)
+    self.assertTrue(time.time()-start >= 0.05)
+    self.assertEqual(calls, [])
+
+    os.write(write_fd, 'data')
+    loop.Poll()
+    self.assertEqual(calls, ['data'])
+    loop.CallSoon(lambda: calls.append('soon'))
+    loop.Poll()
+    self.assertEqual(calls, ['data', 'soon'])
+    loop.loop.close()
+    os.close(read_fd)
+    os.close(write_fd)
+
+  def testCallLater(self):
+    """Test timers, which wake up an otherwise idle loop."""
+
+    loop = aioloop.AsyncioLoop(loop=aioloop.asyncio.new_event_loop())
+    calls = []
+    loop.CallLater(0.02, lambda: calls.append('second'))
+    loop.CallLater(0.01, lambda: calls.append('first'))
+    loop.CallLater(0.01, lambda: calls.append('canceled')).Cancel()
+    loop.CallLater(0.03, loop.Stop)
+    loop.Run()
+    self.assertEqual(calls, ['first', 'second'])
+    loop.loop.close()
+
+  def testSession(self):
+    """Test a session that runs in an asyncio event loop."""
+
+    reacts = CreateMatcher(['>reply 1010',
+                            '?      .... token',
+                            '!controller "$token"'])
+    loop = aioloop.AsyncioLoop(loop=aioloop.asyncio.new_event_loop())
+    unused_child_pid, child_fd = terminal.SpawnPTY(
+        ['echo', 'reply', '4242'])
+    controller, control = socket.socketpair()
+    session.Session(loop, reacts, linebuf.Buffer(), child_fd, None,
+                    os.dup(control.fileno()), None, None, loop.Stop)
+    control.close()
+    loop.Run()
+    loop.loop.close()
+    self.assertEqual(controller.recv(512), '4242\n')
+
+
+if __name__ == '__main__':
+  unittest.main()
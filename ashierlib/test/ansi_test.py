@@ -0,0 +1,75 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the ansi module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import unittest
+
+from .. import ansi
+
+
+class TestEscapeFilter(unittest.TestCase):
+  """Unit tests for ansi.EscapeFilter."""
+
+  def DoTestFilter(self, data, expected):
+    self.assertEqual(ansi.EscapeFilter().Filter(data), expected)
+
+    # The result must not depend on where the output is split.
+    for split in xrange(len(data)+1):
+      escapes = ansi.EscapeFilter()
+      self.assertEqual(
+          escapes.Filter(data[:split])+escapes.Filter(data[split:]),
+          expected)
+
+  def testFilter(self):
+    self.DoTestFilter('', '')
+    self.DoTestFilter('plain text\r\n', 'plain text\r\n')
+    self.DoTestFilter('\x1b[1;31mred\x1b[0m\r\n', 'red\r\n')
+    self.DoTestFilter('\x1b[2J\x1b[H$ ', '$ ')
+    self.DoTestFilter('\x1b[?25lhidden\x1b[?25h', 'hidden')
+    self.DoTestFilter('\x1b]0;title\x07$ ', '$ ')
+    self.DoTestFilter('\x1b]0;title\x1b\\$ ', '$ ')
+    self.DoTestFilter('\x1bP1$r\x1b\\ok', 'ok')
+    self.DoTestFilter('\x1b(Bascii\x1b=', 'ascii')
+    self.DoTestFilter('a\x1b7b\x1b8c', 'abc')
+    self.DoTestFilter('\x1b[1\r\n;31mx', '\r\nx')
+    self.DoTestFilter('\x1b[1\x18abc', 'abc')
+    self.DoTestFilter('\x1b\x1b[0mabc', 'abc')
+    self.DoTestFilter('\x1b[1\xc3\xa9', '\xa9')
+
+  def testState(self):
+    escapes = ansi.EscapeFilter()
+    self.assertEqual(escapes.Filter('a\x1b]0;long'), 'a')
+    self.assertEqual(escapes.Filter(' title'), '')
+    self.assertEqual(escapes.Filter('\x07b\x1b['), 'b')
+    self.assertEqual(escapes.Filter('0'), '')
+    self.assertEqual(escapes.Filter('mc'), 'c')
+
+
+if __name__ == '__main__':
+  unittest.main()
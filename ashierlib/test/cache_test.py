@@ -0,0 +1,94 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the cache module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import cache
+from .. import linebuf
+from . import matcher_test
+
+
+class TestCache(unittest.TestCase):
+  """Unit tests for the configuration cache."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testComputeKey(self):
+    """Test that the key tracks file names and contents."""
+
+    filename = os.path.join(self.tmpdir, 'test.ahr')
+    with open(filename, 'w') as f:
+      f.write('>Foo\n')
+    key = cache.ComputeKey([filename])
+    self.assertEqual(cache.ComputeKey([filename]), key)
+    self.assertNotEqual(cache.ComputeKey([filename, filename]), key)
+
+    with open(filename, 'w') as f:
+      f.write('>Bar\n')
+    os.utime(filename, (0, 0))
+    self.assertNotEqual(cache.ComputeKey([filename]), key)
+    self.assertEqual(cache.ComputeKey([filename+'.missing']), None)
+
+  def testStoreLoad(self):
+    """Test that a cached Matcher object reacts like the original."""
+
+    cache_dir = os.path.join(self.tmpdir, 'cache')
+    config = matcher_test.TestMatcher.config+['!controller "sent"']
+    match = matcher_test.CreateMatcher(config)
+    cache.Store(cache_dir, 'key', match)
+    loaded = cache.Load(cache_dir, 'key')
+    self.assertEqual(os.listdir(cache_dir), ['key'])
+
+    def Results(reacts):
+      buf = linebuf.Buffer()
+      buf.AppendRawData('Foo bar\nFob\n  ok\n$ ls\n')
+      return [reacts.React([], buf, bound, {})
+              for bound in range(2, buf.GetBound()+1)]
+
+    self.assertEqual(Results(loaded), Results(match))
+    self.assertEqual(cache.Load(cache_dir, 'missing'), None)
+
+  def testDamagedEntry(self):
+    """Test that a damaged cache entry is ignored."""
+
+    with open(os.path.join(self.tmpdir, 'key'), 'w') as f:
+      f.write('garbage')
+    self.assertEqual(cache.Load(self.tmpdir, 'key'), None)
+
+
+if __name__ == '__main__':
+  unittest.main()
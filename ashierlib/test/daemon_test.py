@@ -0,0 +1,162 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the daemon module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import fcntl
+import os
+import shutil
+import signal
+import socket
+import stat
+import tempfile
+import time
+import unittest
+
+from .. import daemon
+
+
+class TestDaemon(unittest.TestCase):
+  """Unit tests for daemon.Serve() and daemon.Connect()."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, 'socket')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def DoServe(self, run):
+    """Start a daemon in a child process and wait for its socket."""
+
+    pid = os.fork()
+    if pid == 0:
+      try:
+        daemon.Serve(self.path, run)
+      finally:
+        os._exit(0)
+    for unused_attempt in xrange(100):
+      if os.path.exists(self.path):
+        break
+      time.sleep(0.05)
+    return pid
+
+  def DoStop(self, pid):
+    os.kill(pid, signal.SIGTERM)
+    os.waitpid(pid, 0)
+    self.assertFalse(os.path.exists(self.path))
+
+  def testSession(self):
+    """Test that a worker runs in the environment of the client."""
+
+    def Run(args, unused_client_fd):
+      with open('session', 'w') as f:
+        f.write('%s %s' % (' '.join(args), os.environ['ASHIER_TEST']))
+      return 7
+
+    pid = self.DoServe(Run)
+    cwd = os.getcwd()
+    os.environ['ASHIER_TEST'] = 'env'
+    try:
+      os.chdir(self.tmpdir)
+      for index in xrange(3):
+        self.assertEqual(daemon.Connect(self.path, ['ctl', str(index)]), 7)
+        with open('session') as f:
+          self.assertEqual(f.read(), 'ctl %d env' % index)
+    finally:
+      del os.environ['ASHIER_TEST']
+      os.chdir(cwd)
+    self.DoStop(pid)
+
+  def testBytes(self):
+    """Test arguments, directories, and variables that are not ASCII."""
+
+    def Run(args, unused_client_fd):
+      with open('session', 'w') as f:
+        f.write('%s %s %s' % (' '.join(args), os.getcwd(),
+                              os.environ['ASHIER_TEST']))
+      return 0
+
+    pid = self.DoServe(Run)
+    cwd = os.getcwd()
+    directory = os.path.join(self.tmpdir, 'd\xe9')
+    os.mkdir(directory)
+    try:
+      os.chdir(directory)
+      for value in ('caf\xc3\xa9', 'caf\xe9'):
+        os.environ['ASHIER_TEST'] = value
+        self.assertEqual(daemon.Connect(self.path, ['\xff']), 0)
+        with open('session') as f:
+          self.assertEqual(f.read(), '\xff %s %s' % (directory, value))
+    finally:
+      del os.environ['ASHIER_TEST']
+      os.chdir(cwd)
+    self.DoStop(pid)
+
+  def testFlags(self):
+    """Test that the client restores the standard file status flags."""
+
+    def Run(unused_args, unused_client_fd):
+      for fd in (0, 1, 2):
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+      return 0
+
+    pid = self.DoServe(Run)
+    flags = [fcntl.fcntl(fd, fcntl.F_GETFL) for fd in (0, 1, 2)]
+    self.assertEqual(daemon.Connect(self.path, []), 0)
+    self.assertEqual([fcntl.fcntl(fd, fcntl.F_GETFL) for fd in (0, 1, 2)],
+                     flags)
+    self.DoStop(pid)
+
+  def testExit(self):
+    """Test the exit status of a worker that calls sys.exit."""
+
+    def Run(unused_args, unused_client_fd):
+      raise SystemExit(252)
+
+    pid = self.DoServe(Run)
+    self.assertEqual(daemon.Connect(self.path, []), 252)
+    self.DoStop(pid)
+
+  def testPermissions(self):
+    """Test that only the owner of the daemon can connect to it."""
+
+    pid = self.DoServe(lambda unused_args, unused_client_fd: 0)
+    self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0600)
+    self.DoStop(pid)
+
+  def testNoDaemon(self):
+    """Test connecting to a socket that nobody listens on."""
+
+    self.assertRaises(socket.error, daemon.Connect, self.path, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
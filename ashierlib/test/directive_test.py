@@ -28,12 +28,44 @@ This module contains unit tests for the directive module.
 __author__ = 'cklin@google.com (Chuan-kai Lin)'
 
 
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 from .. import directive
 from .. import utils
 
 
+class TestCreateLines(unittest.TestCase):
+  """Unit tests for directive.CreateLines()."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def DoTestCreateLines(self, data, contents, error):
+    utils._error_messages = []
+    filename = os.path.join(self.tmpdir, 'test.ahr')
+    with open(filename, 'w') as f:
+      f.write(data)
+    lines = directive.CreateLines(filename)
+    self.assertEqual([l.content for l in lines], contents)
+    self.assertTrue(all(isinstance(l.content, unicode) for l in lines))
+    self.assertEqual(utils._error_messages != [], error)
+
+  def testCreateLines(self):
+    """Test reading configuration files as UTF-8 text."""
+
+    self.DoTestCreateLines('>a\n!terminal "b"\n',
+                           [u'>a\n', u'!terminal "b"\n'], False)
+    self.DoTestCreateLines('>h\xc3\xa9\n', [u'>h\xe9\n'], False)
+    self.DoTestCreateLines('>h\xe9\n', [u'>h\ufffd\n'], True)
+
+
 class TestLine(unittest.TestCase):
   """Unit tests for directive.Line."""
 
@@ -100,6 +132,12 @@ class TestParseDirective(unittest.TestCase):
     self.DoTestParseError('? . name /regex')
     self.DoTestParseError('!')
     self.DoTestParseError('! "string"')
+    self.DoTestParseError('%')
+    self.DoTestParseError('@')
+    self.DoTestParseError('@idle')
+    self.DoTestParseError('@idle 1.5')
+    self.DoTestParseError('@sleep 100')
+    self.DoTestParseError('%strip-colors')
 
   def DoTestParseTemplate(self, content, sample):
     utils._error_messages = []
@@ -156,6 +194,34 @@ class TestParseDirective(unittest.TestCase):
     self.DoTestParseSend('! controller "ab c"', 'controller', 'ab c')
     self.DoTestParseSend('! controller "a "bc""', 'controller', 'a "bc"')
 
+  def DoTestParseTimer(self, content, kind, delay):
+    utils._error_messages = []
+    line = directive.Line('fn', 7, content)
+    result = directive.ParseDirective(line)
+    self.assertTrue(isinstance(result, directive.Timer))
+    self.assertEqual((result.kind, result.delay), (kind, delay))
+    self.assertEqual(utils._error_messages, [])
+
+  def testParseTimer(self):
+    """Test Timer directive parsing."""
+
+    self.DoTestParseTimer('@idle 500', 'idle', 0.5)
+    self.DoTestParseTimer(' @ deadline 2000 ', 'deadline', 2.0)
+
+  def DoTestParseSetting(self, content, name):
+    utils._error_messages = []
+    line = directive.Line('fn', 7, content)
+    result = directive.ParseDirective(line)
+    self.assertTrue(isinstance(result, directive.Setting))
+    self.assertEqual(result.name, name)
+    self.assertEqual(utils._error_messages, [])
+
+  def testParseSetting(self):
+    """Test Setting directive parsing."""
+
+    self.DoTestParseSetting('%strip-ansi', 'strip-ansi')
+    self.DoTestParseSetting(' % strip-ansi ', 'strip-ansi')
+
 
 class TestTemplate(unittest.TestCase):
   """Unit tests for directive.Template."""
@@ -219,6 +285,7 @@ class TestMarker(unittest.TestCase):
     self.DoTestInferRegex('abc', 0, 3, '.+')
     self.DoTestInferRegex('abc def', 0, 3, r'[^\s]+')
     self.DoTestInferRegex('abc  def', 0, 3, r'[^\s]+')
+    self.DoTestInferRegex(u'foo\xa0bar', 0, 3, u'[^\xa0]+')
 
   def DoTestInferRegexError(self, sample, start, finish):
     self.DoSetup(sample, start, finish)
@@ -281,6 +348,27 @@ class TestSend(unittest.TestCase):
     self.DoTestExpandVariables('', dict(), '')
     self.DoTestExpandVariables(
         'abc $foo def', {'foo': 'bar'}, 'abc bar def')
+    self.DoTestExpandVariables(
+        '$a$b $$a', {'a': '1', 'b': '2'}, '12 $1')
+    self.DoTestExpandVariables('no variables', {'a': '1'}, 'no variables')
+
+  def testFrames(self):
+    """Test sending messages as frames."""
+
+    send = self.DoSetup('controller', 'got $a')
+    written = []
+    channels = {'controller': directive.Frames(written.append)}
+    send.Send(channels, {'a': 'x\ny', 'b': u'\xe9'}, 'fn:3')
+    self.assertEqual(len(written), 1)
+    self.assertTrue(written[0].endswith('\n'))
+    self.assertEqual(written[0].count('\n'), 1)
+    self.assertEqual(json.loads(written[0]),
+                     {'reaction': 'fn:3', 'message': 'got x\ny',
+                      'bindings': {'a': 'x\ny', 'b': u'\xe9'}})
+
+    channels = {'controller': written.append}
+    send.Send(channels, {'a': '1'}, 'fn:3')
+    self.assertEqual(written[1], 'got 1\n')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the histogram module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import random
+import unittest
+
+from .. import histogram
+
+
+class TestHistogram(unittest.TestCase):
+  """Unit tests for histogram.Histogram."""
+
+  def testBuckets(self):
+    """Test that buckets cover all values without overlap."""
+
+    hist = histogram.Histogram(bits=4)
+    previous = -1
+    for value in xrange(5000):
+      index = hist._Index(value)
+      self.assertTrue(hist._HighestEquivalent(index) >= value)
+      if index > 0:
+        self.assertTrue(hist._HighestEquivalent(index-1) < value)
+      self.assertTrue(index in (previous, previous+1))
+      previous = index
+
+  def testPercentile(self):
+    """Test percentiles against exact order statistics."""
+
+    hist = histogram.Histogram()
+    self.assertEqual(hist.Percentile(50), 0)
+
+    random.seed(2011)
+    values = [int(random.expovariate(1e-4)) for _ in xrange(10000)]
+    for value in values:
+      hist.Record(value)
+    values.sort()
+    self.assertEqual(hist.count, len(values))
+    self.assertEqual(hist.maximum, values[-1])
+    self.assertEqual(hist.Percentile(100), values[-1])
+    self.assertEqual(hist.Percentile(0), values[0])
+    for percent in (1, 50, 90, 99, 99.9):
+      exact = values[int(-(-len(values)*percent//100))-1]
+      estimate = hist.Percentile(percent)
+      self.assertTrue(exact <= estimate <= exact*(1+2.0**-6))
+
+  def testSmallValues(self):
+    """Test that small values are counted exactly."""
+
+    hist = histogram.Histogram()
+    for value in [3, 1, 4, 1, 5, 9, 2, 6]:
+      hist.Record(value)
+    self.assertEqual([hist.Percentile(p) for p in (25, 50, 75, 100)],
+                     [1, 3, 5, 9])
+
+  def testNegativeValues(self):
+    """Test that negative values count as 0."""
+
+    hist = histogram.Histogram()
+    for value in [-5, -1000000, 7]:
+      hist.Record(value)
+    self.assertEqual(hist.count, 3)
+    self.assertEqual(hist.maximum, 7)
+    self.assertEqual([hist.Percentile(p) for p in (50, 100)], [0, 7])
+
+
+if __name__ == '__main__':
+  unittest.main()
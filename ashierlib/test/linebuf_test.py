@@ -85,6 +85,102 @@ class TestBuffer(unittest.TestCase):
     buf.AppendRawData('\r\r')
     self.assertEqual(buf.GetBound(), 5)
 
+  def testPartialMemo(self):
+    """Tests for Buffer.partial_memo.
+
+    Buffer.partial_memo should survive data appended to the partial
+    line and be reset when the partial line is completed.
+    """
+
+    buf = linebuf.Buffer()
+    buf.AppendRawData('abc')
+    buf.partial_memo['key'] = 3
+    buf.AppendRawData('def')
+    self.assertEqual(buf.partial_memo, {'key': 3})
+    buf.AppendRawData('\nghi')
+    self.assertEqual(buf.partial_memo, {})
+
+  def testLongBacklog(self):
+    """Tests for Buffer with many buffered lines.
+
+    Line numbering should remain consistent when the buffer drops a
+    large number of lines in small steps, which exercises the
+    internal compaction of the line storage.
+    """
+
+    buf = linebuf.Buffer()
+    buf.AppendRawData(''.join('%d\n' % n for n in range(1, 5001)))
+    self.assertEqual(buf.GetBound(), 5002)
+    while buf.baseline+7 < buf.GetBound():
+      buf.UpdateBaseline(buf.baseline+7)
+      self.assertEqual(buf.GetLine(buf.baseline), str(buf.baseline))
+      buf.AppendRawData('%d\n' % (buf.GetBound()-1))
+    self.assertEqual(buf.GetLine(buf.GetBound()-1), '')
+
+  def testRetention(self):
+    """Tests for Buffer retention limits.
+
+    A Buffer object with retention limits should evict its earliest
+    completed lines (and count them) when new data exceeds the limits,
+    but it should never evict the partial line.
+    """
+
+    buf = linebuf.Buffer(max_lines=3)
+    buf.AppendRawData('a\nb\nc\nd\ne')
+    self.assertEqual(buf.baseline, 2)
+    self.assertEqual(buf.evicted, 1)
+    self.assertEqual(buf.GetLine(2), 'b')
+    buf.AppendRawData('\nf\n')
+    self.assertEqual(buf.baseline, 4)
+    self.assertEqual(buf.evicted, 3)
+
+    buf = linebuf.Buffer(max_bytes=5)
+    buf.AppendRawData('abc\nde\nfg\n')
+    self.assertEqual(buf.baseline, 2)
+    self.assertEqual(buf.RetainedSize(), 4)
+    buf.AppendRawData('long partial line')
+    self.assertEqual(buf.baseline, 2)
+    self.assertEqual(buf.GetLine(4), ' line')
+    buf.AppendRawData('\nhi')
+    self.assertEqual(buf.baseline, 4)
+    self.assertEqual(buf.GetLine(4), ' line')
+    self.assertEqual(buf.GetLine(5), 'hi')
+    self.assertEqual(buf.evicted, 3)
+
+  def testPartialRetention(self):
+    """Test that the size limit also applies to the partial line."""
+
+    buf = linebuf.Buffer(max_bytes=100)
+    buf.AppendRawData('start\n')
+    buf.partial_memo['pattern'] = 0
+    for index in xrange(10000):
+      buf.AppendRawData('\r%5d%%' % index)
+    self.assertEqual(len(buf.GetLine(2)), 100)
+    self.assertTrue(buf.GetLine(2).endswith('\r 9999%'))
+    self.assertEqual(buf.partial_memo, {})
+    buf.AppendRawData('\n'+'x'*1000)
+    self.assertEqual(buf.GetLine(buf.GetBound()-1), 'x'*100)
+    self.assertTrue(buf.RetainedSize() <= 100)
+
+  def testRetainedSize(self):
+    """Tests for Buffer.RetainedSize().
+
+    Buffer.RetainedSize() should always equal the total length of the
+    completed lines that Buffer.GetLine() can retrieve.
+    """
+
+    random.seed(4004)
+    buf = linebuf.Buffer(max_lines=20, max_bytes=50)
+    for unused_count in range(1000):
+      buf.AppendRawData(random.choice(['a', 'bc\n', 'd\r\ne', '\n']))
+      if random.random() < 0.3:
+        buf.UpdateBaseline(random.randint(buf.baseline, buf.GetBound()))
+      completed = range(buf.baseline, buf.GetBound()-1)
+      self.assertEqual(buf.RetainedSize(),
+                       sum(len(buf.GetLine(n)) for n in completed))
+      self.assertTrue(len(completed) <= 20)
+      self.assertTrue(buf.RetainedSize() <= 50)
+
   def testFragmentation(self):
     """Tests for Buffer input fragmentation handling.
 
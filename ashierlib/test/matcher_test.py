@@ -0,0 +1,257 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the matcher module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import random
+import re
+import unittest
+
+from .. import directive
+from .. import linebuf
+from .. import matcher
+from .. import reactive
+from .. import utils
+
+
+def CreateMatcher(config):
+  """Create a Matcher object from a list of configuration lines."""
+
+  utils._error_messages = []
+  directives = []
+  for lineno, content in enumerate(config):
+    line = directive.Line('fn', lineno+1, content)
+    directives.append(directive.ParseDirective(line))
+  nesting = []
+  reacts = [reactive.Reactive(nesting, g)
+            for g in utils.SplitNone(directives)]
+  return matcher.Matcher(reacts)
+
+
+def ReferenceReact(reacts, nesting, buf, bound, channels):
+  """Try each Reactive object in turn, without the prefix trie."""
+
+  next_baseline = buf.GetBound()
+  for r in reacts:
+    waterline = r.React(nesting, buf, bound, channels)
+    if waterline < 0:
+      return waterline
+    next_baseline = min(waterline, next_baseline)
+  return next_baseline
+
+
+class TestMatcher(unittest.TestCase):
+  """Unit tests for matcher.Matcher."""
+
+  config = ['>Foo bar',
+            '',
+            '>Foo',
+            '>Bar',
+            '',
+            '>Fob',
+            '?  .',
+            '',
+            '>$ ls',
+            '',
+            '  >total 0',
+            '',
+            '>',
+            '>$ ',
+            '',
+            '>12: done ok',
+            '?.. count']
+
+  def testCandidates(self):
+    """Test candidate selection by last-line prefix."""
+
+    match = CreateMatcher(self.config)
+    self.assertEqual(utils._error_messages, [])
+    reacts = match.Reactives()
+
+    def Prefixes(line):
+      return sorted(reacts[i].Prefix() for i in match.Candidates(line))
+
+    self.assertEqual(Prefixes('Foo bar'), ['Fo', 'Foo'])
+    self.assertEqual(Prefixes('Fob'), ['Fo'])
+    self.assertEqual(Prefixes('F'), [])
+    self.assertEqual(Prefixes('Bar'), ['Bar'])
+    self.assertEqual(Prefixes('$ echo'), ['$', '$'])
+    self.assertEqual(Prefixes('total 0'), ['total'])
+    self.assertEqual(Prefixes('Foo done'), ['', 'Fo', 'Foo'])
+    self.assertEqual(Prefixes('3 don'), [])
+
+  def testAlternationRegex(self):
+    """Test the regex that finds any of a set of strings."""
+
+    keys = ['abc', 'abd', 'ab', 'b.d', 'xyz', 'xy*']
+    self.assertEqual(matcher._AlternationRegex(keys[:2]), r'ab(?:c|d)')
+    regex = re.compile(matcher._AlternationRegex(keys))
+    random.seed(2011)
+    for unused_count in range(1000):
+      text = ''.join(random.choice('abdxyz.*') for _ in range(6))
+      self.assertEqual(regex.search(text) is not None,
+                       any(key in text for key in keys))
+
+  def testPriority(self):
+    """Test that longer patterns take priority."""
+
+    match = CreateMatcher(self.config)
+    sizes = [r.PatternSize() for r in match.Reactives()]
+    self.assertEqual(sizes, sorted(sizes, reverse=True))
+
+  def testMissingLine(self):
+    """Test matching when the last line is below the baseline."""
+
+    buf = linebuf.Buffer()
+    buf.AppendRawData('a\nb\nc')
+    buf.UpdateBaseline(3)
+    match = CreateMatcher(self.config)
+    self.assertEqual(match.React([], buf, 2, {}), 3)
+    match = CreateMatcher(['>Foo', '', '  >Bar'])
+    inactive = matcher.Matcher(match.Reactives()[1:])
+    self.assertEqual(inactive.React([(0, 9)], buf, 2, {}), 4)
+    match = CreateMatcher([])
+    self.assertEqual(match.React([], buf, 2, {}), 4)
+
+  def DoTestEquivalence(self, config, words):
+    match = CreateMatcher(config)
+    self.assertEqual(utils._error_messages, [])
+    random.seed(2011)
+
+    for unused_count in range(200):
+      text = ''.join(random.choice(words) for _ in range(30))
+      buf1, buf2 = linebuf.Buffer(), linebuf.Buffer()
+      nesting1, nesting2 = [], []
+      while text:
+        take = random.randint(1, 6)
+        buf1.AppendRawData(text[:take])
+        buf2.AppendRawData(text[:take])
+        text = text[take:]
+        for bound in range(buf1.baseline+1, buf1.GetBound()+1):
+          result1 = match.React(nesting1, buf1, bound, {})
+          result2 = ReferenceReact(
+              match.Reactives(), nesting2, buf2, bound, {})
+          self.assertEqual(result1, result2)
+          self.assertEqual(nesting1, nesting2)
+          if result1 < 0:
+            buf1.UpdateBaseline(-result1)
+            buf2.UpdateBaseline(-result2)
+            break
+
+  def testReferenceEquivalence(self):
+    """Test Matcher.React against trying each Reactive in turn.
+
+    Feed random terminal output into two buffers in random fragments,
+    and check that Matcher.React and the reference implementation
+    return the same values and leave the same nesting state.
+    """
+
+    self.DoTestEquivalence(
+        self.config,
+        ['Foo', 'Fob', 'Bar', 'bar', '$', 'ls', 'total', '0', ' ',
+         '12:', 'done', 'ok', '\n', '\n', '\r\n'])
+
+  def testNestedEquivalence(self):
+    """Test Matcher.React with deeply nested reactions."""
+
+    self.DoTestEquivalence(
+        ['>start',
+         '',
+         '  >a 1',
+         '',
+         '    >b 2',
+         '',
+         '      >x',
+         '',
+         '  >c 3',
+         '',
+         '>stop',
+         '',
+         '  >b 2',
+         '  >c 3',
+         '',
+         '    >x',
+         '',
+         '  >x'],
+        ['start', 'stop', 'a 1', 'b 2', 'c 3', 'x', ' ', '\n', '\n'])
+
+  def testActive(self):
+    """Test the active Reactive objects in each nesting state."""
+
+    match = CreateMatcher(['>a', '', '  >b', '', '    >c', '', '  >d',
+                           '', '>e'])
+    def Active(nesting):
+      reacts = match.Reactives()
+      return sorted(reacts[i].Prefix() for i in match.Active(nesting)[0])
+
+    self.assertEqual(Active([]), ['a', 'e'])
+    self.assertEqual(Active([(0, 1)]), ['a', 'b', 'd', 'e'])
+    self.assertEqual(Active([(0, 1), (2, 3)]), ['a', 'b', 'c', 'd', 'e'])
+    self.assertEqual(Active([(0, 1), (2, 3), (4, 5)]),
+                     ['a', 'b', 'c', 'd', 'e'])
+    self.assertEqual(Active([(0, 1), (2, 7)]), ['a', 'b', 'd', 'e'])
+    self.assertEqual(Active([(0, 9)]), ['a', 'e'])
+
+  def testTimers(self):
+    """Test the active timers in each nesting state."""
+
+    match = CreateMatcher(['@idle 100', '!controller "idle"', '',
+                           '>a', '',
+                           '  @deadline 200', '  !controller "late"', '',
+                           '    >b'])
+    self.assertEqual(utils._error_messages, [])
+    self.assertEqual(len(match.Reactives()), 2)
+    def Timers(nesting):
+      return [(r.Timer().kind, r.Timer().delay)
+              for r in match.Timers(nesting)]
+
+    self.assertEqual(Timers([]), [('idle', 0.1)])
+    self.assertEqual(Timers([(0, 4)]), [('idle', 0.1), ('deadline', 0.2)])
+
+    # Firing the deadline timer activates the nested reaction.
+    nesting = [(0, 4)]
+    sent = []
+    match.Timers(nesting)[1].Fire(nesting, {'controller': sent.append})
+    self.assertEqual(sent, ['late\n'])
+    self.assertEqual(nesting, [(0, 4), (2, 6)])
+    reacts = match.Reactives()
+    self.assertEqual(
+        sorted(reacts[i].Prefix() for i in match.Active(nesting)[0]),
+        ['a', 'b'])
+
+  def testTimerErrors(self):
+    """Test timer groups with templates."""
+
+    CreateMatcher(['@idle 100', '>a'])
+    self.assertNotEqual(utils._error_messages, [])
+    CreateMatcher(['>a', '@idle 100'])
+    self.assertNotEqual(utils._error_messages, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the pool module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import json
+import os
+import select
+import errno
+import signal
+import time
+import unittest
+
+from .. import pool
+from .. import terminal
+
+
+class TestControllerPool(unittest.TestCase):
+  """Unit tests for pool.ControllerPool."""
+
+  def DoRead(self, fd, count):
+    """Read count frames that a cat(1) controller echoes back."""
+
+    data = ''
+    while data.count('\n') < count:
+      select.select([fd], [], [], 5)
+      data += os.read(fd, 4096)
+    return [json.loads(line) for line in data.splitlines()]
+
+  def testReuse(self):
+    """Test that sessions take turns to use a controller."""
+
+    loop = terminal.IOLoop()
+    controllers = pool.ControllerPool(loop, ['cat'], 1)
+    acquired = []
+    controllers.Acquire(0, acquired.append)
+    controllers.Acquire(1, acquired.append)
+    self.assertEqual(len(acquired), 1)
+    first = acquired[0]
+    self.assertEqual(first.session_number, 0)
+    self.assertEqual(self.DoRead(first.fd, 1),
+                     [{'event': 'start', 'session': 0}])
+
+    controllers.Release(first, True)
+    self.assertEqual(len(acquired), 2)
+    self.assertEqual(acquired[1].pid, first.pid)
+    self.assertEqual(acquired[1].session_number, 1)
+    self.assertEqual(self.DoRead(first.fd, 2),
+                     [{'event': 'end', 'session': 0},
+                      {'event': 'start', 'session': 1}])
+    controllers.Close()
+
+  def testReplace(self):
+    """Test that controllers that exit are replaced."""
+
+    loop = terminal.IOLoop()
+    controllers = pool.ControllerPool(loop, ['cat'], 1)
+    acquired = []
+    controllers.Acquire(0, acquired.append)
+    controllers.Release(acquired[0], False)
+    controllers.Acquire(1, acquired.append)
+    self.assertNotEqual(acquired[1].pid, acquired[0].pid)
+
+    # An idle controller that exits is replaced once the loop sees its
+    # socket close.
+    controllers.Release(acquired[1], True)
+    os.kill(acquired[1].pid, signal.SIGTERM)
+    os.waitpid(acquired[1].pid, 0)
+    loop.Poll(5000)
+    controllers.Acquire(2, acquired.append)
+    self.assertNotEqual(acquired[2].pid, acquired[1].pid)
+    controllers.Close()
+
+    # Close collects the exit status of every controller.
+    for controller in acquired:
+      try:
+        os.waitpid(controller.pid, os.WNOHANG)
+      except OSError as err:
+        self.assertEqual(err.errno, errno.ECHILD)
+      else:
+        self.fail('controller %d was not reaped' % controller.pid)
+
+  def testQuickExit(self):
+    """Test that controllers that cannot start are replaced slowly."""
+
+    loop = terminal.IOLoop()
+    spawned = []
+    spawn_socket = terminal.SpawnSocket
+    def SpawnSocket(argv):
+      spawned.append(argv)
+      return spawn_socket(argv)
+    terminal.SpawnSocket = SpawnSocket
+    try:
+      controllers = pool.ControllerPool(
+          loop, ['/nonexistent/controller'], 1)
+      finish = time.time()+1
+      while time.time() < finish:
+        loop.Poll(finish-time.time())
+      controllers.Close()
+    finally:
+      terminal.SpawnSocket = spawn_socket
+    # The delays (0.1, 0.2, and 0.4 seconds) allow three replacements.
+    self.assertTrue(2 <= len(spawned) <= 5, len(spawned))
+
+
+if __name__ == '__main__':
+  unittest.main()
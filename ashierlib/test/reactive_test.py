@@ -28,6 +28,8 @@ This module contains unit tests for the directive module.
 __author__ = 'cklin@google.com (Chuan-kai Lin)'
 
 
+import random
+import re
 import unittest
 
 from .. import directive
@@ -70,6 +72,23 @@ class TestPattern(unittest.TestCase):
                     r'([^:]+)\:\s+([^/]+)\/(.+)',
                     ['title', None, 'end'])
 
+  def testUnicode(self):
+    """Test that markers line up with characters in unicode text."""
+
+    pattern = self.DoSetup(u'h\xe9llo w\xf6rld', [(6, 11, 'who')])
+    bindings = {}
+    self.assertTrue(pattern.Match(u'h\xe9llo w\xf6rld', bindings))
+    self.assertEqual(bindings, {'who': u'w\xf6rld'})
+
+  def testUnicodeSpace(self):
+    """Test that a no-break space is literal text, not whitespace."""
+
+    pattern = self.DoSetup(u'a\xa0b c', [])
+    self.assertEqual(pattern.prefix, u'a\xa0b')
+    self.assertEqual(pattern.literals, [u'a\xa0b', u'c'])
+    self.assertTrue(pattern.Match(u'a\xa0b  c', {}))
+    self.assertFalse(pattern.Match(u'a b c', {}))
+
   def DoTestInitError(self, sample, marks):
     self.DoSetup(sample, marks)
     self.assertNotEqual(utils._error_messages, [])
@@ -91,6 +110,168 @@ class TestPattern(unittest.TestCase):
     self.DoTestInitError(
         'abc:  ef/123', [(0, 3, 'title'), (5, 8, None)])
 
+  def testMatchMemo(self):
+    """Test incremental matching of a growing string.
+
+    Matching successive extensions of a string with a memo should give
+    the same results as matching each string from scratch, and the
+    memo should record how much of the string has been ruled out.
+    """
+
+    pattern = self.DoSetup('get abc done', [(4, 7, 'file')])
+    text = 'get file.tar.gz' + ' '*20 + 'don'
+    memo = dict()
+    for end in range(len(text)+1):
+      self.assertEqual(pattern.Match(text[:end], {}, memo),
+                       pattern.Match(text[:end], {}))
+    self.assertEqual(memo[pattern], len(text))
+    for suffix in ['e', 'e 100%']:
+      bindings = dict()
+      self.assertTrue(pattern.Match(text+suffix, bindings, dict(memo)))
+      self.assertEqual(bindings, {'file': 'file.tar.gz'})
+
+  def testLiteralPrefilter(self):
+    """Test that the literal prefilter agrees with the regex.
+
+    Match random edits of the template text, and check that Match
+    gives the same results as the regex alone.
+    """
+
+    pieces = ['abc', ':', ' ', '  ', 'def', '/', '12', 'x', '']
+    random.seed(2011)
+    for sample, marks in [
+        ('abc: def/12', [(5, 8, 'name')]),
+        ('abc: def/12', [(0, 3, 'title'), (9, 11, 'end')]),
+        ('  abc def', [(6, 9, 'name')])]:
+      pattern = self.DoSetup(sample, marks)
+      regex = re.compile(pattern.pattern)
+      matches = 0
+      for unused_count in range(2000):
+        text = sample
+        for unused_edit in range(random.randint(0, 2)):
+          index = random.randint(0, len(text))
+          text = (text[:index]+random.choice(pieces)+
+                  text[index+random.randint(0, 2):])
+        expected = regex.match(text) is not None
+        self.assertEqual(pattern.Match(text, {}), expected)
+        matches += expected
+      self.assertTrue(0 < matches < 2000)
+
+    # Strings without the literals never reach the regex engine.
+    pattern = self.DoSetup('abc: def/12', [(0, 3, 'title')])
+    self.assertFalse(pattern.Match('abc def/12', {}))
+    self.assertEqual(pattern._regex, None)
+
+  def DoTestScan(self, pattern, text, bindings):
+    result = {}
+    self.assertEqual(pattern.Match(text, result), bindings is not None)
+    if bindings is not None:
+      self.assertEqual(result, bindings)
+    self.assertEqual(pattern._regex, None)
+
+  def testScan(self):
+    """Test matching without the regex engine."""
+
+    pattern = self.DoSetup('abc: def/123',
+                           [(0, 3, 'title'), (5, 8, 'name'), (9, 12, 'end')])
+    self.DoTestScan(pattern, 'x y:\t z/1/2', {'title': 'x y',
+                                               'name': 'z', 'end': '1/2'})
+    # A group that follows whitespace takes the last whitespace
+    # character if it would otherwise be empty, as with the regex.
+    self.DoTestScan(pattern, 'a:  /1', {'title': 'a', 'name': ' ',
+                                        'end': '1'})
+    self.DoTestScan(pattern, 'a: /1', None)
+    self.DoTestScan(pattern, 'a: b/', None)
+
+    pattern = self.DoSetup('get abc', [(4, 7, 'file')])
+    pattern.AttachEOLMarker()
+    self.DoTestScan(pattern, 'get   ', {'file': ' '})
+    self.DoTestScan(pattern, 'get', None)
+
+    pattern = self.DoSetup('ab cd ef', [(3, 5, 'word')])
+    self.DoTestScan(pattern, 'ab \tc:d  ef', {'word': 'c:d'})
+    self.DoTestScan(pattern, 'ab   ef', None)
+
+  def testScanLimit(self):
+    """Test that patterns compile the regex after many matches."""
+
+    pattern = self.DoSetup('abc: def', [(5, 8, 'name')])
+    for unused_count in range(reactive._SCAN_LIMIT):
+      self.assertTrue(pattern.Match('abc: xyz', {}))
+    self.assertEqual(pattern._regex, None)
+    bindings = {}
+    self.assertTrue(pattern.Match('abc: xyz', bindings))
+    self.assertEqual(bindings, {'name': 'xyz'})
+    self.assertNotEqual(pattern._regex, None)
+
+  def testScanFallback(self):
+    """Test patterns that the scanner leaves to the regex engine."""
+
+    line = directive.Line('fn', 4, '')
+    template = directive.Template(line, 'abc def')
+    for marks in [[(0, 3, '[a-c]+')], [(0, 2, ''), (2, 3, '')]]:
+      markers = [directive.Marker(line, start, finish, 'name', regex)
+                 for start, finish, regex in marks]
+      pattern = reactive.Pattern(template, markers)
+      self.assertEqual(pattern._ops, None)
+      self.assertTrue(pattern.Match('abc def', {}))
+
+    # The scanner supports the same regexes from the user as inferred
+    # ones, except for delimiters that are whitespace characters.
+    marker = directive.Marker(line, 0, 3, 'name', '[^ ]+')
+    self.assertEqual(reactive.Pattern(template, [marker])._ops, None)
+    marker = directive.Marker(line, 0, 3, 'name', r'[^\s]+')
+    self.assertNotEqual(reactive.Pattern(template, [marker])._ops, None)
+
+  def testScanEquivalence(self):
+    """Test that the scanner agrees with the regex on random patterns.
+
+    Generate random templates and markers, and check that matching
+    random strings gives the same results and bindings as the regex.
+    """
+
+    alphabet = 'ab:/ ,'
+    random.seed(2011)
+    scanned = 0
+    for unused_pattern in range(300):
+      sample = ''.join(random.choice(alphabet)
+                       for _ in range(random.randint(1, 10)))
+      marks = []
+      position = random.randint(0, 2)
+      while position < len(sample):
+        finish = random.randint(position+1, len(sample))
+        marks.append((position, finish, random.choice(['v%d' % position,
+                                                       None])))
+        position = finish+random.randint(0, 3)
+      pattern = self.DoSetup(sample, marks)
+      if utils._error_messages:
+        continue
+      if random.random() < 0.3:
+        pattern.AttachEOLMarker()
+      scanned += pattern._ops is not None
+      regex = re.compile(pattern.pattern)
+
+      for unused_text in range(100):
+        text = ''.join(random.choice(alphabet+'\t')
+                       for _ in range(random.randint(0, 14)))
+        if random.random() < 0.5:
+          text = sample+text[:random.randint(0, 3)]
+        matches = regex.match(text)
+        expected = {}
+        if matches:
+          for index, name in enumerate(pattern.bound_names):
+            if name:
+              expected[name] = matches.group(index+1)
+        bindings = {}
+        self.assertEqual(pattern.Match(text, bindings), bool(matches))
+        self.assertEqual(bindings, expected)
+        # Match switches to the regex after a while, so check all the
+        # groups that the scanner finds as well.
+        if pattern._ops is not None:
+          self.assertEqual(pattern._Scan(text),
+                           list(matches.groups()) if matches else None)
+    self.assertTrue(scanned > 100)
+
 
 class TestReactive(unittest.TestCase):
   """Unit tests for reactive.Reactive."""
@@ -0,0 +1,160 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the recording module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from .. import recording
+from .matcher_test import CreateMatcher
+
+
+class TestRecording(unittest.TestCase):
+  """Unit tests for recording.Recorder and recording.Read()."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, 'session.rec')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def DoRecord(self, chunks):
+    recorder = recording.Recorder(self.filename)
+    for source, number, data in chunks:
+      recorder.Record(source, data, number)
+    recorder.Close()
+
+  def DoTestRead(self, chunks):
+    records = list(recording.Read(self.filename))
+    self.assertEqual([r[1:] for r in records], chunks)
+    times = [r[0] for r in records]
+    self.assertEqual(times, sorted(times))
+
+  def testRoundTrip(self):
+    """Test that records come back in order, also after appending."""
+
+    first = [('child', 0, 'hello\r\n'), ('controller', 0, 'ls\n')]
+    second = [('stdin', 1, ''), ('child', 70000, '\x00\xff\x1b[m')]
+    self.DoRecord(first)
+    self.DoTestRead(first)
+    self.DoRecord(second)
+    self.DoTestRead(first+second)
+
+  def testTruncated(self):
+    """Test that a partially written record is ignored."""
+
+    self.DoRecord([('child', 0, 'one'), ('child', 0, 'two')])
+    with open(self.filename, 'r+b') as f:
+      f.truncate(os.path.getsize(self.filename)-1)
+    self.DoTestRead([('child', 0, 'one')])
+
+  def testNotRecording(self):
+    """Test that reading another kind of file fails."""
+
+    with open(self.filename, 'w') as f:
+      f.write('hello\n')
+    self.assertRaises(ValueError, list, recording.Read(self.filename))
+    self.assertRaises(ValueError, recording.Recorder, self.filename)
+
+
+class TestReplay(unittest.TestCase):
+  """Unit tests for recording.Replay()."""
+
+  def DoTestReplay(self, records, expected, **kwargs):
+    reacts = CreateMatcher(['>get 1',
+                            '?    . n',
+                            '!controller "got $n"'])
+    actions, chunks, size, unused_seconds = recording.Replay(
+        records, reacts, **kwargs)
+    self.assertEqual(
+        [(a.offset, a.session_number, a.channel, a.message)
+         for a in actions], expected)
+    self.assertEqual(chunks, len([r for r in records if r[1] == 'child']))
+    self.assertEqual(size, sum(len(r[3]) for r in records
+                               if r[1] == 'child'))
+
+  def testSessions(self):
+    """Test that sessions have separate buffers."""
+
+    self.DoTestReplay([(10.0, 'child', 0, 'get '),
+                       (10.5, 'controller', 0, 'get 2\n'),
+                       (11.0, 'child', 1, 'get 1\n'),
+                       (12.0, 'child', 0, '\xc3'),
+                       (12.5, 'child', 0, '\xa9\n'),
+                       (13.0, 'stdin', 1, 'x')],
+                      [(1.0, 1, 'controller', 'got 1\n'),
+                       (2.5, 0, 'controller', u'got \xe9\n')])
+
+  def testStripAnsi(self):
+    """Test escape sequence removal before matching."""
+
+    records = [(0.0, 'child', 0, 'get \x1b[1m4\x1b[m\n')]
+    self.DoTestReplay(records,
+                      [(0.0, 0, 'controller', 'got \x1b[1m4\x1b[m\n')])
+    self.DoTestReplay(records, [(0.0, 0, 'controller', 'got 4\n')],
+                      strip_ansi=True)
+
+  def testTrailingBytes(self):
+    """Test that an incomplete character at the end is decoded."""
+
+    self.DoTestReplay([(0.0, 'child', 0, 'get \xc3')],
+                      [(0.0, 0, 'controller', u'got \ufffd\n')])
+
+  def testRetention(self):
+    """Test that the buffers keep the retention limits."""
+
+    # The first line of the match is evicted before the second arrives
+    # if the buffer retains only one line.
+    reacts = CreateMatcher(['>a', '>b', '!controller "ab"'])
+    records = [(0.0, 'child', 0, 'a\n'), (1.0, 'child', 0, 'b\n')]
+    self.assertEqual(len(recording.Replay(records, reacts)[0]), 1)
+    self.assertEqual(
+        len(recording.Replay(records, reacts, max_lines=1)[0]), 0)
+    self.assertEqual(
+        len(recording.Replay(records, reacts, max_bytes=1)[0]), 0)
+
+  def testRealtime(self):
+    """Test that a real-time replay keeps the recorded timing."""
+
+    records = [(5.0, 'child', 0, 'get 1\n'),
+               (5.25, 'child', 0, 'get 2\n')]
+    start = time.time()
+    self.DoTestReplay(records, [(0.0, 0, 'controller', 'got 1\n'),
+                                (0.25, 0, 'controller', 'got 2\n')],
+                      realtime=True)
+    self.assertTrue(time.time()-start >= 0.25)
+
+
+if __name__ == '__main__':
+  unittest.main()
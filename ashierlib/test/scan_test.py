@@ -0,0 +1,190 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the scan module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from .. import linebuf
+from .. import scan
+from .. import session
+from .matcher_test import CreateMatcher
+
+# A flat configuration with patterns of one to three lines, some of
+# which overlap.
+_FLAT = ['>a 1',
+         '?  . x',
+         '!controller "a $x"',
+         '',
+         '>b 1',
+         '>a 2',
+         '?  . y',
+         '!controller "ba $y"',
+         '',
+         '>b 1',
+         '>b 2',
+         '>c 3',
+         '?  . z',
+         '!terminal "bbc $z"',
+         '',
+         '>c 1',
+         '>a 2',
+         '!controller "ca"']
+
+# A configuration with nested reactions.
+_NESTED = ['>b 1',
+           '!controller "open"',
+           '',
+           '  >a 1',
+           '  ?  . x',
+           '  !controller "inner $x"',
+           '',
+           '>c 1',
+           '!controller "close"']
+
+
+class TestScan(unittest.TestCase):
+  """Unit tests for scan.Scan()."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, 'output.log')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def DoWrite(self, content):
+    with open(self.filename, 'wb') as f:
+      f.write(content)
+
+  def DoReference(self, reacts, content):
+    """Run session.React on the entire content at once."""
+
+    sends = []
+    channels = {'controller': lambda m: sends.append(('controller', m)),
+                'terminal': lambda m: sends.append(('terminal', m))}
+    buf = linebuf.Buffer()
+    buf.AppendRawData(content.decode('utf-8', 'replace')+'\n')
+    session.React([], buf, reacts, channels)
+    return sends
+
+  def DoTestScan(self, reacts, content, **kwargs):
+    """Test that a scan sends what session.React sends, in order."""
+
+    self.DoWrite(content)
+    matches = list(scan.Scan(self.filename, reacts, **kwargs))
+    joined = {}
+    for channel, message in self.DoReference(reacts, content):
+      joined[channel] = joined.get(channel, '')+message
+    scanned = {}
+    for unused_line, sends in matches:
+      for channel, message in sends:
+        scanned[channel] = scanned.get(channel, '')+message
+    self.assertEqual(scanned, joined)
+    return matches
+
+  def testLineNumbers(self):
+    """Test that matches report the last matched line."""
+
+    reacts = CreateMatcher(_FLAT)
+    matches = self.DoTestScan(reacts, 'a 1\nb 1\nb 2\nc 3\nx\nc 1\na 2')
+    self.assertEqual(matches,
+                     [(1, [('controller', 'a 1\n')]),
+                      (4, [('terminal', 'bbc 3\n')]),
+                      (7, [('controller', 'ca\n')])])
+
+  def testEmpty(self):
+    """Test scanning an empty file."""
+
+    self.assertEqual(self.DoTestScan(CreateMatcher(_FLAT), ''), [])
+
+  def testStripAnsi(self):
+    """Test escape sequence removal and UTF-8 decoding."""
+
+    reacts = CreateMatcher(_FLAT)
+    content = 'a \x1b[1m\xc3\xa9\x1b[m\n'
+    self.DoWrite(content)
+    self.assertEqual(list(scan.Scan(self.filename, reacts, strip_ansi=True)),
+                     [(1, [('controller', u'a \xe9\n')])])
+
+  def testNested(self):
+    """Test that nested configurations scan serially."""
+
+    reacts = CreateMatcher(_NESTED)
+    self.assertFalse(reacts.IsFlat())
+    self.assertTrue(CreateMatcher(_FLAT).IsFlat())
+    content = 'a 1\nb 1\na 2\na 3\nc 1\na 4\n'
+    self.assertEqual(
+        self.DoTestScan(reacts, content, slices=3),
+        [(2, [('controller', 'open\n')]),
+         (3, [('controller', 'inner 2\n')]),
+         (4, [('controller', 'inner 3\n')]),
+         (5, [('controller', 'close\n')])])
+
+  def testRandomSlices(self):
+    """Test that sliced scans have the same results as serial scans."""
+
+    reacts = CreateMatcher(_FLAT)
+    rand = random.Random(2011)
+    for unused_iteration in xrange(200):
+      content = '\n'.join(
+          '%s %d' % (rand.choice('abcx'), rand.randint(1, 3))
+          for _ in xrange(rand.randint(0, 40)))
+      self.DoWrite(content)
+      serial = list(scan.Scan(self.filename, reacts))
+      for slices in (2, 3, 7, 50):
+        self.assertEqual(
+            list(scan.Scan(self.filename, reacts, slices=slices)), serial,
+            (content, slices))
+
+  def testProcessPool(self):
+    """Test scanning with a pool of worker processes."""
+
+    reacts = CreateMatcher(_FLAT)
+    rand = random.Random(2012)
+    content = '\n'.join(
+        '%s %d' % (rand.choice('abc'), rand.randint(1, 3))
+        for _ in xrange(5000))
+    serial = self.DoTestScan(reacts, content)
+    self.assertEqual(
+        list(scan.Scan(self.filename, reacts, jobs=4, slices=8)), serial)
+
+    # Closing the iterator before the scan is done shuts the pool down.
+    matches = scan.Scan(self.filename, reacts, jobs=4, slices=8)
+    self.assertEqual(next(matches), serial[0])
+    matches.close()
+    self.assertEqual(scan._worker_reacts, None)
+
+
+if __name__ == '__main__':
+  unittest.main()
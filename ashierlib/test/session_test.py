@@ -0,0 +1,248 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the session module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from .. import directive
+from .. import linebuf
+from .. import session
+from .. import stats
+from .. import terminal
+from .matcher_test import CreateMatcher
+
+
+class TestReact(unittest.TestCase):
+  """Unit tests for session.React()."""
+
+  def testBatchedSends(self):
+    """Test that messages are written once per channel, in order."""
+
+    reacts = CreateMatcher(['>get 1',
+                            '?    . n',
+                            '!controller "got $n"',
+                            '!terminal "ack $n"',
+                            '',
+                            '>put 1',
+                            '?    . n',
+                            '!controller "put $n"'])
+    writes = []
+    channels = {'controller': lambda data: writes.append(('c', data)),
+                'terminal': lambda data: writes.append(('t', data))}
+    buf = linebuf.Buffer()
+    buf.AppendRawData('get 1\nput 2\nget 3\nother')
+    session.React([], buf, reacts, channels)
+    self.assertEqual(sorted(writes),
+                     [('c', 'got 1\nput 2\ngot 3\n'),
+                      ('t', 'ack 1\nack 3\n')])
+
+    del writes[:]
+    buf.AppendRawData('\n')
+    session.React([], buf, reacts, channels)
+    self.assertEqual(writes, [])
+
+  def testFrames(self):
+    """Test that framed channels get one frame per message."""
+
+    reacts = CreateMatcher(['>get 1',
+                            '?    . n',
+                            '!controller "got $n"',
+                            '!terminal "ack $n"'])
+    writes = []
+    channels = {'controller': directive.Frames(
+                    lambda data: writes.append(('c', data))),
+                'terminal': lambda data: writes.append(('t', data))}
+    buf = linebuf.Buffer()
+    buf.AppendRawData('get 1\nget 2\n')
+    session.React([], buf, reacts, channels)
+    self.assertEqual(sorted(writes)[1], ('t', 'ack 1\nack 2\n'))
+    frames = sorted(writes)[0][1].splitlines()
+    self.assertEqual([json.loads(f) for f in frames],
+                     [{'reaction': 'fn:1', 'message': 'got 1',
+                       'bindings': {'n': '1'}},
+                      {'reaction': 'fn:1', 'message': 'got 2',
+                       'bindings': {'n': '2'}}])
+
+  def testLatency(self):
+    """Test response latency recording."""
+
+    reacts = CreateMatcher(['>get 1',
+                            '?    . n',
+                            '!controller "got $n"',
+                            '',
+                            '>put 1',
+                            '?    .'])
+    channels = {'controller': lambda data: None,
+                'terminal': lambda data: None}
+    latency = stats.Latency()
+    buf = linebuf.Buffer()
+    buf.AppendRawData('get 1\nput 2\nget 3\n')
+    session.React([], buf, reacts, channels, latency, time.time())
+    self.assertEqual(
+        sorted((name, hist.count)
+               for name, hist in latency._histograms.iteritems()),
+        [('reaction fn:1', 2), ('reaction fn:5', 1),
+         ('response controller', 1), ('write controller', 1)])
+
+
+class TestSession(unittest.TestCase):
+  """Unit tests for session.Session."""
+
+  def testSharedLoop(self):
+    """Test independent sessions that share a loop and reactions.
+
+    Each controller waits for the shell prompt and asks its shell to
+    print a line that identifies the session, the shared reaction sends
+    the matched word back to the controller, and the controller records
+    it and ends the session.
+    """
+
+    reacts = CreateMatcher(['>reply 1010',
+                            '?      .... token',
+                            '!controller "$token"',
+                            '',
+                            '>ready>',
+                            '!controller "ready"'])
+    tmpdir = tempfile.mkdtemp()
+    script = ('read ready; '
+              'echo "echo reply $ASHIER_SESSION$ASHIER_SESSION"; '
+              'read line; echo "$line" > %s/$ASHIER_SESSION; echo exit')
+    loop = terminal.IOLoop()
+    running = set()
+    def OnExit(index):
+      running.remove(index)
+      if not running:
+        loop.Stop()
+
+    sessions = []
+    for index in range(10, 13):
+      env = dict(os.environ, ASHIER_SESSION=str(index), PS1='ready> ')
+      unused_child_pid, child_fd = terminal.SpawnPTY(['/bin/sh'], env)
+      control_pid, control_fd = terminal.SpawnPTY(
+          ['/bin/sh', '-c', script % tmpdir], env)
+      terminal.SetTerminalRaw(control_fd)
+      running.add(index)
+      sessions.append(session.Session(
+          loop, reacts, linebuf.Buffer(), child_fd, control_pid,
+          control_fd, None, None, lambda index=index: OnExit(index)))
+    loop.Run()
+
+    for index in range(10, 13):
+      with open(os.path.join(tmpdir, str(index))) as f:
+        self.assertEqual(f.read().strip(), '%d%d' % (index, index))
+    for s in sessions:
+      self.assertTrue(s.cpu_time > 0)
+    shutil.rmtree(tmpdir)
+
+  def testNoController(self):
+    """Test a session without a controller and without a shell."""
+
+    reacts = CreateMatcher(['>reply 1010',
+                            '?      .... token',
+                            '!controller "$token"'])
+    loop = terminal.IOLoop()
+    unused_child_pid, child_fd = terminal.SpawnPTY(
+        ['echo', 'reply', '4242'])
+    s = session.Session(loop, reacts, linebuf.Buffer(), child_fd, None,
+                        None, None, None, loop.Stop)
+    loop.Run()
+    self.assertTrue(s.cpu_time > 0)
+
+  def testReapController(self):
+    """Test that closing a session reaps a stubborn controller."""
+
+    reacts = CreateMatcher(['>tick'])
+    loop = terminal.IOLoop()
+    unused_child_pid, child_fd = terminal.SpawnPTY(['echo', 'tick'])
+    control_pid, control_fd = terminal.SpawnSocket(
+        ['/bin/sh', '-c', 'trap "" TERM; exec sleep 30'])
+    grace_period = session._GRACE_PERIOD
+    session._GRACE_PERIOD = 0.1
+    try:
+      session.Session(loop, reacts, linebuf.Buffer(), child_fd,
+                      control_pid, control_fd, None, None, loop.Stop)
+      loop.Run()
+    finally:
+      session._GRACE_PERIOD = grace_period
+    self.assertRaises(OSError, os.waitpid, control_pid, os.WNOHANG)
+
+  def testTimerLatency(self):
+    """Test a timer that activates a reaction to buffered output."""
+
+    # The two-line reaction retains the line until the timer fires.
+    reacts = CreateMatcher(['>hello',
+                            '>world',
+                            '',
+                            '@idle 50',
+                            '!controller "idle"',
+                            '',
+                            '  >hello',
+                            '  !controller "hi"'])
+    loop = terminal.IOLoop()
+    unused_child_pid, child_fd = terminal.SpawnPTY(
+        ['/bin/sh', '-c', 'echo hello; sleep 0.3'])
+    controller, control = socket.socketpair()
+    latency = stats.Latency()
+    session.Session(loop, reacts, linebuf.Buffer(), child_fd, None,
+                    os.dup(control.fileno()), None, None, loop.Stop,
+                    latency=latency)
+    control.close()
+    loop.Run()
+    self.assertEqual(controller.recv(512), 'idle\nhi\n')
+    self.assertEqual(latency._histograms['reaction fn:7'].count, 1)
+
+  def testTimerRearm(self):
+    """Test that matches replace the timers instead of adding more."""
+
+    reacts = CreateMatcher(['@deadline 10000',
+                            '!controller "late"',
+                            '',
+                            '>tick'])
+    loop = terminal.IOLoop()
+    unused_child_pid, child_fd = terminal.SpawnPTY(
+        ['/bin/sh', '-c', 'for i in 1 2 3 4 5; do echo tick; done'])
+    timers = []
+    def OnExit():
+      timers.append(len(loop._timers))
+      loop.Stop()
+    session.Session(loop, reacts, linebuf.Buffer(), child_fd, None,
+                    None, None, None, OnExit)
+    self.assertEqual(len(loop._timers), 1)
+    loop.Run()
+    self.assertEqual(timers, [0])
+
+
+if __name__ == '__main__':
+  unittest.main()
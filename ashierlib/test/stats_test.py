@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the stats module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import unittest
+
+from .. import linebuf
+from .. import session
+from .. import stats
+from .matcher_test import CreateMatcher
+
+
+class TestStats(unittest.TestCase):
+  """Unit tests for the matching statistics counters."""
+
+  config = ['>get 1',
+            '?    . n',
+            '!controller "got $n"',
+            '',
+            '>put 1',
+            '?    .',
+            '>done']
+
+  def DoTestCounters(self, counters, location, expected):
+    self.assertEqual(counters.location, location)
+    self.assertEqual(
+        (counters.attempts, counters.mismatches, counters.retries,
+         counters.hits), expected)
+
+  def testCounters(self):
+    """Test the counters of reactions and patterns."""
+
+    reacts = CreateMatcher(self.config)
+    reacts.EnableStats()
+    channels = {'controller': lambda data: None}
+    nesting = []
+    buf = linebuf.Buffer()
+    buf.AppendRawData('get 1\nput 2\ndone\nge')
+    session.React(nesting, buf, reacts, channels)
+    buf.AppendRawData('t 3\n')
+    session.React(nesting, buf, reacts, channels)
+
+    put, get = reacts.Reactives()
+    # The put reaction also tries to match before the buffer holds
+    # enough lines for its pattern, and the get reaction retries the
+    # partial line 'ge' without running its pattern.
+    self.DoTestCounters(put.Stats(), 'fn:5', (3, 0, 0, 1))
+    self.DoTestCounters(put.PatternStats()[0], 'fn:5', (1, 0, 0, 1))
+    self.DoTestCounters(put.PatternStats()[1], 'fn:7', (1, 0, 0, 1))
+    self.DoTestCounters(get.Stats(), 'fn:1', (4, 0, 2, 2))
+    self.DoTestCounters(get.PatternStats()[0], 'fn:1', (2, 0, 0, 2))
+    self.assertTrue(get.Stats().seconds > 0)
+
+    report = stats.Report(reacts).splitlines()
+    self.assertEqual(len(report), 6)
+    self.assertEqual(
+        sorted(line.split()[0] for line in report[1:]),
+        ['fn:1', 'fn:1', 'fn:5', 'fn:5', 'fn:7'])
+
+  def testDisabled(self):
+    """Test that counting is off by default."""
+
+    reacts = CreateMatcher(self.config)
+    for react in reacts.Reactives():
+      self.assertEqual(react.Stats(), None)
+      self.assertEqual(react.PatternStats(), [None]*react.PatternSize())
+    self.assertEqual(len(stats.Report(reacts).splitlines()), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
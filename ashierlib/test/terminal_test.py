@@ -0,0 +1,244 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the terminal module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import fcntl
+import os
+import threading
+import time
+import unittest
+
+from .. import terminal
+
+
+def ReadAll(fd, output):
+  """Read from a file descriptor until end of file."""
+
+  while True:
+    data = os.read(fd, 4096)
+    if not data:
+      break
+    output.append(data)
+
+
+class TestWriteAll(unittest.TestCase):
+  """Unit tests for terminal.WriteAll()."""
+
+  def testNonBlockingPipe(self):
+    """Test writing more data than a non-blocking pipe can hold.
+
+    A single os.write call on a non-blocking pipe writes at most the
+    free space in the pipe buffer.  WriteAll should nevertheless
+    deliver all data, in order.
+    """
+
+    read_fd, write_fd = os.pipe()
+    flags = fcntl.fcntl(write_fd, fcntl.F_GETFL)
+    fcntl.fcntl(write_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    output = []
+    reader = threading.Thread(target=ReadAll, args=(read_fd, output))
+    reader.start()
+
+    data = ''.join('%07d\n' % n for n in range(100000))
+    terminal.WriteAll(write_fd, data)
+    os.close(write_fd)
+    reader.join()
+    os.close(read_fd)
+    self.assertEqual(''.join(output), data)
+
+
+class TestSpawnSocket(unittest.TestCase):
+  """Unit tests for terminal.SpawnSocket()."""
+
+  def testLongLines(self):
+    """Test that long lines go through the socket unchanged."""
+
+    pid, fd = terminal.SpawnSocket(['cat'])
+    expected = 'x'*100000+'\n\x03\x04'
+    writer = threading.Thread(target=terminal.WriteAll, args=(fd, expected))
+    writer.start()
+    output, size = [], 0
+    while size < len(expected):
+      data = os.read(fd, 65536)
+      if not data:
+        break
+      output.append(data)
+      size += len(data)
+    writer.join()
+    os.close(fd)
+    os.waitpid(pid, 0)
+    self.assertEqual(''.join(output), expected)
+
+
+class TestDataPump(unittest.TestCase):
+  """Unit tests for terminal.DataPump."""
+
+  def testCopy(self):
+    """Test copying data through a small, adaptive read buffer.
+
+    The data should arrive intact at both the returned strings and the
+    destination file descriptor, and the read size should grow from
+    the minimum to the maximum as the reads keep filling the buffer.
+    """
+
+    source_read, source_write = os.pipe()
+    sink_read, sink_write = os.pipe()
+    expected = ''.join('%07d\n' % n for n in range(1000))
+    os.write(source_write, expected)
+    os.close(source_write)
+
+    pump = terminal.DataPump(
+        source_read, lambda data: terminal.WriteAll(sink_write, data), 4, 32)
+    copied = []
+    while True:
+      data = pump.Copy()
+      if not data:
+        break
+      copied.append(data)
+    os.close(source_read)
+    os.close(sink_write)
+
+    output = []
+    ReadAll(sink_read, output)
+    os.close(sink_read)
+    self.assertEqual(''.join(copied), expected)
+    self.assertEqual(''.join(output), expected)
+    self.assertEqual([len(d) for d in copied[:4]], [4, 8, 16, 32])
+    self.assertEqual(max(len(d) for d in copied), 32)
+
+
+class TestIOLoop(unittest.TestCase):
+  """Unit tests for terminal.IOLoop."""
+
+  def testBackPressure(self):
+    """Test write queues and input throttling.
+
+    Data copied to an output that nobody reads should queue up without
+    blocking the loop.  Once the queue passes the high-water mark, the
+    loop should stop reading the throttled input, and it should resume
+    after the output drains.
+    """
+
+    source_read, source_write = os.pipe()
+    sink_read, sink_write = os.pipe()
+    loop = terminal.IOLoop(high_water=100000)
+    loop.AddWriter(sink_write)
+    loop.Throttle(source_read, sink_write)
+    pump = terminal.DataPump(
+        source_read, lambda data: loop.Write(sink_write, data))
+    def SourceReady(unused_event):
+      if not pump.Copy():
+        loop.Remove(source_read)
+        finished.append(True)
+    loop.AddReader(source_read, SourceReady)
+    finished = []
+
+    writer = threading.Thread(
+        target=terminal.WriteAll, args=(source_write, 'x'*1000000))
+    writer.start()
+    for unused_count in range(200):
+      loop.Poll(0.01)
+
+    # The pipe buffer plus the queue stop just above the high-water
+    # mark, and the writer is still blocked on the throttled input.
+    self.assertTrue(writer.isAlive())
+    self.assertTrue(100000 < loop._queued[sink_write] < 200000)
+
+    output = []
+    reader = threading.Thread(target=ReadAll, args=(sink_read, output))
+    reader.start()
+    while writer.isAlive():
+      loop.Poll(0.01)
+    os.close(source_write)
+    while not finished:
+      loop.Poll(0.01)
+    loop.Flush(sink_write)
+    os.close(sink_write)
+    reader.join()
+    self.assertEqual(len(''.join(output)), 1000000)
+    os.close(source_read)
+    os.close(sink_read)
+
+  def testCallSoon(self):
+    """Test deferred callbacks and stopping the loop."""
+
+    read_fd, write_fd = os.pipe()
+    loop = terminal.IOLoop()
+    calls = []
+    def SourceReady(unused_event):
+      calls.append(os.read(read_fd, 10))
+      loop.CallSoon(lambda: calls.append('deferred'))
+      loop.CallSoon(loop.Stop)
+    loop.AddReader(read_fd, SourceReady)
+
+    os.write(write_fd, 'data')
+    loop.Run()
+    self.assertEqual(calls, ['data', 'deferred'])
+    os.close(read_fd)
+    os.close(write_fd)
+
+  def testCallLater(self):
+    """Test timers, which wake up an otherwise idle loop."""
+
+    loop = terminal.IOLoop()
+    calls = []
+    loop.CallLater(0.02, lambda: calls.append('second'))
+    loop.CallLater(0.01, lambda: calls.append('first'))
+    loop.CallLater(0.01, lambda: calls.append('canceled')).Cancel()
+    loop.CallLater(0.03, loop.Stop)
+    start = time.time()
+    loop.Run()
+    self.assertTrue(time.time()-start >= 0.03)
+    self.assertEqual(calls, ['first', 'second'])
+
+  def testRemoveWriter(self):
+    """Test adding a writer twice and removing a throttling writer."""
+
+    source_read, source_write = os.pipe()
+    sink_read, sink_write = os.pipe()
+    loop = terminal.IOLoop(high_water=10)
+    loop.AddWriter(sink_write)
+    loop.Throttle(source_read, sink_write)
+    loop.AddReader(source_read, lambda event: None)
+    loop.Write(sink_write, 'x'*100000)
+    self.assertTrue(loop._queued[sink_write] > 10)
+    self.assertTrue(loop._paused[source_read])
+
+    # Preparing the writer again keeps its queue, and removing it lets
+    # the throttled input resume.
+    loop.AddWriter(sink_write)
+    self.assertTrue(loop._queued[sink_write] > 10)
+    loop.Remove(sink_write)
+    self.assertFalse(loop._paused[source_read])
+    for fd in (source_read, source_write, sink_read, sink_write):
+      os.close(fd)
+
+
+if __name__ == '__main__':
+  unittest.main()
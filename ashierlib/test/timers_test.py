@@ -0,0 +1,91 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module contains unit tests for the timers module.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+
+import random
+import unittest
+
+from .. import timers
+
+
+class TestTimerWheel(unittest.TestCase):
+  """Unit tests for timers.TimerWheel."""
+
+  def testAdvance(self):
+    """Test timer expiry against a sorted list of deadlines.
+
+    Add and cancel timers with deadlines from sub-tick to days ahead
+    (and in the past), advance the wheel in steps of random size, and
+    check that exactly the due timers expire, in order, and that the
+    wheel never asks the caller to wait past the earliest deadline.
+    """
+
+    random.seed(2011)
+    for unused_trial in range(20):
+      now = random.uniform(0, 1e6)
+      wheel = timers.TimerWheel(now)
+      deadlines = {}
+      for unused_step in range(300):
+        choice = random.random()
+        if choice < 0.5:
+          when = now+random.choice([0.1, 5, 400, 2e5, -1])*random.random()
+          deadlines[wheel.Add(when, None)] = when
+        elif choice < 0.6 and deadlines:
+          timer = random.choice(list(deadlines))
+          timer.Cancel()
+          del deadlines[timer]
+        else:
+          wait = wheel.NextTimeout(now)
+          if deadlines:
+            earliest = max(min(deadlines.itervalues()), now)
+            self.assertTrue(now+wait <= earliest+0.0011)
+          else:
+            self.assertEqual(wait, None)
+          now += random.choice([0.0005, 0.01, 1, 100, 1e4, wait or 0])
+          expired = wheel.Advance(now)
+          due = [t for t, when in deadlines.iteritems()
+                 if t.expires <= int(now/0.001)]
+          due.sort(key=lambda t: (t.expires, t.sequence))
+          self.assertEqual(expired, due)
+          for timer in expired:
+            self.assertTrue(timer.expires*0.001 >= deadlines.pop(timer)-1e-6)
+        self.assertEqual(len(wheel), len(deadlines))
+
+  def testOrder(self):
+    """Test that timers with the same deadline expire in order."""
+
+    wheel = timers.TimerWheel(10.0)
+    added = [wheel.Add(10.5, None) for _ in range(5)]
+    self.assertEqual(wheel.Advance(10.499), [])
+    self.assertEqual(wheel.Advance(10.5), added)
+    self.assertEqual(wheel.NextTimeout(10.5), None)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This module implements the timers of the event loop.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import itertools
+
+# Each level of the wheel has 2**_BITS slots, and each slot of a level
+# spans all the slots of the level below.  Timers beyond the top level
+# wait in an overflow set, and timers for ticks that the wheel has
+# already passed wait in a due set.
+_BITS = 6
+_SLOTS = 1 << _BITS
+_MASK = _SLOTS-1
+_LEVELS = 4
+
+
+class Timer(object):
+  """A pending timer in a TimerWheel."""
+
+  def __init__(self, wheel, expires, sequence, callback):
+    self._wheel = wheel
+    self._slot = None
+    self._level = None
+    self.expires = expires
+    self.sequence = sequence
+    self.callback = callback
+
+  def Cancel(self):
+    """Cancel the timer if it has not expired yet."""
+
+    if self._slot is not None:
+      self._wheel._Unlink(self)
+
+
+class TimerWheel(object):
+  """Hierarchical timer wheel.
+
+  A TimerWheel object keeps timers in a hierarchy of slot arrays with
+  increasingly coarse time resolution.  Adding and canceling a timer
+  take constant time, and advancing the wheel takes time proportional
+  to the number of expired timers plus the number of times each timer
+  moves down the hierarchy (at most once per level), so the wheel can
+  hold many thousands of timers cheaply.  The resolution of the wheel
+  is one tick, and a timer never expires before its deadline.
+  """
+
+  def __init__(self, now, tick=0.001):
+    """Create a TimerWheel object.
+
+    Args:
+      now: the current time (in seconds).
+      tick: the resolution of the wheel (in seconds).
+    """
+
+    self._tick = tick
+    self._current = int(now/tick)
+    self._levels = [[set() for _ in xrange(_SLOTS)] for _ in xrange(_LEVELS)]
+    self._counts = [0]*_LEVELS
+    self._overflow = set()
+    self._due = set()
+    self._sequence = itertools.count()
+
+  def __len__(self):
+    return sum(self._counts)+len(self._overflow)+len(self._due)
+
+  def Add(self, when, callback):
+    """Add a timer.
+
+    Args:
+      when: the time (in seconds) to call the function at.
+      callback: function to call (with no arguments).
+
+    Returns:
+      A Timer object.
+    """
+
+    # Round up, so that the timer expires no earlier than requested.
+    expires = -int(-when//self._tick)
+    timer = Timer(self, expires, next(self._sequence), callback)
+    self._Link(timer)
+    return timer
+
+  def Advance(self, now):
+    """Advance the wheel to the current time.
+
+    Args:
+      now: the current time (in seconds).
+
+    Returns:
+      A list of the expired Timer objects in order of expiry.  The
+      caller is responsible for running their callbacks.
+    """
+
+    target = int(now/self._tick)
+    expired = list(self._due)
+    self._due.clear()
+    while self._current <= target:
+      self._Cascade()
+      slot = self._levels[0][self._current & _MASK]
+      if slot:
+        expired.extend(slot)
+        self._counts[0] -= len(slot)
+        slot.clear()
+      self._current += 1
+
+      # Skip ahead over empty slots, up to the next slot boundary of
+      # the lowest level that holds any timers.
+      level = 0
+      while level < _LEVELS and not self._counts[level]:
+        level += 1
+      if level > 0:
+        span = 1 << (_BITS*level)
+        skip = -(-self._current//span)*span
+        if level == _LEVELS and not self._overflow:
+          skip = target+1
+        self._current = max(self._current, min(skip, target+1))
+
+    for timer in expired:
+      timer._slot = None
+    expired.sort(key=lambda t: (t.expires, t.sequence))
+    return expired
+
+  def NextTimeout(self, now):
+    """Compute how long the caller can wait before advancing the wheel.
+
+    Args:
+      now: the current time (in seconds).
+
+    Returns:
+      The number of seconds until the next timer may expire (which is
+      0 if it is due), or None if there are no timers.
+    """
+
+    expires = self._NextTick()
+    if expires is None:
+      return None
+    return max(0.0, expires*self._tick-now)
+
+  def _NextTick(self):
+    """Return a tick no later than the earliest timer expiry."""
+
+    if self._due:
+      return self._current-1
+
+    # A slot of a higher level may be due for cascading at the current
+    # tick, so check the first occupied slot of every level.
+    earliest = None
+    for level in xrange(_LEVELS):
+      if not self._counts[level]:
+        continue
+      shift = _BITS*level
+      digit = (self._current >> shift) & _MASK
+      slots = self._levels[level]
+      for index in xrange(digit, _SLOTS):
+        if slots[index]:
+          base = (self._current >> (shift+_BITS)) << (shift+_BITS)
+          tick = max(base | (index << shift), self._current)
+          if earliest is None or tick < earliest:
+            earliest = tick
+          break
+    if self._overflow:
+      span = 1 << (_BITS*_LEVELS)
+      tick = -(-self._current//span)*span
+      if earliest is None or tick < earliest:
+        earliest = tick
+    return earliest
+
+  def _Link(self, timer):
+    # A timer goes to the lowest level whose slots cover its expiry
+    # within the current rotation of the level above.
+    expires = timer.expires
+    if expires < self._current:
+      self._due.add(timer)
+      timer._slot = self._due
+      timer._level = None
+      return
+    for level in xrange(_LEVELS):
+      shift = _BITS*(level+1)
+      if expires >> shift == self._current >> shift:
+        slot = self._levels[level][(expires >> (shift-_BITS)) & _MASK]
+        self._counts[level] += 1
+        timer._level = level
+        break
+    else:
+      slot = self._overflow
+      timer._level = None
+    slot.add(timer)
+    timer._slot = slot
+
+  def _Unlink(self, timer):
+    timer._slot.discard(timer)
+    if timer._level is not None:
+      self._counts[timer._level] -= 1
+    timer._slot = None
+
+  def _Cascade(self):
+    """Move timers down when the current tick starts a new rotation."""
+
+    if not self._current & ((1 << (_BITS*_LEVELS))-1) and self._overflow:
+      timers = list(self._overflow)
+      self._overflow.clear()
+      for timer in timers:
+        self._Link(timer)
+
+    for level in xrange(_LEVELS-1, 0, -1):
+      shift = _BITS*level
+      if self._current & ((1 << shift)-1):
+        continue
+      slot = self._levels[level][(self._current >> shift) & _MASK]
+      if slot:
+        timers = list(slot)
+        self._counts[level] -= len(slot)
+        slot.clear()
+        for timer in timers:
+          self._Link(timer)
@@ -58,7 +58,10 @@ def AbortOnError():
 
   if _error_messages:
     _error_messages.append('Errors detected.  Exiting Ashier...\n')
-    print >> sys.stderr, '\n'.join(_error_messages)
+    message = '\n'.join(_error_messages)
+    if isinstance(message, unicode):
+      message = message.encode('utf-8')
+    print >> sys.stderr, message
     sys.exit(252)
 
 
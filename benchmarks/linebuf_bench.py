@@ -0,0 +1,123 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This program compares linebuf.Buffer with the original list-based
+buffer implementation.  Each run appends a number of lines to a buffer
+in PTY-sized chunks while retaining all of them (as a pending
+multi-line pattern would), and then drains the buffer by raising the
+baseline in small steps.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ashierlib import linebuf
+
+
+class ListBuffer(object):
+  """The original list-based Buffer implementation, for reference."""
+
+  def __init__(self):
+    self.baseline = 1
+    self._lines = ['']*2
+
+  def GetBound(self):
+    return self.baseline+len(self._lines)-1
+
+  def AppendRawData(self, content):
+    lines = (self._lines[-1]+content).split('\n')
+    for index in range(len(lines)-1):
+      lines[index] = lines[index].rstrip('\r')
+    self._lines[-1:] = lines
+
+  def UpdateBaseline(self, new_baseline):
+    assert new_baseline >= self.baseline, (
+        'new_baseline < self.baseline')
+    assert new_baseline <= self.GetBound(), (
+        'new_baseline > self.GetBound()')
+    del self._lines[:new_baseline-self.baseline]
+    self.baseline = new_baseline
+
+  def GetLine(self, lineno):
+    assert lineno >= self.baseline, 'lineno < self.baseline'
+    assert lineno < self.GetBound(), 'lineno >= self.GetBound()'
+    return self._lines[lineno-self.baseline+1]
+
+
+def MakeChunks(count, chunk_size):
+  """Generate terminal output with the specified number of lines."""
+
+  text = ''.join('%08d: the quick brown fox jumps over\r\n' % n
+                 for n in xrange(count))
+  return [text[i:i+chunk_size] for i in xrange(0, len(text), chunk_size)]
+
+
+def Run(factory, chunks, step):
+  """Time the append and drain phases on a new buffer.
+
+  Returns:
+    A pair of elapsed times (in seconds) for the two phases.
+  """
+
+  buf = factory()
+  start = time.time()
+  for chunk in chunks:
+    buf.AppendRawData(chunk)
+  middle = time.time()
+  while buf.baseline < buf.GetBound()-1:
+    buf.GetLine(buf.baseline)
+    buf.UpdateBaseline(min(buf.baseline+step, buf.GetBound()-1))
+  finish = time.time()
+  return middle-start, finish-middle
+
+
+def main():
+  parser = optparse.OptionParser(usage='%prog [options]')
+  parser.add_option(
+      '--sizes', default='10000,100000,1000000',
+      help='comma-separated line counts (default %default)')
+  parser.add_option(
+      '--chunk', type='int', default=1024,
+      help='bytes per AppendRawData call (default %default)')
+  parser.add_option(
+      '--step', type='int', default=64,
+      help='lines dropped per UpdateBaseline call (default %default)')
+  option, unused_args = parser.parse_args()
+
+  print '%10s %-8s %10s %10s' % ('lines', 'buffer', 'append(s)', 'drain(s)')
+  for size in [int(s) for s in option.sizes.split(',')]:
+    chunks = MakeChunks(size, option.chunk)
+    for name, factory in [('list', ListBuffer), ('ring', linebuf.Buffer)]:
+      append, drain = Run(factory, chunks, option.step)
+      print '%10d %-8s %10.3f %10.3f' % (size, name, append, drain)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,249 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ashier: Template-based scripting for terminal interactions.
+
+Ashier is a program that serves the same purpose as expect(1): it helps
+users script terminal interactions. However, unlike expect, Ashier is
+programming language agnostic and provides a readable template language
+for terminal output matching. These features make scripted terminal
+interactions simpler to create and easier to maintain.
+
+This program benchmarks the matching pipeline.  It generates synthetic
+terminal output and reaction configurations, feeds the output in
+PTY-sized chunks through session.OutputDecoder, linebuf.Buffer, and
+session.React (which is what Ashier does for every read from the
+terminal, and with escape sequence stripping for the ansi workload),
+and reports the throughput, the latency percentiles of processing a
+chunk, and the peak memory use.  Each run happens in a separate
+process so that the peak memory figures do not interfere with each
+other.  The random seed is fixed, so runs with the same options
+process the same data.
+"""
+
+__author__ = 'cklin@google.com (Chuan-kai Lin)'
+
+import json
+import optparse
+import os
+import random
+import resource
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ashierlib import directive
+from ashierlib import linebuf
+from ashierlib import matcher
+from ashierlib import reactive
+from ashierlib import session
+from ashierlib import utils
+
+
+def RandomWord(rand, size):
+  return ''.join(rand.choice(string.ascii_lowercase) for _ in xrange(size))
+
+
+def MakeConfig(rand, count):
+  """Generate a configuration with the specified number of reactions.
+
+  Each reaction matches a status line that starts with a distinct
+  word and sends the status to the controller.
+
+  Returns:
+    A pair of the configuration lines and the distinct words.
+  """
+
+  config, words = [], []
+  for index in xrange(count):
+    word = '%s%d' % (RandomWord(rand, 6), index)
+    sample = '%s: status ok' % word
+    words.append(word)
+    config.extend(['>'+sample,
+                   '?'+' '*(len(sample)-2)+'.. status',
+                   '!controller "$status"',
+                   ''])
+  return config, words
+
+
+def ShortLines(rand, words):
+  """Generate a short line, a few of which match a reaction."""
+
+  if rand.random() < 0.01:
+    return '%s: status ok' % rand.choice(words)
+  return '%s %d' % (RandomWord(rand, 8), rand.randint(0, 99999))
+
+
+def LongLines(rand, unused_words):
+  """Generate a long line of words."""
+
+  return ' '.join(RandomWord(rand, rand.randint(1, 12)) for _ in xrange(300))
+
+
+def AnsiLines(rand, words):
+  """Generate a short line that is heavy with color escape sequences."""
+
+  line = ShortLines(rand, words)
+  return ''.join('\x1b[%dm%s\x1b[0m' % (rand.randint(30, 37), ch)
+                 for ch in line)
+
+
+WORKLOADS = {'short': ShortLines, 'long': LongLines, 'ansi': AnsiLines}
+
+# Workloads that run with the strip-ansi setting.
+STRIP_ANSI = ('ansi',)
+
+
+def MakeOutput(rand, generator, words, size, chunk_size):
+  """Generate terminal output and cut it into chunks."""
+
+  lines, total = [], 0
+  while total < size:
+    line = generator(rand, words)+'\r\n'
+    lines.append(line)
+    total += len(line)
+  text = ''.join(lines)
+  return [text[i:i+chunk_size] for i in xrange(0, len(text), chunk_size)]
+
+
+def CreateMatcher(config):
+  """Create a Matcher object from a list of configuration lines."""
+
+  directives = [directive.ParseDirective(directive.Line('bench', n+1, l))
+                for n, l in enumerate(config)]
+  nesting = []
+  reacts = [reactive.Reactive(nesting, g)
+            for g in utils.SplitNone(directives)]
+  utils.AbortOnError()
+  return matcher.Matcher(reacts)
+
+
+def Percentile(ordered, fraction):
+  return ordered[min(int(len(ordered)*fraction), len(ordered)-1)]
+
+
+def Measure(workload, templates, option):
+  """Run one benchmark and return the results as a dictionary."""
+
+  rand = random.Random(option.seed)
+  config, words = MakeConfig(rand, templates)
+  reacts = CreateMatcher(config)
+  chunks = MakeOutput(rand, WORKLOADS[workload], words,
+                      option.bytes, option.chunk)
+
+  sent = []
+  channels = {'controller': sent.append, 'terminal': sent.append}
+  decoder = session.OutputDecoder(workload in STRIP_ANSI)
+  buf = linebuf.Buffer()
+  nesting = []
+  latencies = []
+  start = time.time()
+  for chunk in chunks:
+    chunk_start = time.time()
+    buf.AppendRawData(decoder.Decode(chunk))
+    session.React(nesting, buf, reacts, channels)
+    latencies.append(time.time()-chunk_start)
+  elapsed = time.time()-start
+
+  latencies.sort()
+  size = sum(len(c) for c in chunks)
+  return {'workload': workload,
+          'templates': templates,
+          'bytes': size,
+          'chunks': len(chunks),
+          'sends': len(sent),
+          'seconds': elapsed,
+          'mb_per_second': size/elapsed/1e6,
+          'latency_us': dict(
+              ('p%d' % p, Percentile(latencies, p/100.0)*1e6)
+              for p in (50, 90, 99, 100)),
+          'peak_rss_kb': resource.getrusage(
+              resource.RUSAGE_SELF).ru_maxrss}
+
+
+def RunIsolated(workload, templates, option):
+  """Run Measure in a child process and return its results."""
+
+  read_fd, write_fd = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    os.close(read_fd)
+    os.write(write_fd, json.dumps(Measure(workload, templates, option)))
+    os._exit(0)
+  os.close(write_fd)
+  data = []
+  while True:
+    block = os.read(read_fd, 65536)
+    if not block:
+      break
+    data.append(block)
+  os.close(read_fd)
+  os.waitpid(pid, 0)
+  return json.loads(''.join(data))
+
+
+def main():
+  parser = optparse.OptionParser(usage='%prog [options]')
+  parser.add_option(
+      '--workloads', default='short,long,ansi',
+      help='comma-separated workloads from %s (default %%default)' %
+      ','.join(sorted(WORKLOADS)))
+  parser.add_option(
+      '--templates', default='1,100,1000',
+      help='comma-separated reaction counts (default %default)')
+  parser.add_option(
+      '--bytes', type='int', default=4 << 20,
+      help='bytes of terminal output per run (default %default)')
+  parser.add_option(
+      '--chunk', type='int', default=4096,
+      help='bytes per AppendRawData call (default %default)')
+  parser.add_option(
+      '--seed', type='int', default=2011,
+      help='random seed (default %default)')
+  parser.add_option(
+      '--json', metavar='FILE',
+      help='also save the results to FILE in JSON format')
+  option, unused_args = parser.parse_args()
+
+  workloads = option.workloads.split(',')
+  for workload in workloads:
+    if workload not in WORKLOADS:
+      parser.error('unknown workload: %s' % workload)
+
+  results = []
+  print '%-8s %9s %9s %9s %9s %9s %9s' % (
+      'workload', 'templates', 'MB/s', 'p50(us)', 'p90(us)', 'p99(us)',
+      'rss(KB)')
+  for workload in workloads:
+    for templates in [int(t) for t in option.templates.split(',')]:
+      result = RunIsolated(workload, templates, option)
+      results.append(result)
+      latency = result['latency_us']
+      print '%-8s %9d %9.2f %9.0f %9.0f %9.0f %9d' % (
+          workload, templates, result['mb_per_second'], latency['p50'],
+          latency['p90'], latency['p99'], result['peak_rss_kb'])
+      sys.stdout.flush()
+
+  if option.json:
+    with open(option.json, 'w') as f:
+      json.dump({'options': vars(option), 'results': results}, f,
+                indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+  main()